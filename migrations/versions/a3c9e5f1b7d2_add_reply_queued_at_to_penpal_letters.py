@@ -0,0 +1,29 @@
+"""Add reply_queued_at to penpal_letters
+
+Revision ID: a3c9e5f1b7d2
+Revises: 5b0e348cf958
+Create Date: 2026-10-17 10:12:40.218355
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e5f1b7d2'
+down_revision: Union[str, None] = '5b0e348cf958'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # penpal_letters is created by init_db() rather than by an earlier migration
+    if 'penpal_letters' in sa.inspect(op.get_bind()).get_table_names():
+        op.add_column('penpal_letters', sa.Column('reply_queued_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    if 'penpal_letters' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_column('penpal_letters', 'reply_queued_at')
@@ -0,0 +1,107 @@
+"""
+Exercise the LLM backend pool against several local stand-in servers.
+
+Starts three OpenAI-compatible stand-ins (aiohttp): a fast one, a slow one
+and a flaky one that fails every request for a while and then recovers.
+Sends rounds of concurrent completions through one LLMClient and reports,
+per round, how many requests each backend served and its circuit state -
+showing latency-weighted routing, ejection of the failing backend and its
+slow-start return.
+
+Usage:
+    python scripts/bench_llm_backends.py [--rounds 8] [--requests 60] [--outage 3]
+"""
+import sys
+import os
+import asyncio
+import argparse
+import json
+import time
+from collections import Counter
+
+# Adjust the path to correctly find the 'src' module from the 'scripts' directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+# The client reads its defaults from settings; provide dummies for required values
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+# Keep every request upstream and recovery quick enough to watch
+os.environ.setdefault("LLM_CACHE_FEATURE_TTLS", json.dumps({"default": 0}))
+os.environ.setdefault("LLM_CIRCUIT_RECOVERY_TIMEOUT", "1.0")
+os.environ.setdefault("LLM_BACKEND_SLOW_START_SECONDS", "3.0")
+os.environ.setdefault("LLM_RETRY_BASE_DELAY", "0.05")
+
+from aiohttp import web
+
+from src.shared.llm.backends import BackendPool, LLMBackend
+from src.shared.llm.client import LLMClient
+from src.shared.llm.transport import close_shared_transport
+
+
+class CompletionStandIn:
+    """Chat completions server with a fixed latency that can be made to fail"""
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+        self.failing = False
+        self.served = 0
+        self.runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await request.read()
+        await asyncio.sleep(self.latency)
+        if self.failing:
+            return web.Response(status=503, text="overloaded")
+        self.served += 1
+        return web.json_response({"choices": [{"message": {"content": f"answer from {self.name}"}}]})
+
+    async def start(self, port: int):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def main(rounds: int, requests: int, outage: int):
+    stand_ins = [
+        CompletionStandIn("fast", 0.02),
+        CompletionStandIn("slow", 0.12),
+        CompletionStandIn("flaky", 0.02)
+    ]
+    backends = []
+    for port, stand_in in enumerate(stand_ins, start=18301):
+        await stand_in.start(port)
+        backends.append(LLMBackend(stand_in.name, f"http://127.0.0.1:{port}/v1", api_key="bench"))
+    client = LLMClient(backends=BackendPool(backends))
+
+    print(f"{'round':>5} {'fast':>6} {'slow':>6} {'flaky':>6} {'fallbacks':>10}  flaky circuit")
+    try:
+        for round_index in range(rounds):
+            stand_ins[2].failing = round_index < outage
+            before = {s.name: s.served for s in stand_ins}
+            conversations = [[{"role": "user", "content": f"round {round_index} question {i}"}] for i in range(requests)]
+            responses = await asyncio.gather(*(client.generate_messages(m) for m in conversations))
+            fallbacks = Counter(not r.startswith("answer from") for r in responses)[True]
+            served = {s.name: s.served - before[s.name] for s in stand_ins}
+            state = backends[2].breaker.get_stats()["state"]
+            print(f"{round_index:>5} {served['fast']:>6} {served['slow']:>6} {served['flaky']:>6} {fallbacks:>10}  {state}")
+            await asyncio.sleep(1.0)
+    finally:
+        await close_shared_transport()
+        for stand_in in stand_ins:
+            await stand_in.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exercise LLM backend routing against local stand-ins")
+    parser.add_argument("--rounds", type=int, default=8, help="Rounds of concurrent requests")
+    parser.add_argument("--requests", type=int, default=60, help="Requests per round")
+    parser.add_argument("--outage", type=int, default=3, help="Rounds during which the flaky backend fails")
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds, args.requests, args.outage))
@@ -0,0 +1,202 @@
+"""
+Benchmark the LLM transports against local stand-in servers.
+
+Starts an HTTP/1.1 stand-in (aiohttp) and an HTTP/2 cleartext stand-in (h2)
+that both imitate a streamed chat completion, then opens 50/200/500
+concurrent streams through each transport and reports how many upstream
+connections were opened and the time-to-first-token distribution.
+
+Usage:
+    python scripts/bench_llm_transport.py [--chunks 20] [--chunk-delay 0.05]
+
+Requires the HTTP/2 extras: pip install "httpx[http2]"
+"""
+import sys
+import os
+import asyncio
+import argparse
+import json
+import time
+import statistics
+
+# Adjust the path to correctly find the 'src' module from the 'scripts' directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+# The transports read their defaults from settings; provide dummies for required values
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from aiohttp import web
+import h2.config
+import h2.connection
+import h2.events
+import h2.settings
+
+from src.shared.llm.transport import AiohttpTransport, Http2Transport
+
+CONCURRENCY_LEVELS = [50, 200, 500]
+
+
+def sse_chunk(index: int) -> bytes:
+    """One streamed completion delta in OpenAI's SSE format"""
+    payload = {"choices": [{"delta": {"content": f"token{index} "}}]}
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+class Http1StandIn:
+    """HTTP/1.1 server that streams a fake completion and counts connections"""
+    def __init__(self, chunks: int, chunk_delay: float):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.connections = set()
+        self.runner = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.connections.add(id(request.transport))
+        await request.read()
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(self.chunks):
+            await asyncio.sleep(self.chunk_delay)
+            await response.write(sse_chunk(i))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self, port: int):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class Http2StandInProtocol(asyncio.Protocol):
+    """Minimal h2c (prior knowledge) server connection streaming fake completions"""
+    def __init__(self, server: "Http2StandIn"):
+        self.server = server
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        self.transport = None
+        self.window_updated = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.server.connections += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.conn.update_settings({h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 1000})
+        self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data: bytes):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.DataReceived):
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                asyncio.ensure_future(self.respond(event.stream_id))
+            elif isinstance(event, h2.events.WindowUpdated):
+                self.window_updated.set()
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.flush()
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data and not self.transport.is_closing():
+            self.transport.write(data)
+
+    async def send(self, stream_id: int, data: bytes, end_stream: bool = False):
+        # Respect HTTP/2 flow control; the client opens the window as it reads
+        while self.conn.local_flow_control_window(stream_id) < len(data):
+            self.window_updated.clear()
+            await self.window_updated.wait()
+        self.conn.send_data(stream_id, data, end_stream=end_stream)
+        self.flush()
+
+    async def respond(self, stream_id: int):
+        self.conn.send_headers(stream_id, [(":status", "200"), ("content-type", "text/event-stream")])
+        self.flush()
+        for i in range(self.server.chunks):
+            await asyncio.sleep(self.server.chunk_delay)
+            await self.send(stream_id, sse_chunk(i))
+        await self.send(stream_id, b"data: [DONE]\n\n", end_stream=True)
+
+
+class Http2StandIn:
+    """HTTP/2 cleartext server that streams a fake completion and counts connections"""
+    def __init__(self, chunks: int, chunk_delay: float):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.connections = 0
+        self.server = None
+
+    async def start(self, port: int):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: Http2StandInProtocol(self), "127.0.0.1", port)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def time_to_first_token(transport, url: str) -> float:
+    """Open one stream and return the seconds until the first content event arrives"""
+    payload = {"model": "bench", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+    started = time.perf_counter()
+    first_token = None
+    async for chunk in transport.stream_chunks(url, {"Content-Type": "application/json"}, payload, timeout=120):
+        if first_token is None and b"data: {" in chunk:
+            first_token = time.perf_counter() - started
+    return first_token if first_token is not None else float("nan")
+
+
+async def run_level(name: str, transport, url: str, stand_in, concurrency: int):
+    """Run `concurrency` simultaneous streams and print connection and TTFT stats"""
+    if isinstance(stand_in, Http1StandIn):
+        stand_in.connections.clear()
+    else:
+        stand_in.connections = 0
+
+    started = time.perf_counter()
+    ttfts = await asyncio.gather(*(time_to_first_token(transport, url) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    connections = len(stand_in.connections) if isinstance(stand_in, Http1StandIn) else stand_in.connections
+    ttfts = sorted(t * 1000 for t in ttfts)
+    p50 = statistics.median(ttfts)
+    p99 = ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.99))]
+    print(f"{name:<8} {concurrency:>6} {connections:>12} {p50:>12.1f} {p99:>12.1f} {elapsed:>10.2f}")
+
+
+async def main(chunks: int, chunk_delay: float):
+    http1 = Http1StandIn(chunks, chunk_delay)
+    http2 = Http2StandIn(chunks, chunk_delay)
+    await http1.start(18081)
+    await http2.start(18082)
+
+    print(f"{'backend':<8} {'streams':>6} {'connections':>12} {'ttft p50 ms':>12} {'ttft p99 ms':>12} {'total s':>10}")
+    try:
+        for concurrency in CONCURRENCY_LEVELS:
+            # Fresh transports per level so connection counts aren't shared between runs
+            aiohttp_transport = AiohttpTransport(base_url="http://127.0.0.1:18081/v1")
+            http2_transport = Http2Transport(base_url="http://127.0.0.1:18082/v1", prior_knowledge=True)
+            try:
+                await run_level("aiohttp", aiohttp_transport, "http://127.0.0.1:18081/v1/chat/completions", http1, concurrency)
+                await run_level("http2", http2_transport, "http://127.0.0.1:18082/v1/chat/completions", http2, concurrency)
+            finally:
+                await aiohttp_transport.close()
+                await http2_transport.close()
+    finally:
+        await http1.stop()
+        await http2.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HTTP/1.1 vs HTTP/2 LLM transports")
+    parser.add_argument("--chunks", type=int, default=20, help="Streamed chunks per response")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between chunks")
+    args = parser.parse_args()
+    asyncio.run(main(args.chunks, args.chunk_delay))
@@ -0,0 +1,114 @@
+"""
+Microbenchmark the LLM ResponseCache against the previous dict-based cache.
+
+Replays the same skewed get/set workload (most lookups hit a small set of hot
+prompts, the rest are one-off long evaluation prompts) against both caches
+and reports throughput, hit rate and the memory they end up holding.
+
+Usage:
+    python scripts/bench_response_cache.py [--ops 200000] [--keys 50000] [--value-size 4096]
+"""
+import sys
+import os
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+# Adjust the path to correctly find the 'src' module from the 'scripts' directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+# The cache reads its defaults from settings; provide dummies for required values
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from src.shared.llm.cache import ResponseCache
+
+
+class LegacyResponseCache:
+    """The previous unbounded dict cache, kept verbatim for comparison"""
+    def __init__(self, ttl_seconds: int = 300):
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.ttl_seconds = ttl_seconds
+        self.last_cleanup = datetime.now()
+
+    def get(self, key: str) -> Optional[str]:
+        current_time = datetime.now()
+        if (current_time - self.last_cleanup).total_seconds() > 300:
+            self.cleanup()
+            self.last_cleanup = current_time
+        if key in self.cache:
+            entry = self.cache[key]
+            if (current_time - entry['timestamp']).total_seconds() < self.ttl_seconds:
+                return entry['response']
+        return None
+
+    def set(self, key: str, response: str):
+        self.cache[key] = {
+            'response': response,
+            'timestamp': datetime.now()
+        }
+
+    def cleanup(self):
+        current_time = datetime.now()
+        keys_to_delete = []
+        for key, entry in self.cache.items():
+            if (current_time - entry['timestamp']).total_seconds() > self.ttl_seconds:
+                keys_to_delete.append(key)
+        for key in keys_to_delete:
+            del self.cache[key]
+
+
+def build_workload(ops: int, keys: int, seed: int):
+    """Key sequence where 80% of lookups go to 2% of the keys"""
+    rng = random.Random(seed)
+    hot = max(1, keys // 50)
+    return [
+        f"prompt-{rng.randrange(hot) if rng.random() < 0.8 else rng.randrange(keys)}"
+        for _ in range(ops)
+    ]
+
+
+def run(name: str, cache, workload, value_size: int):
+    """Read-through replay: get, and set on miss"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    hits = 0
+    for key in workload:
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            # Distinct string per key, like a real completion
+            cache.set(key, (key + " ") * (value_size // (len(key) + 1)))
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ops_per_sec = len(workload) / elapsed
+    print(
+        f"{name:<8} {ops_per_sec:>12,.0f} {elapsed * 1e6 / len(workload):>10.2f} "
+        f"{hits / len(workload):>9.1%} {len(cache.cache):>9} {current / 1024 / 1024:>10.1f}"
+    )
+
+
+def main(ops: int, keys: int, value_size: int, max_entries: int, seed: int):
+    workload = build_workload(ops, keys, seed)
+    print(f"{ops} ops over {keys} keys, ~{value_size} byte values, LRU capped at {max_entries} entries")
+    print(f"{'cache':<8} {'ops/s':>12} {'us/op':>10} {'hit rate':>9} {'entries':>9} {'held MiB':>10}")
+    run("legacy", LegacyResponseCache(), workload, value_size)
+    run("lru", ResponseCache(max_entries=max_entries, max_bytes=256 * 1024 * 1024), workload, value_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the LLM response cache")
+    parser.add_argument("--ops", type=int, default=200_000, help="Number of get (and set on miss) operations")
+    parser.add_argument("--keys", type=int, default=50_000, help="Distinct prompts in the workload")
+    parser.add_argument("--value-size", type=int, default=4096, help="Approximate response size in bytes")
+    parser.add_argument("--max-entries", type=int, default=2048, help="Entry cap for the LRU cache")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    main(args.ops, args.keys, args.value_size, args.max_entries, args.seed)
@@ -0,0 +1,123 @@
+"""
+Microbenchmark streamed-completion parsing: SSEParser against the previous line loop.
+
+Replays recorded chat completion streams (raw SSE bodies, as sent by an
+OpenAI-compatible API) through both parsers and reports tokens parsed per
+second. The legacy loop gets the body pre-split into lines, as aiohttp's
+line iterator handed them over (the cost of that splitting, and of the
+per-line wait_for the client wrapped around it, is not counted); SSEParser
+gets it cut into network-sized chunks at arbitrary byte offsets, including
+mid-event. Both must produce the same text.
+
+Without --recording, a synthetic stream shaped like real gpt-4o-mini
+output (full chunk envelopes, one token per event) is used.
+
+Usage:
+    python scripts/bench_sse_parser.py [--recording stream.txt ...] [--tokens 400] [--repeat 200]
+"""
+import sys
+import os
+import argparse
+import json
+import random
+import time
+from typing import List
+
+# Adjust the path to correctly find the 'src' module from the 'scripts' directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.shared.llm import sse
+from src.shared.llm.sse import DONE, SSEParser, delta_content
+
+
+def legacy_parse(lines: List[bytes]) -> str:
+    """The previous per-line loop from LLMClient._stream_attempt, kept verbatim for comparison"""
+    buffer = ""
+    for line in lines:
+        line = line.decode('utf-8').strip()
+        if not line:
+            continue
+        if line == "data: [DONE]":
+            break
+        if not line.startswith("data: "):
+            continue
+        try:
+            chunk = json.loads(line[6:])
+        except json.JSONDecodeError:
+            continue
+        if 'choices' in chunk and chunk['choices']:
+            content = chunk['choices'][0].get('delta', {}).get('content', '')
+            if content:
+                buffer += content
+    return buffer
+
+
+def incremental_parse(chunks: List[bytes]) -> str:
+    """What _stream_attempt does now"""
+    parser = SSEParser()
+    parts = []
+    for chunk in chunks:
+        for payload in parser.feed(chunk):
+            if payload == DONE:
+                return "".join(parts)
+            content = delta_content(sse.loads(payload))
+            if content:
+                parts.append(content)
+    return "".join(parts)
+
+
+def synthetic_stream(tokens: int) -> bytes:
+    words = ["The", " little", " prince", " looked", " at", " the", " stars", ",", " and", " smiled", ".", " «Bonjour»", "\n"]
+    envelope = {"id": "chatcmpl-9xYz", "object": "chat.completion.chunk", "created": 1718000000, "model": "gpt-4o-mini", "system_fingerprint": "fp_0ba0d124f1"}
+    events = [{**envelope, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "logprobs": None, "finish_reason": None}]}]
+    for i in range(tokens):
+        events.append({**envelope, "choices": [{"index": 0, "delta": {"content": words[i % len(words)]}, "logprobs": None, "finish_reason": None}]})
+    events.append({**envelope, "choices": [{"index": 0, "delta": {}, "logprobs": None, "finish_reason": "stop"}]})
+    body = b"".join(f"data: {json.dumps(e)}\n\n".encode("utf-8") for e in events)
+    return body + b"data: [DONE]\n\n"
+
+
+def network_chunks(body: bytes, rng: random.Random) -> List[bytes]:
+    """Cut the body the way it arrives off a socket: uneven pieces, splitting events anywhere"""
+    chunks, pos = [], 0
+    while pos < len(body):
+        size = rng.randint(40, 1400)
+        chunks.append(body[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def bench(name: str, fn, inputs, repeat: int, tokens: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            fn(item)
+    elapsed = time.perf_counter() - started
+    rate = tokens * repeat / elapsed
+    print(f"{name:<34} {elapsed:>8.3f}s  {rate:>12,.0f} tokens/s")
+    return rate
+
+
+def main(recordings: List[str], tokens: int, repeat: int):
+    bodies = [open(path, "rb").read() for path in recordings] or [synthetic_stream(tokens)]
+    rng = random.Random(7)
+    line_inputs = [body.splitlines(keepends=True) for body in bodies]
+    chunk_inputs = [network_chunks(body, rng) for body in bodies]
+    for lines, chunks in zip(line_inputs, chunk_inputs):
+        assert legacy_parse(lines) == incremental_parse(chunks), "parsers disagree"
+    total_tokens = sum(body.count(b"\n\ndata: ") for body in bodies)
+
+    print(f"{len(bodies)} stream(s), {total_tokens} events, {repeat} repeats")
+    legacy = bench("legacy line loop (json)", legacy_parse, line_inputs, repeat, total_tokens)
+    fast = bench("SSEParser (orjson)", incremental_parse, chunk_inputs, repeat, total_tokens)
+    print(f"{'':<34} {fast / legacy:>8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark SSE parsing of streamed completions")
+    parser.add_argument("--recording", action="append", default=[], help="Raw SSE body of a recorded stream (repeatable)")
+    parser.add_argument("--tokens", type=int, default=400, help="Tokens in the synthetic stream")
+    parser.add_argument("--repeat", type=int, default=200, help="Times to parse each stream")
+    args = parser.parse_args()
+    main(args.recording, args.tokens, args.repeat)
@@ -0,0 +1,132 @@
+"""
+Re-evaluate every journey response to a question set on the LLM batch lane.
+
+A question set is the questions of one character and language level in
+JOURNEY_QUESTIONS, or an explicit list of question ids. Every response is
+queued on LLMClient's batch lane up front, so they fill as few batches as
+possible; each new score and feedback is stored as soon as its batch
+completes, with at most --concurrency writes at once. Results still missing
+after --timeout seconds are given up on. LLM_BATCH_ENDPOINT picks the
+provider's Batch API ("openai") or the in-process stand-in ("local").
+
+Usage:
+    python scripts/rescore_journey_responses.py --character 101 --level A1 [--concurrency 50]
+    python scripts/rescore_journey_responses.py --questions q1,q2 [--timeout 3600] [--dry-run]
+"""
+import sys
+import os
+import asyncio
+import argparse
+import logging
+import time
+from typing import List, Optional
+
+# Adjust the path to correctly find the 'src' module from the 'scripts' directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from src.core.db import SessionLocal
+# Every model, so the relationships between them resolve
+from src.features.auth.models import User
+from src.shared.message_processing.models import MessageProcessing
+from src.features.sandbox.models import SandboxSession, SandboxMessage
+from src.features.story_mode.models import StorySession, StoryMessage, StoryHint
+from src.features.journey.models import JourneyResponse
+from src.features.journey.questions import JOURNEY_QUESTIONS
+from src.features.journey.service import JourneyService
+from src.shared.llm.client import LLMClient
+from src.shared.llm.transport import close_shared_transport
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+def question_set(character: Optional[str], level: Optional[str], question_ids: Optional[str]) -> List[str]:
+    """Ids of the questions selected on the command line"""
+    if question_ids:
+        return [q.strip() for q in question_ids.split(",") if q.strip()]
+    return [
+        q["id"] for q in JOURNEY_QUESTIONS
+        if (character is None or q["character_id"] == character)
+        and (level is None or q["language_level"].upper() == level.upper())
+    ]
+
+async def load_responses(question_ids: List[str]) -> List[JourneyResponse]:
+    """Every response to the questions, oldest first, with its session loaded"""
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(JourneyResponse)
+            .options(selectinload(JourneyResponse.session))
+            .where(JourneyResponse.question_id.in_(question_ids))
+            .order_by(JourneyResponse.created_at)
+        )
+        return list(result.scalars().all())
+
+async def rescore(args):
+    question_ids = question_set(args.character, args.level, args.questions)
+    if not question_ids:
+        logger.error("No questions match the given character/level")
+        return
+    responses = await load_responses(question_ids)
+    logger.info(f"{len(responses)} responses to {len(question_ids)} questions")
+    if args.dry_run or not responses:
+        return
+
+    llm_client = LLMClient()
+    service = JourneyService(llm_client)
+    store_limit = asyncio.Semaphore(args.concurrency)
+    started = time.monotonic()
+    pending: List[asyncio.Future] = []
+
+    try:
+        for response in responses:
+            try:
+                pending.append(await service.queue_reevaluation(response, store_limit))
+            except ValueError as e:
+                logger.error(f"Skipping response {response.id}: {e}")
+        logger.info(f"{len(pending)} responses queued")
+
+        finished = 0
+        remaining = set(pending)
+        while remaining:
+            left = args.timeout - (time.monotonic() - started)
+            if left <= 0:
+                logger.error(f"Gave up on {len(remaining)} results after {args.timeout:.0f}s")
+                break
+            done, remaining = await asyncio.wait(remaining, timeout=min(left, 60.0))
+            finished += len(done)
+            logger.info(f"{finished}/{len(pending)} re-evaluated")
+    finally:
+        # Closing the lane resolves the futures still waiting to None
+        await llm_client.close()
+        await close_shared_transport()
+
+    rescored = [f.result() for f in pending if f.done() and f.result() is not None]
+    print("\n" + "=" * 60)
+    print(f"Re-evaluated {len(rescored)}/{len(responses)} responses in {time.monotonic() - started:.1f}s")
+    if rescored:
+        print(f"Mean score: {sum(rescored) / len(rescored):.2f}")
+    print(f"Batch lane: {llm_client.batch.get_stats()}")
+    print("=" * 60 + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-evaluate journey responses on the LLM batch lane")
+    parser.add_argument("--character", help="Character id of the question set, e.g. 101")
+    parser.add_argument("--level", help="Language level of the question set, e.g. A1")
+    parser.add_argument("--questions", help="Comma-separated question ids, instead of --character/--level")
+    parser.add_argument("--concurrency", type=int, default=50, help="Results written to the database at once")
+    parser.add_argument("--timeout", type=float, default=25 * 3600, help="Seconds to wait for results (default: the 24h batch window and an hour)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the responses")
+    args = parser.parse_args()
+    if not (args.questions or args.character or args.level):
+        parser.error("give --character/--level or --questions")
+    asyncio.run(rescore(args))
+
+if __name__ == "__main__":
+    main()
@@ -32,9 +32,102 @@ class BaseConfig(BaseSettings):
     MODEL_NAME: str = "gpt-4o-mini"
     MAX_TOKENS: int = 500
     TEMPERATURE: float = 0.5
-    
+    LLM_API_BASE_URL: str = "https://api.openai.com/v1"
+    LLM_REQUEST_TIMEOUT: float = 10.0  # Seconds per non-streaming call unless its route says otherwise
+    # Per-feature routing, e.g. {"hints": {"model": "gpt-4o-mini", "timeout": 4, "fallback_model": "gpt-3.5-turbo"}};
+    # unlisted features use MODEL_NAME
+    LLM_MODEL_ROUTES: Dict[str, Dict[str, Any]] = {}
+    # Per-profile overrides of max_tokens/temperature/top_p/stop/response_format, e.g. {"hints": {"max_tokens": 90}};
+    # unknown names define new profiles
+    LLM_GENERATION_PROFILES: Dict[str, Dict[str, Any]] = {}
+
+    # LLM HTTP transport (shared connection pool)
+    LLM_TRANSPORT: str = "aiohttp"  # "aiohttp" (HTTP/1.1) or "http2"
+    LLM_HTTP2_MAX_CONNECTIONS: int = 4
+    LLM_POOL_LIMIT: int = 100
+    LLM_POOL_LIMIT_PER_HOST: int = 50
+    LLM_KEEPALIVE_TIMEOUT: float = 60.0
+    LLM_DNS_CACHE_TTL: int = 300
+    LLM_PREWARM_CONNECTIONS: int = 4
+
+    # LLM backend pool (OpenAI-compatible endpoints/keys, each with its own quota)
+    # JSON list of {"name", "base_url", "api_key", "weight", "requests_per_minute", "tokens_per_minute"};
+    # empty means a single backend at LLM_API_BASE_URL with OPENAI_API_KEY
+    LLM_BACKENDS: List[Dict[str, Any]] = []
+    LLM_BACKEND_SLOW_START_SECONDS: float = 30.0  # Ramp-up after a backend's circuit closes again
+
+    # LLM rate limiting (mirrors the upstream per-minute request and token quotas)
+    LLM_REQUESTS_PER_MINUTE: int = 500
+    LLM_TOKENS_PER_MINUTE: int = 200000
+    LLM_RATE_LIMIT_MAX_WAIT: float = 10.0  # Seconds a call may queue before failing
+    LLM_RATE_LIMITER_BACKEND: str = "local"  # "local" (per process) or "redis" (cluster-wide)
+    LLM_RATE_LIMIT_KEY_PREFIX: str = "llm:ratelimit"
+    # Share of the cluster budget each worker uses locally when Redis is down; unset means 1 / WEB_CONCURRENCY
+    LLM_RATE_LIMIT_FALLBACK_SHARE: Optional[float] = None
+    WEB_CONCURRENCY: int = 1  # Worker processes sharing the LLM quota (uvicorn's default --workers reads it too)
+
+    # LLM scheduling
+    LLM_SCHEDULER_CONCURRENCY: int = 64  # Upstream calls in flight per process before fair queuing kicks in
+    LLM_CONCURRENCY_INITIAL_LIMIT: int = 20  # Adaptive in-flight window at startup
+    LLM_CONCURRENCY_MIN_LIMIT: int = 2
+    LLM_CONCURRENCY_MAX_LIMIT: int = 200
+    LLM_CONCURRENCY_MAX_WAIT: float = 5.0  # Seconds to wait for a slot before falling back
+    LLM_CONCURRENCY_LATENCY_TOLERANCE: float = 2.0  # Shrink once latency exceeds this multiple of the baseline
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0  # Hedge calls slower than this latency percentile of their feature
+    LLM_HEDGE_BUDGET_RATIO: float = 0.1  # Hedges allowed per call (capped at 1.0)
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Latency samples needed before a feature is hedged
+    LLM_RETRY_BASE_DELAY: float = 0.5  # Exponential backoff base; each retry sleeps up to base * 2^attempt (full jitter)
+    LLM_RETRY_MAX_DELAY: float = 4.0  # Backoff cap; a longer Retry-After fails to the fallback instead of waiting
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive timeouts/429s/5xx that open an endpoint's circuit
+    LLM_CIRCUIT_RECOVERY_TIMEOUT: float = 10.0  # Seconds open before half-open probing; doubles on each failed probe
+    LLM_CIRCUIT_MAX_RECOVERY_TIMEOUT: float = 120.0
+    LLM_CIRCUIT_HALF_OPEN_PROBES: int = 1  # Calls let through at once while half-open
+
+    # LLM streaming
+    LLM_STREAM_FIRST_TOKEN_TIMEOUT: float = 4.0  # Seconds to wait for the first line before retrying
+    LLM_STREAM_IDLE_TIMEOUT: float = 10.0  # Longest allowed gap between lines once the stream has started
+    LLM_STREAM_TOTAL_TIMEOUT: float = 120.0  # Hard cap on a whole streamed completion
+    LLM_STREAM_RETRY_ATTEMPTS: int = 2  # Transparent retries before any content has been yielded
+    LLM_STREAM_INCLUDE_USAGE: bool = True  # Ask streams for a final usage chunk (stream_options.include_usage)
+
+    # LLM token budgets
+    LLM_SESSION_TOKEN_BUDGETS: Dict[str, int] = {}  # Tokens per session, per feature or "*" for all, e.g. {"hints": 5000, "*": 150000}
+    LLM_BUDGET_OPTIONAL_FEATURES: List[str] = ["hints"]  # Skipped once a session has used LLM_BUDGET_DEGRADE_AT of its "*" budget
+    LLM_BUDGET_DEGRADE_AT: float = 0.8
+
+    # LLM response cache
+    LLM_CACHE_TTL_SECONDS: float = 300.0
+    LLM_CACHE_MAX_ENTRIES: int = 2048
+    LLM_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # Approximate in-memory footprint per client
+    LLM_CACHE_BACKEND: str = "local"  # "local" (per process) or "redis" (shared L2 behind the in-process cache)
+    LLM_CACHE_KEY_PREFIX: str = "llm:cache"
+    LLM_CACHE_FEATURE_TTLS: Dict[str, float] = {"hints": 900.0, "journey_evaluation": 3600.0}  # Seconds; 0 disables caching
+    LLM_STREAM_REPLAY_PACING: float = 0.0  # 0 replays cached streams at once; 1.0 reproduces the recorded chunk gaps
+    LLM_SIMILARITY_CACHE_FEATURES: List[str] = ["hints"]  # Features that may reuse answers to near-duplicate text
+    LLM_SIMILARITY_THRESHOLD: float = 0.8  # Minimum estimated Jaccard similarity for a near-duplicate hit
+    LLM_SIMILARITY_CACHE_MAX_ENTRIES: int = 4096
+    LLM_SIMILARITY_CACHE_TTL_SECONDS: float = 3600.0
+
+    # LLM batch lane (non-interactive work submitted as JSONL batches)
+    LLM_BATCH_ENDPOINT: str = "local"  # "local" (runs batches in-process, background lane) or "openai" (/files + /batches)
+    LLM_BATCH_MAX_REQUESTS: int = 500  # Requests per batch; a full batch is submitted at once
+    LLM_BATCH_MAX_WAIT: float = 5.0  # Seconds a request waits for its batch to fill
+    LLM_BATCH_POLL_INTERVAL: float = 30.0  # Seconds between status polls of the provider's batches
+    LLM_BATCH_COMPLETION_WINDOW: str = "24h"
+    LLM_BATCH_LOCAL_CONCURRENCY: int = 4  # Lines of local batches in flight at once
+
+    # Penpal replies (queued on the LLM batch lane)
+    PENPAL_REPLY_SWEEP_INTERVAL: float = 300.0  # Seconds between sweeps that queue replies again for unanswered letters
+    PENPAL_REPLY_RETRY_AFTER: float = 900.0  # Least time a queued reply claims its letter before a sweep queues it again; the batch endpoint's completion window if longer
+
+    # Request deadlines (bound LLM timeouts/retries and DB statement timeouts of the work a message starts)
+    WS_MESSAGE_DEADLINES: Dict[str, float] = {"journey": 45.0, "story_mode": 60.0, "sandbox": 20.0}  # Seconds per WebSocket message; 0 disables
+    DB_STATEMENT_TIMEOUT_FLOOR_MS: int = 1000  # Least statement_timeout under a deadline, so saving finished work still goes through
+
     # Redis
     REDIS_URL: str
+    REDIS_SOCKET_TIMEOUT: float = 1.0
 
     @property
     def ASYNC_DATABASE_URL(self) -> str:
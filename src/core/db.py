@@ -1,6 +1,8 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from .config import settings
+from .deadline import current_deadline, deadline_stats
 import logging
 from urllib.parse import urlparse, parse_qs
 import ssl
@@ -52,6 +54,25 @@ engine = create_async_engine(
     pool_recycle=3600,
 )
 
+# PostgreSQL's SQLSTATE for a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+@event.listens_for(Session, "after_begin")
+def _apply_deadline(session, transaction, connection):
+    """Cap the statements of a transaction begun under a request deadline at the time left"""
+    # Async sessions run this in a greenlet that shares the calling task's context
+    deadline = current_deadline()
+    if deadline is None or connection.dialect.name != "postgresql":
+        return
+    # Never below the floor: saving work that is already done is worth a little overrun
+    timeout_ms = max(int(deadline.remaining() * 1000), settings.DB_STATEMENT_TIMEOUT_FLOOR_MS)
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _count_deadline_cancellations(context):
+    if current_deadline() is not None and getattr(context.original_exception, "sqlstate", None) == QUERY_CANCELED:
+        deadline_stats.expire("db")
+
 # Create async session factory
 SessionLocal = sessionmaker(
     class_=AsyncSession,
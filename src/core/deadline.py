@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+import time
+
+class DeadlineExceededError(Exception):
+    """
+    Raised when the current deadline leaves no time for a stage.
+
+    Deliberately not a TimeoutError: running out of our own time says
+    nothing about the health of the provider or the database, so circuit
+    breakers and concurrency limiters must not count it against them.
+    """
+    def __init__(self, message: str, stage: str):
+        super().__init__(message)
+        self.stage = stage
+
+class DeadlineStats:
+    """Counts the stages that ended for lack of time, by stage name"""
+    def __init__(self):
+        # Stages never started because too little time was left
+        self.skipped: Dict[str, int] = {}
+        # Stages started but cut off when the deadline passed
+        self.expired: Dict[str, int] = {}
+
+    def skip(self, stage: str) -> None:
+        self.skipped[stage] = self.skipped.get(stage, 0) + 1
+
+    def expire(self, stage: str) -> None:
+        self.expired[stage] = self.expired.get(stage, 0) + 1
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {"skipped": dict(self.skipped), "expired": dict(self.expired)}
+
+deadline_stats = DeadlineStats()
+
+@dataclass(frozen=True)
+class Deadline:
+    """The (monotonic) time by which the client expects its answer"""
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def budget(self, stage: str, timeout: Optional[float] = None, needed: float = 0.0) -> float:
+        """
+        The timeout for a stage about to start: `timeout` cut to the time left.
+
+        Raises DeadlineExceededError, counted as a skip, when the deadline has
+        passed or leaves less than `needed` seconds (e.g. the stage's usual
+        latency), so the stage is never started.
+        """
+        remaining = self.remaining()
+        if remaining <= 0 or remaining < needed:
+            deadline_stats.skip(stage)
+            raise DeadlineExceededError(
+                f"{stage}: {max(remaining, 0.0):.2f}s left before the deadline, needs {needed:.2f}s",
+                stage,
+            )
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def expired(self, stage: str) -> DeadlineExceededError:
+        """Count `stage` as cut off by the deadline and return the error to raise"""
+        deadline_stats.expire(stage)
+        return DeadlineExceededError(f"{stage}: cut off by the deadline", stage)
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline bound to the current context, if any"""
+    return _deadline.get()
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Bind a deadline `seconds` from now to the block (None or 0: no deadline).
+
+    Tasks created inside the block copy the context and keep the deadline,
+    so an endpoint wraps the create_task of each message it handles. An
+    enclosing deadline that expires sooner stays in force.
+    """
+    outer = _deadline.get()
+    if not seconds or seconds <= 0:
+        yield outer
+        return
+    deadline = Deadline.after(seconds)
+    if outer is not None and outer.expires_at <= deadline.expires_at:
+        deadline = outer
+    bound = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(bound)
+
+def budget(stage: str, timeout: Optional[float] = None, needed: float = 0.0) -> Optional[float]:
+    """Deadline.budget() for the current deadline; without one, `timeout` unchanged"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    return deadline.budget(stage, timeout, needed)
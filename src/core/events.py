@@ -1,10 +1,11 @@
+import asyncio
 import logging
 from typing import Callable
 from fastapi import FastAPI
 
 from src.shared.llm.client import LLMClient
-# Redis service import path may have changed in the feature-based structure
-# from src.shared.redis.service import RedisService
+from src.shared.llm.transport import start_shared_transports, close_shared_transport
+from src.shared.redis import get_redis_service, close_redis_service
 from src.core.db import init_db
 
 logger = logging.getLogger(__name__)
@@ -19,20 +20,31 @@ def create_start_app_handler(app: FastAPI) -> Callable:
         # Initialize database
         await init_db()
         
-        # Initialize and store Redis service
-        # Redis service initialization commented out until correct import path is determined
-        # app.state.redis_service = RedisService()
-        # logger.info("Redis service initialized")
+        # Initialize and store Redis service (shared by the cluster-wide LLM rate limiter)
+        app.state.redis_service = get_redis_service()
+        if await app.state.redis_service.ping():
+            logger.info("Redis service initialized")
+        else:
+            logger.warning("Redis is unreachable; Redis-backed features will use local fallbacks")
         
-        # Initialize and store LLM client
+        # Initialize and store LLM client (one shared transport per backend endpoint)
         app.state.llm_client = LLMClient()
         logger.info("LLM client initialized")
         
+        # Open the shared LLM connection pools and prewarm them before traffic arrives
+        await start_shared_transports()
+        logger.info("LLM transports initialized")
+        
         # Initialize and store Message Processing Service
         from src.shared.message_processing.service import MessageProcessingService
         app.state.message_processor = MessageProcessingService(app.state.llm_client)
         logger.info("Message processing service initialized")
         
+        # Queue replies again for penpal letters whose batch was lost, e.g. by a restart
+        from src.features.penpal.service import sweep_unanswered_letters
+        app.state.penpal_sweeper = asyncio.create_task(sweep_unanswered_letters(app.state.llm_client))
+        logger.info("Penpal reply sweeper started")
+        
         logger.info("Application startup complete")
     
     return start_app
@@ -45,11 +57,24 @@ def create_stop_app_handler(app: FastAPI) -> Callable:
     async def stop_app() -> None:
         logger.info("Shutting down application services")
         
+        # Stop the penpal sweeper before the batch lane it queues on closes
+        sweeper = getattr(app.state, "penpal_sweeper", None)
+        if sweeper is not None:
+            sweeper.cancel()
+            await asyncio.gather(sweeper, return_exceptions=True)
+        
         # Clean up LLM client
         if hasattr(app.state, "llm_client") and app.state.llm_client:
             await app.state.llm_client.close()
             logger.info("LLM client closed")
         
+        # Close the shared connection pool last so in-flight clients can finish
+        await close_shared_transport()
+        logger.info("LLM transports closed")
+        
+        await close_redis_service()
+        logger.info("Redis service closed")
+        
         logger.info("Application shutdown complete")
     
     return stop_app
\ No newline at end of file
@@ -99,4 +99,12 @@ async def get_current_active_user(current_user = Depends(get_current_user)):
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user account"
         )
-    return current_user
\ No newline at end of file
+    return current_user
+async def require_admin(current_user = Depends(get_current_active_user)):
+    """Admin-only access (role "admin"), e.g. for operational views naming users"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can access this resource"
+        )
+    return current_user
@@ -2,6 +2,7 @@ from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import random
 import logging
 import asyncio
+import contextlib
 import json
 from datetime import datetime
 from sqlalchemy import select, and_, func
@@ -10,12 +11,27 @@ from uuid import uuid4
 from sqlalchemy.orm import selectinload
 import os
 
+from src.core.db import SessionLocal
 from src.features.journey.models import JourneySession, JourneyResponse
 from src.features.journey.questions import JOURNEY_QUESTIONS
+from src.shared.llm.batch import BatchResult
 from src.shared.llm.client import LLMClient
+from src.shared.llm.similarity_cache import SimilarityKey
+from src.shared.llm.exceptions import ResponseParsingError
+from src.shared.llm.structured import JOURNEY_EVALUATION, parse_json_object
+from src.shared.llm.json_stream import JsonObjectStream, JsonStreamEvent, FieldDone, TextDelta
 
 logger = logging.getLogger(__name__)
 
+def _as_score(value: Any) -> Optional[float]:
+    """The model's score as a float, or None if it wrote something that isn't one"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 class JourneyService:
     def __init__(self, llm_client: LLMClient):
         self.llm_client = llm_client
@@ -223,10 +239,14 @@ class JourneyService:
         
         prompt_messages = [{"role": "user", "content": prompt_string}]
         
-        prompt_json_string = json.dumps(prompt_messages)
-        
         try:
-            evaluation = await self.llm_client.generate(prompt_json_string, expect_json=True)
+            # Near-identical answers to the same question at the same level can share an evaluation
+            # (only when journey_evaluation is in LLM_SIMILARITY_CACHE_FEATURES)
+            similarity_key = SimilarityKey(
+                scope=f"journey:{session_character_id}:{session_language_level}:{response.question_id}",
+                text=user_response_text or ""
+            )
+            evaluation = await self.llm_client.generate_messages(prompt_messages, expect_json=True, feature="journey_evaluation", similarity_key=similarity_key, profile="journey_evaluation")
             
             score = float(evaluation.get("score", 0))
             feedback = evaluation.get("feedback", "No feedback provided.")
@@ -248,6 +268,64 @@ class JourneyService:
             
             return 5.0, "Evaluation error: " + str(e), response_data
     
+    async def queue_reevaluation(
+        self,
+        response: JourneyResponse,
+        store_limit: Optional[asyncio.Semaphore] = None
+    ) -> asyncio.Future:
+        """
+        Queue `response` (with its session loaded) for evaluation again on the LLM batch lane.
+
+        The new score and feedback are stored when the batch completes, at
+        most `store_limit` writes at a time. The returned future resolves to
+        the score; None means the evaluation failed or the lane closed first,
+        and the stored one was kept.
+        """
+        question_details = self.questions_dict.get(response.question_id)
+        if not question_details:
+            raise ValueError(f"Question {response.question_id} not found in questions_dict")
+        prompt_string = await self._load_and_format_evaluation_prompt(
+            character_id=response.session.character_id,
+            language_level=response.session.language_level,
+            question_details=question_details,
+            user_response=response.user_response
+        )
+        if prompt_string.startswith("Error:"):
+            raise ValueError(prompt_string)
+
+        response_id = response.id
+        done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        async def store(result: BatchResult):
+            score = None
+            try:
+                if not result.ok:
+                    raise ValueError(result.error)
+                evaluation = parse_json_object(result.content, JOURNEY_EVALUATION)
+                score = float(evaluation.get("score", 0))
+                async with store_limit or contextlib.nullcontext():
+                    async with SessionLocal() as db:
+                        stored = await db.get(JourneyResponse, response_id)
+                        if stored is not None:
+                            stored.score = score
+                            stored.feedback = evaluation.get("feedback", "No feedback provided.")
+                            stored.evaluated_at = datetime.now()
+                            await db.commit()
+            except Exception as e:
+                logger.error(f"Re-evaluating response {response_id} failed: {e}")
+                score = None
+            finally:
+                if not done.done():
+                    done.set_result(score)
+
+        await self.llm_client.submit_batch(
+            [{"role": "user", "content": prompt_string}],
+            store,
+            feature="journey_evaluation",
+            profile="journey_evaluation"
+        )
+        return done
+
     async def get_response_info(self, db: AsyncSession, response_id: str) -> Optional[Dict[str, Any]]:
         """Get basic information about a response"""
         stmt = select(JourneyResponse).where(JourneyResponse.id == response_id)
@@ -264,9 +342,14 @@ class JourneyService:
             "attempt": response.attempt
         }
     
-    async def evaluate_response_streaming(self, db: AsyncSession, response_id: str) -> AsyncIterator[str]:
+    async def evaluate_response_streaming(self, db: AsyncSession, response_id: str) -> AsyncIterator[JsonStreamEvent]:
         """
         Evaluate user response using LLM with streaming, adapting prompt based on character/language_level.
+
+        Yields FieldDone("score", float) as soon as the model has written the
+        score, and TextDelta("feedback", text) with the decoded feedback prose
+        as it arrives, never the JSON around it. A reply that is not JSON is
+        passed through as feedback text.
         """
         stmt = select(JourneyResponse).options(selectinload(JourneyResponse.session)).where(JourneyResponse.id == response_id)
         result = await db.execute(stmt)
@@ -296,7 +379,7 @@ class JourneyService:
         
         if prompt_string.startswith("Error:"):
             logger.error(f"Failed to load/format prompt for streaming response {response_id}: {prompt_string}")
-            yield prompt_string 
+            yield TextDelta("feedback", prompt_string)
             response.score = 5.0
             response.feedback = prompt_string 
             response.evaluated_at = datetime.now()
@@ -305,24 +388,54 @@ class JourneyService:
         
         prompt_messages = [{"role": "user", "content": prompt_string}]
 
-        prompt_json_string = json.dumps(prompt_messages)
-
-        full_response = ""
+        parser: Optional[JsonObjectStream] = JsonObjectStream(stream_fields=("feedback",))
+        # Raw completion text, kept for when the model's reply turns out not to be JSON
+        raw_parts: List[str] = []
+        feedback_parts: List[str] = []
+        passthrough = False
         score = 5.0  
         feedback = ""  
         
         try:
-            async for chunk in self.llm_client.stream_generate(prompt_json_string):
-                full_response += chunk
-                yield chunk
+            async for chunk in self.llm_client.stream_messages(prompt_messages, feature="journey_evaluation", profile="journey_evaluation"):
+                raw_parts.append(chunk)
+                if parser is None:
+                    if passthrough:
+                        yield TextDelta("feedback", chunk)
+                    continue
+                try:
+                    events = parser.feed(chunk)
+                except ResponseParsingError as e:
+                    logger.warning(f"Evaluation stream for {response_id} is not the expected JSON: {e}")
+                    parser = None
+                    if not feedback_parts:
+                        # Plain prose instead of JSON: the reply itself is the feedback
+                        passthrough = True
+                        yield TextDelta("feedback", "".join(raw_parts))
+                    continue
+                for event in events:
+                    if isinstance(event, TextDelta):
+                        feedback_parts.append(event.text)
+                        yield event
+                    elif event.key == "score":
+                        early_score = _as_score(event.value)
+                        if early_score is not None:
+                            score = early_score
+                            yield FieldDone("score", score)
                 
+            full_response = "".join(raw_parts)
             try:
-                evaluation = json.loads(full_response)
-                score = float(evaluation.get("score", 5.0))
+                if parser is None:
+                    raise ResponseParsingError("Evaluation stream is not JSON", raw=full_response)
+                evaluation = parser.close()
+                final_score = _as_score(evaluation.get("score"))
+                if final_score is not None:
+                    score = final_score
                 feedback = evaluation.get("feedback", "No feedback provided.")
-            except json.JSONDecodeError:
+            except ResponseParsingError:
                 logger.warning(f"Could not parse LLM JSON response for {response_id}: {full_response}")
-                feedback = full_response 
+                # Keep the prose that was already shown if the object broke off after it
+                feedback = "".join(feedback_parts) or full_response
                 
             response.score = score
             response.feedback = feedback
@@ -330,11 +443,11 @@ class JourneyService:
             await db.commit()
                 
         except Exception as e:
+            # Stream failures are raised, not streamed; the final evaluation message carries the fallback
             logger.error(f"Error in streaming evaluation for response {response_id}: {str(e)}")
-            yield f"Evaluation error: {str(e)}" 
             
             response.score = score 
-            response.feedback = feedback if feedback else f"Evaluation error: {str(e)}"
+            response.feedback = feedback if feedback else "I was unable to fully evaluate your response due to a technical issue. Your answer receives a neutral score of 5/10."
             response.evaluated_at = datetime.now()
             await db.commit()
     
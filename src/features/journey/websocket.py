@@ -1,22 +1,27 @@
 from fastapi import WebSocket, WebSocketDisconnect, Depends
 import json
 import logging
-from typing import Dict, Set, Any
+from typing import Dict, Set, Any, Optional
 import asyncio
 import traceback
 from datetime import datetime
 import sqlalchemy.exc
 
 from src.features.journey.service import JourneyService
+from src.core.config import settings
 from src.core.db import get_db, SessionLocal
+from src.core.deadline import deadline_scope
 from src.shared.llm.client import LLMClient
+from src.shared.llm.json_stream import FieldDone
+from src.shared.llm.context import bind_llm_context
+from src.shared.llm.cancellation import CancellationToken, SUPERSEDED, DISCONNECTED
 from src.shared.dependencies import get_message_processor
 from src.shared.message_processing.service import MessageProcessingService
 from src.shared.websockets.manager import connection_manager
 
 logger = logging.getLogger(__name__)
 
-async def process_websocket_message(websocket: WebSocket, session_id: str, user_id: str, message: Dict[str, Any], llm_client: LLMClient, message_processor: MessageProcessingService):
+async def process_websocket_message(websocket: WebSocket, session_id: str, user_id: str, message: Dict[str, Any], llm_client: LLMClient, message_processor: MessageProcessingService, cancel: CancellationToken):
     """
     Process a single WebSocket message with its own database session.
     
@@ -43,6 +48,8 @@ async def process_websocket_message(websocket: WebSocket, session_id: str, user_
     - message: The WebSocket message to process
     - llm_client: The LLM client for generating evaluations
     - message_processor: Service for content moderation and grammar checking
+    - cancel: Cancelled when a newer response supersedes this one or the client
+      disconnects; stops the evaluation (and its LLM call) and what follows it
     """
     msg_type = message.get("type")
     
@@ -142,14 +149,15 @@ async def process_websocket_message(websocket: WebSocket, session_id: str, user_
                 if response_data:
                     try:
                         logger.info(f"Starting evaluation with original text for message {message_id}")
-                        evaluation_result = await evaluate_response_in_session(
-                            journey_service,
-                            response_data,
-                            session_id,
-                            user_id,
-                            should_stream,
-                            websocket
-                        )
+                        with cancel.guard():
+                            evaluation_result = await evaluate_response_in_session(
+                                journey_service,
+                                response_data,
+                                session_id,
+                                user_id,
+                                should_stream,
+                                websocket
+                            )
                     except Exception as eval_error:
                         logger.error(f"Error evaluating response: {str(eval_error)}")
                         logger.exception("Evaluation error details:")
@@ -364,14 +372,26 @@ async def stream_evaluation(db, journey_service, session_id, user_id, response_i
         
         # Stream evaluation chunks - this combines database and WebSocket operations
         # but in a controlled way where each chunk is processed completely before the next
-        async for chunk in journey_service.evaluate_response_streaming(db, response_id):
-            # Send each chunk to the client - WebSocket operation
+        async for event in journey_service.evaluate_response_streaming(db, response_id):
+            if isinstance(event, FieldDone):
+                # The score is known before the feedback is written; show it straight away
+                await websocket.send_text(json.dumps({
+                    "type": "evaluation_score",
+                    "data": {
+                        "response_id": response_id,
+                        "question_id": response_info["question_id"],
+                        "score": event.value,
+                        "is_final": False
+                    }
+                }))
+                continue
+            # Send each piece of feedback prose to the client - WebSocket operation
             await websocket.send_text(json.dumps({
                 "type": "evaluation_chunk",
                 "data": {
                     "response_id": response_id,
                     "question_id": response_info["question_id"],
-                    "chunk": chunk,
+                    "chunk": event.text,
                     "is_final": False
                 }
             }))
@@ -413,6 +433,12 @@ async def stream_evaluation(db, journey_service, session_id, user_id, response_i
         # Re-raise the exception so the caller knows something went wrong
         raise
 
+async def process_in_order(previous: Optional[asyncio.Task], *args):
+    """Process a message once the one received before it is done, so replies keep their order"""
+    if previous is not None:
+        await asyncio.wait([previous])
+    await process_websocket_message(*args)
+
 async def journey_websocket_endpoint(
     websocket: WebSocket,
     session_id: str,
@@ -433,22 +459,48 @@ async def journey_websocket_endpoint(
             await websocket.close(code=1008, reason="Invalid authentication")
             return
             
+        # Every LLM call (and task) spawned by this connection is scheduled as this user
+        bind_llm_context(user_id=user_id, session_id=session_id)
         await connection_manager.connect(websocket, session_id, user_id)
         logger.info(f"WebSocket connected: user {user_id} for session {session_id}")
         
+        # Messages are processed one after another in the background, so a
+        # disconnect or a newer response is noticed while an evaluation runs
+        connection_cancel = CancellationToken()
+        # The token of the latest submitted response, whose evaluation a newer one supersedes
+        response_cancel: Optional[CancellationToken] = None
+        last_task: Optional[asyncio.Task] = None
+        pending_tasks = set()
         try:
             while True:
                 data = await websocket.receive_text()
                 message = json.loads(data)
                 
-                # Process message using shared clients
-                await process_websocket_message(websocket, session_id, str(user_id), message, llm_client, message_processor)
+                cancel = CancellationToken(parent=connection_cancel)
+                if message.get("type") == "submit_response":
+                    if response_cancel is not None:
+                        response_cancel.cancel(SUPERSEDED)
+                    response_cancel = cancel
+                
+                # Process message using shared clients; the deadline runs from
+                # receipt, so waiting behind the previous message counts against it
+                with deadline_scope(settings.WS_MESSAGE_DEADLINES.get("journey")):
+                    last_task = asyncio.create_task(
+                        process_in_order(last_task, websocket, session_id, str(user_id), message, llm_client, message_processor, cancel)
+                    )
+                last_task.add_done_callback(pending_tasks.discard)
+                pending_tasks.add(last_task)
                 
         except WebSocketDisconnect:
             logger.info(f"WebSocket disconnected: user {user_id} for session {session_id}")
         except Exception as e:
             error_details = traceback.format_exc()
             logger.error(f"WebSocket error: {str(e)}\n{error_details}")
+        finally:
+            # Evaluations in progress stop at once; saving responses is left to finish
+            connection_cancel.cancel(DISCONNECTED)
+            if pending_tasks:
+                await asyncio.wait(pending_tasks, timeout=2.0)
     except Exception as e:
         error_details = traceback.format_exc()
         logger.error(f"WebSocket authentication error: {str(e)}\n{error_details}")
@@ -16,6 +16,8 @@ class PenpalLetter(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, onupdate=datetime.utcnow)
     delivery_date = Column(DateTime, nullable=False)
+    # When a worker queued the reply; claims the letter until the reply is stored
+    reply_queued_at = Column(DateTime, nullable=True)
 
     user = relationship('User', backref='penpal_letters')
 
@@ -1,18 +1,25 @@
 # Curriculum business logic 
 
 import os
+import asyncio
 import logging
 from datetime import datetime, timedelta
-from sqlalchemy import or_, func
+from sqlalchemy import or_, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from src.core.config import settings
+from src.core.db import SessionLocal
 from src.features.penpal.models import PenpalLetter
 from src.features.auth.models import User
+from src.shared.llm.batch import BatchCallback, BatchResult
 from src.shared.llm.client import LLMClient
+from src.shared.llm.context import LLMCallContext
 
 logger = logging.getLogger(__name__)
 
+NO_REPLY = "I apologize, but I couldn't generate a response at this time. Please try again later."
+
 class PenpalService:
     def __init__(self, llm_client: LLMClient):
         """Initialize the penpal service."""
@@ -25,7 +32,11 @@ class PenpalService:
 
     async def process_letter(self, db: AsyncSession, user_id: int, letter_content: str, character_name: str):
         """
-        Process a student's letter through an LLM and store both letter and response.
+        Store a student's letter and queue the character's reply.
+
+        The reply is only read once the letter is delivered, so it goes
+        through the LLM batch lane and is stored when its batch completes;
+        students see the letter once its reply is there.
         """
         try:
             # Add delivery date when creating letter
@@ -33,36 +44,20 @@ class PenpalService:
                 user_id=user_id,
                 letter_content=letter_content,
                 character_name=character_name,
-                delivery_date=self.get_next_monday()
+                delivery_date=self.get_next_monday(),
+                reply_queued_at=datetime.utcnow()
             )
             db.add(new_letter)
             await db.commit()
             await db.refresh(new_letter)
 
-            # Prepare prompt for OpenAI with character context
-            prompt = f"""You are {character_name}, a friendly penpal responding to a letter from a student. 
-            Write a warm, encouraging response that engages with their specific message, 
-            staying in character as {character_name}:
-
-            Student's Letter: {letter_content}
-
-            Response (as {character_name}):"""
-
             try:
-                # Call LLM to generate response using the shared client
-                response = await self.get_response(prompt, character_name)
+                await self._queue_reply(new_letter)
             
             except Exception as e:
                 logger.error(f"LLM API error: {str(e)}")
-                new_letter.response_content = "I apologize, but I couldn't generate a response at this time. Please try again later."
+                new_letter.response_content = NO_REPLY
                 await db.commit()
-                return new_letter
-
-            # Store the AI response
-            new_letter.response_content = response
-            new_letter.updated_at = datetime.utcnow()
-            await db.commit()
-            await db.refresh(new_letter)
 
             return new_letter
 
@@ -71,24 +66,104 @@ class PenpalService:
             logger.error(f"Error processing letter: {str(e)}")
             raise
 
+    async def _queue_reply(self, letter: PenpalLetter):
+        """Queue the character's reply to `letter` on the batch lane"""
+        # Prepare prompt for OpenAI with character context
+        prompt = f"""You are {letter.character_name}, a friendly penpal responding to a letter from a student. 
+            Write a warm, encouraging response that engages with their specific message, 
+            staying in character as {letter.character_name}:
+
+            Student's Letter: {letter.letter_content}
+
+            Response (as {letter.character_name}):"""
+
+        await self.llm_client.submit_batch(
+            self._messages(prompt, letter.character_name),
+            self._store_reply(letter.id),
+            feature="penpal",
+            profile="penpal",
+            # A letter is the penpal equivalent of a session
+            context=LLMCallContext(user_id=str(letter.user_id), session_id=f"penpal:{letter.id}")
+        )
+
+    def _store_reply(self, letter_id: int) -> BatchCallback:
+        """Callback that stores the batched reply to letter `letter_id`"""
+        async def store(result: BatchResult):
+            if result.retryable:
+                # Release the claim so the next requeue_unanswered(), in any worker, picks it up
+                logger.warning(f"Penpal reply to letter {letter_id} not received: {result.error}")
+                async with SessionLocal() as db:
+                    await db.execute(
+                        update(PenpalLetter)
+                        .where(PenpalLetter.id == letter_id, PenpalLetter.response_content.is_(None))
+                        .values(reply_queued_at=None)
+                    )
+                    await db.commit()
+                return
+            if not result.ok:
+                logger.error(f"Penpal reply to letter {letter_id} failed: {result.error}")
+            async with SessionLocal() as db:
+                letter = await db.get(PenpalLetter, letter_id)
+                if letter is None:
+                    return
+                letter.response_content = result.content if result.ok else NO_REPLY
+                letter.updated_at = datetime.utcnow()
+                await db.commit()
+        return store
+
+    async def requeue_unanswered(self, db: AsyncSession) -> int:
+        """
+        Queue replies again for letters left without one, e.g. by a restart
+        while their batch was pending. Returns how many were queued.
+
+        Queueing a reply claims the letter (reply_queued_at) for as long as
+        its batch may take: PENPAL_REPLY_RETRY_AFTER, or the batch
+        endpoint's completion window if that is longer. Only unclaimed
+        letters and expired claims are taken, each by a single UPDATE, so
+        of several workers sweeping at once exactly one queues a letter.
+        """
+        claim_for = max(settings.PENPAL_REPLY_RETRY_AFTER, self.llm_client.batch.max_turnaround or 0.0)
+        now = datetime.utcnow()
+        claimed = await db.execute(
+            update(PenpalLetter)
+            .where(
+                PenpalLetter.response_content.is_(None),
+                or_(
+                    PenpalLetter.reply_queued_at.is_(None),
+                    PenpalLetter.reply_queued_at < now - timedelta(seconds=claim_for)
+                )
+            )
+            .values(reply_queued_at=now)
+            .returning(PenpalLetter.id)
+        )
+        letter_ids = list(claimed.scalars().all())
+        await db.commit()
+        if not letter_ids:
+            return 0
+        result = await db.execute(select(PenpalLetter).where(PenpalLetter.id.in_(letter_ids)))
+        letters = result.scalars().all()
+        for letter in letters:
+            await self._queue_reply(letter)
+        logger.info(f"Queued replies again for {len(letters)} unanswered penpal letters")
+        return len(letters)
+
+    def _messages(self, prompt, character=None, conversation_history=None):
+        """The chat messages asking `character` to answer `prompt`"""
+        if conversation_history:
+            return conversation_history + [{"role": "user", "content": prompt}]
+        system_message = f"You are a penpal character named {character}. Write a friendly letter response to the user."
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
     async def get_response(self, prompt, character=None, conversation_history=None):
         """Get a response from the penpal character using the shared LLMClient."""
         try:
-            # Prepare messages
-            if conversation_history:
-                messages = conversation_history + [{"role": "user", "content": prompt}]
-            else:
-                system_message = f"You are a penpal character named {character}. Write a friendly letter response to the user."
-                messages = [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ]
-            
-            # Use the shared LLMClient's generate_text method
-            # The client expects a JSON string of the message list
-            import json
-            prompt_json = json.dumps(messages)
-            response = await self.llm_client.generate_text(prompt_json)
+            # The shared LLMClient takes the message list as is
+            response = await self.llm_client.generate_messages(
+                self._messages(prompt, character, conversation_history), feature="penpal", profile="penpal"
+            )
             return response
                 
         except Exception as e:
@@ -104,10 +179,12 @@ class PenpalService:
             query = select(PenpalLetter)
 
             if role == 'student':
-                # Base filter for students: their own letters that are delivered
+                # Base filter for students: their own letters that are delivered,
+                # which takes the reply too (it arrives from a batch, possibly late)
                 query = query.where(
                     PenpalLetter.user_id == user_id,
-                    PenpalLetter.delivery_date <= datetime.utcnow()
+                    PenpalLetter.delivery_date <= datetime.utcnow(),
+                    PenpalLetter.response_content.isnot(None)
                 )
                 
                 # Add character filter if specified
@@ -143,4 +220,15 @@ class PenpalService:
 
         except Exception as e:
             logger.error(f"Error retrieving letters: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
+
+async def sweep_unanswered_letters(llm_client: LLMClient):
+    """Run PenpalService.requeue_unanswered every PENPAL_REPLY_SWEEP_INTERVAL seconds, from startup"""
+    service = PenpalService(llm_client)
+    while True:
+        try:
+            async with SessionLocal() as db:
+                await service.requeue_unanswered(db)
+        except Exception as e:
+            logger.error(f"Sweeping unanswered penpal letters failed: {e}")
+        await asyncio.sleep(settings.PENPAL_REPLY_SWEEP_INTERVAL)
@@ -15,7 +15,6 @@ from src.shared.realtime import TokenService, TokenError
 from src.core.config import settings
 # from src.utils.prompt_loader import load_book_character_prompt # <<< REMOVE or COMMENT OUT this line
 from src.features.sandbox.characters import get_character_config
-from src.shared.llm.client import LLMClient
 from .websocket import subtitle_websocket_endpoint
 
 router = APIRouter(prefix="/sandbox", tags=["sandbox"])
@@ -40,13 +39,14 @@ DEFAULT_VOICE = "alloy"
 @router.post("/sessions", response_model=schemas.SandboxSessionResponse)
 async def create_session(
     session_data: schemas.SandboxSessionCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """Create a new Little Prince conversation session"""
     try:
         # Create service directly in the function
-        sandbox_service = service.SandboxService(LLMClient(), db)
+        sandbox_service = service.SandboxService(request.app.state.llm_client, db)
         
         # Get language level from request, default to b1
         language_level = session_data.language_level or "b1"
@@ -71,13 +71,14 @@ async def create_session(
 @router.get("/sessions/{session_id}", response_model=schemas.SandboxSessionDetail)
 async def get_session(
     session_id: str,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """Get session details including messages"""
     try:
         # Create service directly in the function
-        sandbox_service = service.SandboxService(LLMClient(), db)
+        sandbox_service = service.SandboxService(request.app.state.llm_client, db)
         
         # Get session
         session = await sandbox_service.get_session(session_id)
@@ -455,6 +456,7 @@ async def get_subtitle_docs(
 @router.post("/start", response_model=schemas.SandboxStartResponse)
 async def start_session(
     start_data: schemas.SandboxStartRequest,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
@@ -483,10 +485,8 @@ async def start_session(
             )
         # ------------------------
 
-        # Instantiate service 
-        # (Consider dependency injection for LLMClient if used by service)
-        from src.shared.llm.client import LLMClient # Ensure LLMClient is available
-        sandbox_service = service.SandboxService(LLMClient(), db) 
+        # Instantiate service with the shared LLM client from application state
+        sandbox_service = service.SandboxService(request.app.state.llm_client, db)
 
         # Generate a title for the session
         title = f"Video Chat with {start_data.characterName or f'Character {start_data.character_id}'} ({start_data.language_level})"
@@ -1,7 +1,6 @@
 from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import logging
 import asyncio
-import json
 import time
 from datetime import datetime
 from sqlalchemy import select, and_, func, exists, text
@@ -11,11 +10,15 @@ from uuid import uuid4
 from src.features.sandbox.models import SandboxSession, SandboxMessage
 from src.features.sandbox.characters import get_character_config
 from src.shared.llm.client import LLMClient
+from src.shared.llm.exceptions import BudgetExceededError
+from src.shared.llm.similarity_cache import SimilarityKey
 from src.shared.services import BaseChatService
 
 logger = logging.getLogger(__name__)
 
 class SandboxService(BaseChatService):
+    llm_feature = "sandbox"
+
     def __init__(self, llm_client: LLMClient, db: AsyncSession):
         """Initialize the sandbox service."""
         super().__init__(llm_client, db, SandboxSession, SandboxMessage)
@@ -209,7 +212,7 @@ class SandboxService(BaseChatService):
     async def _generate_character_response(self, conversation: List[Dict[str, str]]) -> str:
         """Generate a response from the character LLM"""
         try:
-            response = await self.llm_client.generate_text(json.dumps(conversation))
+            response = await self.llm_client.generate_messages(conversation, feature=self.llm_feature)
             return response
         except Exception as e:
             logger.error(f"Error generating character response: {str(e)}")
@@ -231,7 +234,9 @@ class SandboxService(BaseChatService):
                 {"role": "user", "content": f"ONLY analyze the Little Prince's MOST RECENT message and provide ONE helpful hint that directly responds to what he just said. His last message is: \"{last_prince_message}\"\n\nMake sure the hint directly addresses something specific in this message. Format the hint as instructed in the system prompt."}
             ]
             
-            raw_hint = await self.llm_client.generate_text(json.dumps(hint_conversation))
+            # Near-identical character lines get the same hint
+            similarity_key = SimilarityKey(scope=f"sandbox:{hint_prompt}", text=last_prince_message) if last_prince_message else None
+            raw_hint = await self.llm_client.generate_messages(hint_conversation, feature="hints", similarity_key=similarity_key, profile="single_hint")
             
             # Process the response to ensure proper formatting
             import re
@@ -253,6 +258,11 @@ class SandboxService(BaseChatService):
                 hint = f'"{hint}"'
                 
             return hint
+
+        except BudgetExceededError as e:
+            # Hints are the first thing dropped when a session runs over its token budget
+            logger.info(f"Skipping hint: {e}")
+            return ""
             
         except Exception as e:
             logger.error(f"Error generating hint: {str(e)}")
@@ -265,6 +275,7 @@ class SandboxService(BaseChatService):
         character_id: str = "little-prince"
     ) -> AsyncIterator[str]:
         """Stream the character response chunks"""
+        streamed_any = False
         try:
             # Get character config
             character_config = get_character_config(character_id)
@@ -273,11 +284,14 @@ class SandboxService(BaseChatService):
             formatted_messages = [{"role": "system", "content": character_config["system_prompt"]}]
             formatted_messages.extend(conversation)
             
-            async for chunk in self.llm_client.stream_generate(json.dumps(formatted_messages)):
+            async for chunk in self.llm_client.stream_messages(formatted_messages, feature=self.llm_feature):
+                streamed_any = True
                 yield chunk
         except Exception as e:
             logger.error(f"Error streaming character response: {str(e)}")
-            yield "I'm having trouble finding the right words. Could you please repeat what you said?"
+            # A stream that broke off mid-sentence ends there rather than gaining an apology
+            if not streamed_any:
+                yield "I'm having trouble finding the right words. Could you please repeat what you said?"
             
     def get_timestamp(self) -> int:
         """Get current timestamp in milliseconds for frontend"""
@@ -11,9 +11,16 @@ from urllib.parse import parse_qs # Need this for parsing
 from sqlalchemy import select
 
 from src.features.sandbox.service import SandboxService
+from src.core.config import settings
 from src.core.db import get_db, SessionLocal
+from src.core.deadline import deadline_scope
 from src.core.security import decode_jwt_token
 from src.shared.websockets.manager import connection_manager
+from src.shared.llm.client import LLMClient
+from src.shared.llm.context import bind_llm_context
+from src.shared.llm.cancellation import CancellationToken, SUPERSEDED, DISCONNECTED
+from src.shared.llm.exceptions import BudgetExceededError
+from src.shared.llm.similarity_cache import SimilarityKey
 
 logger = logging.getLogger(__name__)
 
@@ -25,21 +32,31 @@ logger = logging.getLogger(__name__)
 subtitle_buffers: Dict[str, Dict[str, Dict[str, Any]]] = {}
 # Tasks for debounced processing
 processing_tasks: Dict[str, Dict[str, asyncio.Task]] = {}
+# Cancellation tokens of those tasks, which also stop a hint's LLM call mid-flight
+processing_cancels: Dict[str, Dict[str, CancellationToken]] = {}
+
+async def _cancel_processing(session_id: str, user_id: str, reason: str):
+    """Cancel the user's debounced subtitle processing, if any, and wait for it to stop"""
+    cancel = processing_cancels.get(session_id, {}).pop(user_id, None)
+    if cancel is not None:
+        cancel.cancel(reason)
+    task = processing_tasks.get(session_id, {}).get(user_id)
+    if task is not None and not task.done():
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass  # Expected cancellation
 
 async def disconnect_sandbox_user(session_id: str, user_id: str):
     """Custom disconnect logic for the sandbox feature to clean up processing tasks."""
     # Cancel any pending processing tasks for the user
     if session_id in processing_tasks and user_id in processing_tasks[session_id]:
-        task = processing_tasks[session_id][user_id]
-        if not task.done():
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass  # Expected cancellation
+        await _cancel_processing(session_id, user_id, DISCONNECTED)
         del processing_tasks[session_id][user_id]
         if not processing_tasks[session_id]:
             del processing_tasks[session_id]
+        if session_id in processing_cancels and not processing_cancels[session_id]:
+            del processing_cancels[session_id]
 
     # Clean up subtitle buffer for the user
     if session_id in subtitle_buffers:
@@ -54,7 +71,7 @@ async def disconnect_sandbox_user(session_id: str, user_id: str):
     await connection_manager.disconnect(session_id, user_id)
     logger.info(f"Cleaned up sandbox-specific resources for user {user_id} in session {session_id}")
 
-async def buffer_subtitle(session_id: str, user_id: str, message: Dict[str, Any]):
+async def buffer_subtitle(session_id: str, user_id: str, message: Dict[str, Any], llm_client: LLMClient):
     """Buffer a subtitle and schedule it for delayed processing to avoid processing partial transcriptions"""
     character = message.get("character", "unknown")
     buffer_key = f"{character}_{user_id}"
@@ -66,41 +83,37 @@ async def buffer_subtitle(session_id: str, user_id: str, message: Dict[str, Any]
     # Store the latest subtitle
     subtitle_buffers[session_id][buffer_key] = message
     
-    # Cancel previous processing task if it exists
-    if session_id in processing_tasks and user_id in processing_tasks[session_id]:
-        task = processing_tasks[session_id][user_id]
-        if not task.done():
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass
+    # Cancel previous processing task if it exists, including a hint already being generated
+    await _cancel_processing(session_id, user_id, SUPERSEDED)
             
     # Create a new processing task with debounce delay
     if session_id not in processing_tasks:
         processing_tasks[session_id] = {}
         
+    cancel = CancellationToken()
+    processing_cancels.setdefault(session_id, {})[user_id] = cancel
     processing_tasks[session_id][user_id] = asyncio.create_task(
-        _process_subtitle_after_delay(session_id, user_id, buffer_key, 1.5)  # 1.5 second debounce
+        _process_subtitle_after_delay(session_id, user_id, buffer_key, 1.5, llm_client, cancel)  # 1.5 second debounce
     )
         
-async def _process_subtitle_after_delay(session_id: str, user_id: str, buffer_key: str, delay: float):
+async def _process_subtitle_after_delay(session_id: str, user_id: str, buffer_key: str, delay: float, llm_client: LLMClient, cancel: CancellationToken):
     """Process the subtitle after a delay to allow for rapid updates to settle"""
     try:
-        # Wait for the debounce period
-        await asyncio.sleep(delay)
-        
-        # Get the latest subtitle from the buffer
-        if (session_id in subtitle_buffers and 
-            buffer_key in subtitle_buffers[session_id]):
-            
-            # Get the message and remove it from the buffer
-            message = subtitle_buffers[session_id].pop(buffer_key, None)
+        with cancel.guard():
+            # Wait for the debounce period
+            await asyncio.sleep(delay)
             
-            # Process the subtitle if a message was found
-            if message:
-                logger.info(f"Processing debounced subtitle from {buffer_key} in session {session_id}")
-                await process_final_subtitle(session_id, user_id, message)
+            # Get the latest subtitle from the buffer
+            if (session_id in subtitle_buffers and 
+                buffer_key in subtitle_buffers[session_id]):
+                
+                # Get the message and remove it from the buffer
+                message = subtitle_buffers[session_id].pop(buffer_key, None)
+                
+                # Process the subtitle if a message was found
+                if message:
+                    logger.info(f"Processing debounced subtitle from {buffer_key} in session {session_id}")
+                    await process_final_subtitle(session_id, user_id, message, llm_client)
 
     except asyncio.CancelledError:
         # Task was cancelled, likely due to a newer subtitle
@@ -109,7 +122,7 @@ async def _process_subtitle_after_delay(session_id: str, user_id: str, buffer_ke
         logger.error(f"Error in debounced subtitle processing: {str(e)}")
         logger.exception("Debounced processing error details:")
 
-async def process_final_subtitle(session_id: str, user_id: str, message: Dict[str, Any]):
+async def process_final_subtitle(session_id: str, user_id: str, message: Dict[str, Any], llm_client: LLMClient):
     """Process the final version of a subtitle after debouncing, including level-aware hints"""
     content = message.get("content", "")
     character_name_from_message = message.get("character", "unknown") # Get the name from the message
@@ -122,7 +135,6 @@ async def process_final_subtitle(session_id: str, user_id: str, message: Dict[st
     from src.features.sandbox.characters import get_character_config, CHARACTER_NAME_TO_ID_MAP
     from src.features.sandbox.service import SandboxService # Import service for session retrieval
     from src.features.sandbox.models import SandboxSession # Import model for type hint
-    from src.shared.llm.client import LLMClient # Import LLMClient
     
     character_id_for_config = CHARACTER_NAME_TO_ID_MAP.get(character_name_from_message)
     if not character_id_for_config:
@@ -132,15 +144,11 @@ async def process_final_subtitle(session_id: str, user_id: str, message: Dict[st
         logger.info(f"DEBUG: Mapped character name '{character_name_from_message}' to ID '{character_id_for_config}' for config lookup.")
     # --------------------------------------------
 
-    # Generate a conversation hint using LLM - with database access for level
-    llm_client: LLMClient = None # Reuse client if possible
+    # Generate a conversation hint using the shared LLM client - with database access for level
     try:
         # Create a dedicated DB session scope for this background task
         async with SessionLocal() as db:
 
-            # Create LLM client (Consider reusing one if performance becomes an issue)
-            llm_client = LLMClient()
-
             # --- Fetch Session Language Level --- 
             # Use explicit select instead of db.get to potentially mitigate transaction visibility issues
             stmt = select(SandboxSession).where(SandboxSession.id == session_id)
@@ -173,7 +181,9 @@ async def process_final_subtitle(session_id: str, user_id: str, message: Dict[st
             
             # Generate hint using LLM
             logger.info(f"[_process_final_subtitle] Sending conversation to hint LLM: {json.dumps(conversation)}")
-            raw_hint = await llm_client.generate_text(json.dumps(conversation))
+            # Near-identical subtitles get the same hint
+            similarity_key = SimilarityKey(scope=f"subtitle:{character_name_from_message}:{hint_prompt}", text=content)
+            raw_hint = await llm_client.generate_messages(conversation, feature="hints", similarity_key=similarity_key, profile="single_hint")
             logger.info(f"[_process_final_subtitle] Raw response from hint LLM: {raw_hint}")
             
             # --- Simplified Hint Parsing (like Story Mode) --- 
@@ -206,6 +216,10 @@ async def process_final_subtitle(session_id: str, user_id: str, message: Dict[st
             )
             logger.info(f"Sent conversation hint for final subtitle")
 
+    except BudgetExceededError as e:
+        # Hints are the first thing dropped when a session runs over its token budget
+        logger.info(f"Skipping subtitle hint: {e}")
+
     except Exception as hint_error:
         logger.error(f"Error generating LLM hint: {str(hint_error)}")
         logger.exception("Hint generation error details:")
@@ -226,17 +240,13 @@ async def process_final_subtitle(session_id: str, user_id: str, message: Dict[st
             logger.info(f"Sent fallback conversation hint for final subtitle")
         except Exception as fallback_err:
             logger.error(f"Even fallback hint generation failed: {fallback_err}")
-    finally:
-        # Clean up LLM client resources if needed
-        if llm_client and hasattr(llm_client, 'close') and callable(llm_client.close):
-            await llm_client.close()
-        # DB session is closed by the context manager `get_db_session_for_ws`
 
 async def process_websocket_message(
     websocket: WebSocket, 
     session_id: str, 
     user_id: str, 
-    message: Dict[str, Any]
+    message: Dict[str, Any],
+    llm_client: LLMClient
 ):
     """Process WebSocket messages from clients according to frontend protocol"""
     msg_type = message.get("type", "")
@@ -314,7 +324,7 @@ async def process_websocket_message(
             logger.info(f"Sent ack for message {message_id}")
             
             # Buffer the subtitle and process it after debouncing
-            await buffer_subtitle(session_id, user_id, message)
+            await buffer_subtitle(session_id, user_id, message, llm_client)
             logger.info(f"Buffered subtitle for debounced processing: '{content[:50]}...'")
         
         # Handle GET_HISTORY type for retrieving chat history (kept from original implementation)
@@ -423,6 +433,9 @@ async def subtitle_websocket_endpoint(
     # Verify token and get user if provided
     user_id = None
     
+    # Shared LLM client (and its pooled connections) from the application state
+    llm_client = websocket.app.state.llm_client
+    
     try:
         # If token is provided, try to decode it
         if token:
@@ -445,6 +458,9 @@ async def subtitle_websocket_endpoint(
         # Log connection
         logger.info(f"Subtitle WebSocket connected: user {user_id} for session {session_id}")
         
+        # Every LLM call (and task) spawned by this connection is scheduled as this user
+        bind_llm_context(user_id=user_id, session_id=session_id)
+        
         # Register the connection with the manager
         await connection_manager.connect(websocket, session_id, user_id)
         
@@ -477,8 +493,9 @@ async def subtitle_websocket_endpoint(
                         message = json.loads(text_data)
                         logger.info(f"Parsed JSON message: {str(message)[:200]}...")
                         
-                        # Process the parsed message
-                        await process_websocket_message(websocket, session_id, user_id, message)
+                        # Process the parsed message; the debounced processing task it schedules keeps the deadline
+                        with deadline_scope(settings.WS_MESSAGE_DEADLINES.get("sandbox")):
+                            await process_websocket_message(websocket, session_id, user_id, message, llm_client)
                     except json.JSONDecodeError as json_err:
                         logger.error(f"Failed to parse JSON message: {str(json_err)}")
                         logger.error(f"Invalid JSON: {text_data[:200]}")
@@ -505,6 +522,7 @@ async def subtitle_websocket_endpoint(
                         )
                 elif data.get("type") == "websocket.disconnect":
                     logger.info(f"WebSocket disconnect message received")
+                    await disconnect_sandbox_user(session_id, user_id)
                     break
                 else:
                     logger.warning(f"Received unknown message type: {data.get('type')}")
@@ -10,6 +10,8 @@ from uuid import uuid4
 from src.features.story_mode.models import StorySession, StoryMessage, StoryHint
 from src.features.story_mode.characters import get_character_config
 from src.shared.llm.client import LLMClient
+from src.shared.llm.exceptions import BudgetExceededError
+from src.shared.llm.similarity_cache import SimilarityKey
 from src.shared.websockets.manager import connection_manager
 from src.shared.services import BaseChatService
 
@@ -21,6 +23,8 @@ def estimate_tokens(text: str) -> int:
     return len(text) // 4 + 1
 
 class StoryService(BaseChatService):
+    llm_feature = "story"
+
     def __init__(self, llm_client: LLMClient, db: AsyncSession):
         """Initialize the story service with a single LLM client and database session"""
         super().__init__(llm_client, db, StorySession, StoryMessage)
@@ -271,7 +275,9 @@ class StoryService(BaseChatService):
             logger.info(f"[_generate_hints] Sending conversation to hint LLM: {json.dumps(hint_conversation)}")
 
             # Use the main LLM client
-            raw_hints = await self.llm_client.generate_text(json.dumps(hint_conversation))
+            # Near-identical character lines get the same hints
+            similarity_key = SimilarityKey(scope=f"story:{character_name}:{hint_prompt}", text=last_prince_message) if last_prince_message else None
+            raw_hints = await self.llm_client.generate_messages(hint_conversation, feature="hints", similarity_key=similarity_key, profile="hints")
             
             logger.info(f"[_generate_hints] Raw response from hint LLM: {raw_hints}")
 
@@ -301,6 +307,11 @@ class StoryService(BaseChatService):
             
             logger.info(f"[_generate_hints] Parsed hints: {processed_hints[:3]}")
             return processed_hints[:3]  # Limit to 3 hints
+
+        except BudgetExceededError as e:
+            # Hints are the first thing dropped when a session runs over its token budget
+            logger.info(f"[_generate_hints] Skipping hints: {e}")
+            return []
             
         except Exception as e:
             logger.error(f"Error generating hints: {str(e)}")
@@ -318,6 +329,7 @@ class StoryService(BaseChatService):
         character_id: str = "little-prince"
     ) -> AsyncIterator[str]:
         """Stream the character response chunks using the session's language level"""
+        streamed_any = False
         try:
             # Get the session to retrieve its language level
             session = await self.get_session(session_id)
@@ -332,11 +344,14 @@ class StoryService(BaseChatService):
             formatted_messages = [{"role": "system", "content": character_config["system_prompt"]}]
             formatted_messages.extend(conversation)
             
-            async for chunk in self.llm_client.stream_generate(json.dumps(formatted_messages)):
+            async for chunk in self.llm_client.stream_messages(formatted_messages, feature=self.llm_feature):
+                streamed_any = True
                 yield chunk
         except Exception as e:
             logger.error(f"Error streaming character response: {str(e)}")
-            yield "I'm having trouble finding the right words. Could you please repeat what you said?"
+            # A stream that broke off mid-sentence ends there rather than gaining an apology
+            if not streamed_any:
+                yield "I'm having trouble finding the right words. Could you please repeat what you said?"
             
     def get_timestamp(self) -> int:
         """Get current timestamp in milliseconds for frontend"""
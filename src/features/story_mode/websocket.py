@@ -13,8 +13,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.features.story_mode.service import StoryService
 from src.shared.websockets.manager import connection_manager
 from src.features.story_mode.characters import get_character_config
+from src.core.config import settings
 from src.core.db import get_db, SessionLocal
+from src.core.deadline import deadline_scope
 from src.shared.llm.client import LLMClient
+from src.shared.llm.context import bind_llm_context
+from src.shared.llm.cancellation import CancellationToken, SUPERSEDED, DISCONNECTED
 from src.core.security import decode_jwt_token
 from src.shared.dependencies import get_message_processor
 from src.shared.message_processing.service import MessageProcessingService
@@ -43,16 +47,16 @@ def get_message_processor_safely(websocket: WebSocket) -> Optional[MessageProces
                 logger.info(f"Successfully retrieved message processor from app state: {type(processor)}")
                 return processor
         
-        # Alternative approach as fallback - try to recreate the processor
+        # Alternative approach as fallback - recreate the processor on the shared LLM client,
+        # whose pools, rate limits and stats the rest of the app uses
         try:
-            from src.shared.dependencies import get_message_processor
-            from src.shared.llm.client import LLMClient
+            llm_client = getattr(websocket.app.state, 'llm_client', None)
+            if llm_client is None:
+                logger.error("No shared LLM client in app state; skipping message processing")
+                return None
+            processor = MessageProcessingService(llm_client)
             
-            # Create a new LLM client specifically for message processing
-            temp_llm_client = LLMClient()
-            processor = MessageProcessingService(temp_llm_client)
-            
-            logger.info(f"Created new message processor with dedicated LLM client: {type(processor)}")
+            logger.info(f"Created new message processor with the shared LLM client: {type(processor)}")
             return processor
         except Exception as create_err:
             logger.error(f"Failed to create message processor: {str(create_err)}")
@@ -68,9 +72,16 @@ async def process_websocket_message(
     user_id: str, 
     message: Dict[str, Any],
     llm_client: LLMClient,
-    message_processor: MessageProcessingService
+    message_processor: MessageProcessingService,
+    cancel: CancellationToken
 ):
-    """Process WebSocket messages from clients using shared services"""
+    """
+    Process WebSocket messages from clients using shared services.
+
+    LLM work runs under `cancel`, which the endpoint cancels when a newer
+    user message supersedes this one or the client disconnects, and within
+    the message's deadline (WS_MESSAGE_DEADLINES["story_mode"]).
+    """
     msg_type = message.get("type", "")
     message_id = message.get("messageId", str(uuid4()))
     
@@ -117,11 +128,18 @@ async def process_websocket_message(
                 await story_service.save_message(session_id, "user", content, message_id, character_id)
                 conversation = await story_service.get_conversation(session_id)
                 assistant_message = ""
-                async for chunk in story_service.stream_character_response(session_id, conversation, character_id):
-                    if websocket.client_state.name != "CONNECTED":
-                        raise WebSocketDisconnect()
-                    assistant_message += chunk
-                    await connection_manager.send_message(session_id, user_id, {"type": "MESSAGE_CHUNK", "messageId": message_id, "content": chunk, "isComplete": False, "timestamp": int(time.time() * 1000), "character": character_id})
+                try:
+                    with cancel.guard():
+                        async for chunk in story_service.stream_character_response(session_id, conversation, character_id):
+                            if websocket.client_state.name != "CONNECTED":
+                                raise WebSocketDisconnect()
+                            assistant_message += chunk
+                            await connection_manager.send_message(session_id, user_id, {"type": "MESSAGE_CHUNK", "messageId": message_id, "content": chunk, "isComplete": False, "timestamp": int(time.time() * 1000), "character": character_id})
+                except asyncio.CancelledError:
+                    if cancel.reason == SUPERSEDED and websocket.client_state.name == "CONNECTED":
+                        # Close the half-written reply; the newer message gets its own
+                        await connection_manager.send_message(session_id, user_id, {"type": "MESSAGE_CHUNK", "messageId": message_id, "content": "", "isComplete": True, "cancelled": True, "timestamp": int(time.time() * 1000), "character": character_id})
+                    raise
 
                 if websocket.client_state.name == "CONNECTED":
                     await connection_manager.send_message(session_id, user_id, {"type": "MESSAGE_CHUNK", "messageId": message_id, "content": "", "isComplete": True, "timestamp": int(time.time() * 1000), "character": character_id})
@@ -133,7 +151,8 @@ async def process_websocket_message(
                     await processing_task
 
                 if websocket.client_state.name == "CONNECTED":
-                    hints = await story_service.generate_hints(session_id)
+                    with cancel.guard():
+                        hints = await story_service.generate_hints(session_id)
                     await connection_manager.send_message(session_id, user_id, {"type": "HINTS", "messageId": message_id, "hints": hints, "timestamp": int(time.time() * 1000)})
             
             elif msg_type == "GREETING":
@@ -146,7 +165,8 @@ async def process_websocket_message(
                     greeting = character["greeting"]
                     await story_service.save_message(session_id, "assistant", greeting, message_id, character_id)
                     await connection_manager.send_message(session_id, user_id, {"type": "MESSAGE_CHUNK", "messageId": message_id, "content": greeting, "isComplete": True, "timestamp": int(time.time() * 1000), "character": character_id})
-                    hints = await story_service.generate_initial_hints(session_id)
+                    with cancel.guard():
+                        hints = await story_service.generate_initial_hints(session_id)
                     await connection_manager.send_message(session_id, user_id, {"type": "HINTS", "messageId": message_id, "hints": hints, "timestamp": int(time.time() * 1000)})
                 else:
                     conversation_history = await story_service.get_session_messages(session_id)
@@ -373,6 +393,12 @@ async def websocket_endpoint(
         return
     
     pending_tasks = set()
+    # Cancelled on disconnect; every message's token is a child of it
+    connection_cancel = CancellationToken()
+    # The token of the latest USER_MESSAGE, whose reply a newer one supersedes
+    reply_cancel: Optional[CancellationToken] = None
+    # Every LLM call (and task) spawned by this connection is scheduled as this user
+    bind_llm_context(user_id=user_id, session_id=session_id)
     await connection_manager.connect(websocket, session_id, user_id)
     
     try:
@@ -380,16 +406,26 @@ async def websocket_endpoint(
             data = await websocket.receive_text()
             message = json.loads(data)
             
-            task = asyncio.create_task(
-                process_websocket_message(
-                    websocket, 
-                    session_id, 
-                    user_id, 
-                    message,
-                    llm_client,
-                    message_processor
+            cancel = CancellationToken(parent=connection_cancel)
+            if message.get("type") == "USER_MESSAGE":
+                # Stop paying for a reply the child has already moved on from
+                if reply_cancel is not None:
+                    reply_cancel.cancel(SUPERSEDED)
+                reply_cancel = cancel
+            
+            # The task keeps the message's deadline for its LLM calls and queries
+            with deadline_scope(settings.WS_MESSAGE_DEADLINES.get("story_mode")):
+                task = asyncio.create_task(
+                    process_websocket_message(
+                        websocket, 
+                        session_id, 
+                        user_id, 
+                        message,
+                        llm_client,
+                        message_processor,
+                        cancel
+                    )
                 )
-            )
             
             task.add_done_callback(lambda t: pending_tasks.discard(t))
             pending_tasks.add(task)
@@ -401,6 +437,8 @@ async def websocket_endpoint(
         logger.exception("Details:")
     finally:
         logger.info(f"Starting cleanup for WebSocket endpoint {session_id}")
+        # Abort LLM calls in progress first, so the tokens they no longer cost are counted
+        connection_cancel.cancel(DISCONNECTED)
         for task in pending_tasks:
             if not task.done() and not task.cancelled():
                 task.cancel()
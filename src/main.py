@@ -1,5 +1,5 @@
 import logging
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, WebSocket, WebSocketDisconnect, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from uuid import uuid4
@@ -10,6 +10,7 @@ import time  # Add explicit import
 from src.core.config import settings
 from src.core.events import create_start_app_handler, create_stop_app_handler
 from src.core.exceptions import add_exception_handlers
+from src.core.security import require_admin
 from src.core.db import engine, Base
 
 # Set up logging
@@ -86,6 +87,22 @@ def create_application() -> FastAPI:
             "message": "Application is running"
         }
     
+    @app.get("/health/llm")
+    async def llm_health(request: Request):
+        """LLM pipeline metrics (connection pool, rate limiter queue)"""
+        llm_client = getattr(request.app.state, "llm_client", None)
+        if llm_client is None:
+            raise HTTPException(status_code=503, detail="LLM client not initialized")
+        return llm_client.get_stats()
+    
+    @app.get("/health/llm/consumers")
+    async def llm_consumers(request: Request, current_user = Depends(require_admin)):
+        """Heaviest LLM users and sessions by id (admins only; /health/llm is public)"""
+        llm_client = getattr(request.app.state, "llm_client", None)
+        if llm_client is None:
+            raise HTTPException(status_code=503, detail="LLM client not initialized")
+        return llm_client.usage.top_consumers()
+    
     # --- WebSocket Endpoints ---
     # Centralized for clarity. All paths are preserved.
     from src.features.story_mode.websocket import websocket_endpoint as story_ws_endpoint
@@ -0,0 +1,209 @@
+from typing import Optional, Dict, Any, List, Iterable
+from contextlib import asynccontextmanager
+import random
+import time
+import logging
+
+from src.core.config import settings
+from .circuit_breaker import CircuitBreaker, OPEN, HALF_OPEN, get_circuit_breaker
+from .concurrency import AdaptiveConcurrencyLimiter
+from .exceptions import CircuitOpenError
+from .rate_limiter import create_rate_limiter
+from .transport import LLMTransport, get_shared_transport
+
+logger = logging.getLogger(__name__)
+
+class LLMBackend:
+    """
+    One OpenAI-compatible endpoint and API key.
+
+    Owns its request/token quota, its adaptive in-flight window, its circuit
+    breaker (which ejects it while failing) and a smoothed latency estimate
+    used for routing.
+    """
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str,
+        weight: float = 1.0,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        quota_key: Optional[str] = None,
+        transport: Optional[LLMTransport] = None
+    ):
+        self.name = name
+        self.api_key = api_key
+        self.weight = weight
+        self.transport = transport or get_shared_transport(base_url)
+        self.api_url = f"{self.transport.base_url}/chat/completions"
+        self.rate_limiter = create_rate_limiter(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            key_prefix=quota_key
+        )
+        # Adaptive cap on requests in flight to this backend
+        self.concurrency = AdaptiveConcurrencyLimiter()
+        # Keyed by name too, so two keys on one endpoint trip independently
+        self.breaker: CircuitBreaker = get_circuit_breaker(f"{name}@{self.api_url}")
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+
+        # Monitoring counters
+        self.requests = 0
+
+    def headers(self) -> Dict[str, str]:
+        """Request headers for this backend's chat completions endpoint"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def available(self) -> bool:
+        """Whether the breaker would admit a call right now"""
+        return self.breaker.admits()
+
+    def started(self):
+        self.in_flight += 1
+        self.requests += 1
+
+    def finished(self, latency: Optional[float] = None):
+        """End a request; `latency` is its time to (first) response byte when it succeeded"""
+        self.in_flight -= 1
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += (latency - self.latency) * self.LATENCY_SMOOTHING
+
+    @asynccontextmanager
+    async def call(self):
+        """Admit one non-streaming request through the breaker and track its latency"""
+        async with self.breaker.guard():
+            self.started()
+            started = time.monotonic()
+            try:
+                yield
+            except BaseException:
+                self.finished()
+                raise
+            self.finished(time.monotonic() - started)
+
+    def slow_start_factor(self, now: float) -> float:
+        """Share of full weight while ramping back up after the circuit closed"""
+        recovered_at = self.breaker.recovered_at
+        slow_start = settings.LLM_BACKEND_SLOW_START_SECONDS
+        if recovered_at is None or slow_start <= 0 or now - recovered_at >= slow_start:
+            return 1.0
+        return max(0.05, (now - recovered_at) / slow_start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.api_url,
+            "weight": self.weight,
+            "latency_seconds": round(self.latency, 4) if self.latency is not None else None,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "connections": self.transport.connection_count(),
+            "circuit_breaker": self.breaker.get_stats(),
+            "rate_limiter": self.rate_limiter.get_stats(),
+            "concurrency": self.concurrency.get_stats()
+        }
+
+class BackendPool:
+    """
+    Health- and latency-weighted choice between LLM backends.
+
+    A backend's share of traffic is its configured weight, scaled by how its
+    smoothed latency compares with the fastest backend and by how loaded it
+    is. Backends whose circuit is open are skipped (ejected); half-open ones
+    only get their probe calls, and once the circuit closes a backend ramps
+    from 5% to full weight over LLM_BACKEND_SLOW_START_SECONDS.
+    """
+    def __init__(self, backends: List[LLMBackend]):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = backends
+
+    def _score(self, backend: LLMBackend, fastest: Optional[float], now: float) -> float:
+        score = backend.weight * backend.slow_start_factor(now)
+        if fastest is not None and backend.latency:
+            score *= fastest / backend.latency
+        if backend.breaker.state == HALF_OPEN:
+            # Only the probe budget gets through; don't steer other traffic at it
+            score *= 0.05
+        return score / (1 + backend.in_flight)
+
+    def select(self, exclude: Iterable[LLMBackend] = ()) -> LLMBackend:
+        """
+        Pick a backend for the next call.
+
+        Backends in `exclude` (e.g. ones that just failed this call) are used
+        only if nothing else is available. Raises CircuitOpenError if every
+        backend is ejected.
+        """
+        available = [b for b in self.backends if b.available()]
+        if not available:
+            self.check()
+        excluded = set(exclude)
+        candidates = [b for b in available if b not in excluded] or available
+        if len(candidates) == 1:
+            return candidates[0]
+
+        now = time.monotonic()
+        latencies = [b.latency for b in candidates if b.latency]
+        fastest = min(latencies) if latencies else None
+        weights = [self._score(b, fastest, now) for b in candidates]
+        if sum(weights) <= 0:
+            return random.choice(candidates)
+        return random.choices(candidates, weights=weights)[0]
+
+    def has_available(self) -> bool:
+        return any(b.available() for b in self.backends)
+
+    def check(self):
+        """Raise CircuitOpenError if no backend would take a call right now"""
+        if self.has_available():
+            return
+        waits = [b.breaker.open_for() for b in self.backends if b.breaker.state == OPEN]
+        raise CircuitOpenError(
+            "Every LLM backend is unavailable; failing fast",
+            retry_after=min(waits) if waits else None
+        )
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [backend.get_stats() for backend in self.backends]
+
+def create_backend_pool(transport: Optional[LLMTransport] = None) -> BackendPool:
+    """
+    Build the pool described by LLM_BACKENDS.
+
+    Without LLM_BACKENDS this is a single backend at LLM_API_BASE_URL using
+    OPENAI_API_KEY (over `transport`, if given) and the global quota.
+    """
+    if not settings.LLM_BACKENDS:
+        return BackendPool([LLMBackend(
+            "default",
+            base_url=settings.LLM_API_BASE_URL,
+            api_key=settings.OPENAI_API_KEY,
+            transport=transport
+        )])
+
+    backends = []
+    for index, config in enumerate(settings.LLM_BACKENDS):
+        name = config.get("name") or f"backend-{index}"
+        backends.append(LLMBackend(
+            name,
+            base_url=config.get("base_url") or settings.LLM_API_BASE_URL,
+            api_key=config.get("api_key") or settings.OPENAI_API_KEY,
+            weight=float(config.get("weight", 1.0)),
+            requests_per_minute=config.get("requests_per_minute"),
+            tokens_per_minute=config.get("tokens_per_minute"),
+            # Each key has its own upstream quota
+            quota_key=f"{settings.LLM_RATE_LIMIT_KEY_PREFIX}:{name}"
+        ))
+    logger.info(f"LLM backend pool: {', '.join(b.name for b in backends)}")
+    return BackendPool(backends)
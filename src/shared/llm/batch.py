@@ -0,0 +1,456 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from uuid import uuid4
+import asyncio
+import contextvars
+import json
+import logging
+import time
+
+import aiohttp
+
+from src.core.config import settings
+from .backends import BackendPool
+from .context import LLMCallContext
+from .exceptions import APIError
+from .scheduler import FairScheduler
+from .transport import parse_retry_after
+from .usage import TokenUsage, UsageTracker
+
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS = "/v1/chat/completions"
+
+# Batch states after which nothing more will come
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+LANE_CLOSED = "Batch lane closed before the result arrived"
+
+@dataclass(frozen=True)
+class BatchResult:
+    """
+    The outcome of one request of a batch: the completion's text, or why there is none.
+
+    `retryable` failures were never answered because the lane shut down
+    first; the request may simply be queued again later.
+    """
+    content: Optional[str]
+    error: Optional[str] = None
+    retryable: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.content is not None
+
+BatchCallback = Callable[[BatchResult], Awaitable[None]]
+
+def _detached(coro: Awaitable[Any]) -> asyncio.Task:
+    """
+    Run `coro` in a task that does not inherit the caller's context.
+
+    Batch work outlives the request that queued it, so the request's
+    deadline, cancellation token and LLM context must not follow it.
+    """
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+def _error_line(custom_id: str, message: str, status: Optional[int] = None) -> Dict[str, Any]:
+    response = None if status is None else {"status_code": status, "body": {"error": {"message": message}}}
+    return {"custom_id": custom_id, "response": response, "error": None if status is not None else {"message": message}}
+
+class BatchEndpoint(ABC):
+    """
+    Where JSONL batches of chat completion requests are run.
+
+    Mirrors the OpenAI Batch API: a batch is submitted as one JSONL file of
+    {"custom_id", "method", "url", "body"} lines, its status polled until it
+    reaches a terminal state, and its results read back as JSONL of
+    {"custom_id", "response": {"status_code", "body"}, "error"} lines.
+    """
+    # Seconds between status polls
+    poll_interval: float = 1.0
+    # Longest a submitted batch may take to finish, if the endpoint bounds it
+    max_turnaround: Optional[float] = None
+
+    @abstractmethod
+    async def submit(self, jsonl: bytes) -> str:
+        """Submit a batch and return its id"""
+
+    @abstractmethod
+    async def status(self, batch_id: str) -> Dict[str, Any]:
+        """The batch object: "status", "output_file_id", "error_file_id", "request_counts"..."""
+
+    @abstractmethod
+    async def content(self, file_id: str) -> bytes:
+        """The JSONL content of an output or error file"""
+
+    async def close(self):
+        """Release the endpoint's resources"""
+        pass
+
+class OpenAIBatchEndpoint(BatchEndpoint):
+    """The provider's /files and /batches endpoints, at half the price of real-time calls"""
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = (base_url or settings.LLM_API_BASE_URL).rstrip("/")
+        self.api_key = api_key or settings.OPENAI_API_KEY
+        self.poll_interval = settings.LLM_BATCH_POLL_INTERVAL
+        self.max_turnaround = _window_seconds(settings.LLM_BATCH_COMPLETION_WINDOW)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Batches are few and slow; they don't need the pooled real-time transport
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=aiohttp.ClientTimeout(total=settings.LLM_REQUEST_TIMEOUT * 6)
+            )
+        return self._session
+
+    async def _request(self, method: str, path: str, **kwargs) -> aiohttp.ClientResponse:
+        try:
+            response = await self._get_session().request(method, f"{self.base_url}{path}", **kwargs)
+        except aiohttp.ClientError as e:
+            raise APIError(f"Batch API request failed: {str(e)}")
+        if response.status != 200:
+            error_text = await response.text()
+            response.release()
+            raise APIError(
+                f"Batch API returned {response.status}: {error_text}",
+                status=response.status,
+                retry_after=parse_retry_after(response.headers.get("Retry-After"))
+            )
+        return response
+
+    async def submit(self, jsonl: bytes) -> str:
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field("file", jsonl, filename="batch.jsonl", content_type="application/jsonl")
+        async with await self._request("POST", "/files", data=form) as response:
+            input_file_id = (await response.json())["id"]
+        async with await self._request("POST", "/batches", json={
+            "input_file_id": input_file_id,
+            "endpoint": CHAT_COMPLETIONS,
+            "completion_window": settings.LLM_BATCH_COMPLETION_WINDOW
+        }) as response:
+            return (await response.json())["id"]
+
+    async def status(self, batch_id: str) -> Dict[str, Any]:
+        async with await self._request("GET", f"/batches/{batch_id}") as response:
+            return await response.json()
+
+    async def content(self, file_id: str) -> bytes:
+        async with await self._request("GET", f"/files/{file_id}/content") as response:
+            return await response.read()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+class LocalBatchEndpoint(BatchEndpoint):
+    """
+    Stand-in for the Batch API that runs batches in this process.
+
+    Each line becomes a real-time call on the backend pool, a few at a time
+    (LLM_BATCH_LOCAL_CONCURRENCY) and in the scheduler's background lane, so
+    live story streams keep priority. For development, and for providers
+    without a batch endpoint.
+    """
+    poll_interval = 0.5
+
+    def __init__(self, backends: BackendPool, scheduler: FairScheduler):
+        self.backends = backends
+        self.scheduler = scheduler
+        self.limit = asyncio.Semaphore(settings.LLM_BATCH_LOCAL_CONCURRENCY)
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, bytes] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, jsonl: bytes) -> str:
+        batch_id = f"batch_local_{uuid4().hex}"
+        lines = [json.loads(line) for line in jsonl.splitlines() if line.strip()]
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0}
+        }
+        task = _detached(self._run(batch_id, lines))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return batch_id
+
+    async def _run(self, batch_id: str, lines: List[Dict[str, Any]]):
+        batch = self.batches[batch_id]
+        results = await asyncio.gather(*(self._run_line(line, batch["request_counts"]) for line in lines))
+        output_file_id = f"{batch_id}_output"
+        self.files[output_file_id] = b"".join(json.dumps(result).encode() + b"\n" for result in results)
+        batch.update(status="completed", output_file_id=output_file_id)
+
+    async def _run_line(self, line: Dict[str, Any], counts: Dict[str, int]) -> Dict[str, Any]:
+        custom_id = line["custom_id"]
+        body = line["body"]
+        async with self.limit, self.scheduler.slot("batch"):
+            try:
+                backend = self.backends.select()
+                reserved = len(json.dumps(body)) // 4 + (body.get("max_tokens") or 0)
+                await backend.rate_limiter.acquire(tokens=reserved)
+                async with backend.call():
+                    response = await backend.transport.post_json(
+                        backend.api_url, backend.headers(), body, timeout=settings.LLM_REQUEST_TIMEOUT
+                    )
+                usage = TokenUsage.from_response(response.get("usage"))
+                if usage is not None:
+                    await backend.rate_limiter.refund(reserved - usage.total_tokens)
+            except Exception as e:
+                # A failed line fails alone, like it would upstream
+                counts["failed"] += 1
+                return _error_line(custom_id, str(e) or type(e).__name__, getattr(e, "status", None))
+        counts["completed"] += 1
+        return {"custom_id": custom_id, "response": {"status_code": 200, "body": response}, "error": None}
+
+    async def status(self, batch_id: str) -> Dict[str, Any]:
+        if batch_id not in self.batches:
+            raise APIError(f"No such batch: {batch_id}", status=404)
+        return dict(self.batches[batch_id])
+
+    async def content(self, file_id: str) -> bytes:
+        # Results are read once, and the batch is forgotten with them
+        if file_id not in self.files:
+            raise APIError(f"No such file: {file_id}", status=404)
+        self.batches.pop(file_id.removesuffix("_output"), None)
+        return self.files.pop(file_id)
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+def _window_seconds(window: str) -> float:
+    """Seconds in a completion window such as "24h" (units: s, m, h, d)"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return float(window[:-1]) * units[window[-1]]
+
+def create_batch_endpoint(backends: BackendPool, scheduler: FairScheduler) -> BatchEndpoint:
+    """The batch endpoint selected by LLM_BATCH_ENDPOINT ("local" or "openai")"""
+    kind = settings.LLM_BATCH_ENDPOINT.lower()
+    if kind == "openai":
+        return OpenAIBatchEndpoint()
+    if kind != "local":
+        logger.warning(f"Unknown LLM_BATCH_ENDPOINT '{kind}'; running batches locally")
+    return LocalBatchEndpoint(backends, scheduler)
+
+@dataclass(frozen=True)
+class _Queued:
+    custom_id: str
+    feature: str
+    body: bytes
+    callback: BatchCallback
+    context: LLMCallContext
+
+class BatchLane:
+    """
+    Collects non-interactive completions into batches for a BatchEndpoint.
+
+    Requests wait until LLM_BATCH_MAX_REQUESTS have queued or the oldest
+    has waited LLM_BATCH_MAX_WAIT seconds, then go out as one JSONL batch.
+    Each batch is polled until it finishes and every request's callback is
+    called with its BatchResult, a failed or lost request included. Token
+    usage is accounted under "batch:<feature>", keeping batch turnaround out
+    of the real-time latency statistics.
+
+    Queued and submitted requests live in this process only. Closing the
+    lane calls every outstanding callback with a retryable failure; work
+    that must survive a restart is re-driven by its owner (see
+    src/features/penpal/service.py).
+    """
+    def __init__(self, endpoint: BatchEndpoint, usage: UsageTracker):
+        self.endpoint = endpoint
+        self.usage = usage
+        self.pending: List[_Queued] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+
+        # Monitoring counters
+        self.batches_submitted = 0
+        self.batches_failed = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.turnaround = 0.0
+
+    @property
+    def max_turnaround(self) -> Optional[float]:
+        """Longest a request may wait for its result, if the endpoint bounds it"""
+        if self.endpoint.max_turnaround is None:
+            return None
+        return settings.LLM_BATCH_MAX_WAIT + self.endpoint.max_turnaround
+
+    async def add(self, feature: str, body: bytes, callback: BatchCallback, context: LLMCallContext):
+        """Queue one chat completion request body; `callback` receives its BatchResult"""
+        self.pending.append(_Queued(uuid4().hex, feature, body, callback, context))
+        if len(self.pending) >= settings.LLM_BATCH_MAX_REQUESTS:
+            # Not awaited here: the upload must not run under this caller's deadline or cancellation
+            self._flush_detached()
+        elif self._timer is None:
+            self._timer = _detached(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(settings.LLM_BATCH_MAX_WAIT)
+        self._timer = None
+        self._flush_detached()
+
+    def _flush_detached(self):
+        """flush() in a task of its own, tracked with the batches so close() sees its submit"""
+        task = _detached(self.flush())
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def flush(self):
+        """Submit everything queued as one batch now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        queued, self.pending = self.pending, []
+        if not queued:
+            return
+        # Bodies are already encoded; each line splices one in
+        jsonl = b"".join(
+            json.dumps({"custom_id": q.custom_id, "method": "POST", "url": CHAT_COMPLETIONS})[:-1].encode()
+            + b', "body": ' + q.body + b"}\n"
+            for q in queued
+        )
+        self.in_flight += len(queued)
+        try:
+            batch_id = await self.endpoint.submit(jsonl)
+        except asyncio.CancelledError:
+            # Whether the provider got the batch is unknown; its results would never be collected
+            await self._dispatch(queued, {}, time.monotonic(), LANE_CLOSED, retryable=True)
+            raise
+        except Exception as e:
+            logger.error(f"Submitting a batch of {len(queued)} requests failed: {e}")
+            self.batches_failed += 1
+            await self._dispatch(queued, {}, time.monotonic(), f"Batch submission failed: {e}")
+            return
+        self.batches_submitted += 1
+        logger.info(f"Submitted batch {batch_id} with {len(queued)} requests")
+        task = _detached(self._collect(batch_id, queued, time.monotonic()))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _collect(self, batch_id: str, queued: List[_Queued], submitted_at: float):
+        """Poll a batch until it finishes, then hand every request its result"""
+        try:
+            lines, reason = await self._poll(batch_id)
+        except asyncio.CancelledError:
+            await self._dispatch(queued, {}, submitted_at, LANE_CLOSED, retryable=True)
+            raise
+        await self._dispatch(queued, lines, submitted_at, reason)
+
+    async def _poll(self, batch_id: str):
+        """The output lines of a finished batch by custom_id, and why any are missing"""
+        lines: Dict[str, Dict[str, Any]] = {}
+        reason = None
+        try:
+            while True:
+                await asyncio.sleep(self.endpoint.poll_interval)
+                try:
+                    batch = await self.endpoint.status(batch_id)
+                except APIError as e:
+                    if e.status is not None and e.status < 500 and e.status != 429:
+                        raise
+                    logger.warning(f"Polling batch {batch_id} failed ({e}); will retry")
+                    continue
+                if batch.get("status") in TERMINAL_STATES:
+                    break
+            if batch["status"] != "completed":
+                self.batches_failed += 1
+                reason = f"Batch {batch['status']}"
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if file_id:
+                    for raw in (await self.endpoint.content(file_id)).splitlines():
+                        if raw.strip():
+                            line = json.loads(raw)
+                            lines[line["custom_id"]] = line
+        except Exception as e:
+            logger.error(f"Collecting batch {batch_id} failed: {e}")
+            self.batches_failed += 1
+            reason = f"Batch results unavailable: {e}"
+        return lines, reason
+
+    async def _dispatch(
+        self,
+        queued: List[_Queued],
+        lines: Dict[str, Dict[str, Any]],
+        submitted_at: float,
+        reason: Optional[str],
+        retryable: bool = False
+    ):
+        turnaround = time.monotonic() - submitted_at
+        for q in queued:
+            result = self._result(q, lines.get(q.custom_id), turnaround, reason, retryable)
+            self.in_flight -= 1
+            if result.ok:
+                self.completed += 1
+                self.turnaround += turnaround
+            else:
+                self.failed += 1
+            try:
+                await q.callback(result)
+            except Exception as e:
+                logger.error(f"Batch callback for {q.feature} failed: {e}")
+
+    def _result(
+        self,
+        q: _Queued,
+        line: Optional[Dict[str, Any]],
+        turnaround: float,
+        reason: Optional[str],
+        retryable: bool = False
+    ) -> BatchResult:
+        if line is None:
+            return BatchResult(None, reason or "Missing from the batch output", retryable)
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or body.get("error") or {}
+            return BatchResult(None, error.get("message") or f"HTTP {response.get('status_code')}")
+        try:
+            content = body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            return BatchResult(None, "Batch response missing choices")
+        usage = TokenUsage.from_response(body.get("usage")) or TokenUsage.estimate(len(q.body), len(content or ""))
+        self.usage.record(f"batch:{q.feature}", usage, turnaround, q.context)
+        return BatchResult(content)
+
+    async def drain(self):
+        """Submit what is queued and wait until every batch has been dispatched"""
+        await self.flush()
+        while self._batches:
+            await asyncio.gather(*list(self._batches), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "endpoint": type(self.endpoint).__name__,
+            "queued": len(self.pending),
+            "in_flight": self.in_flight,
+            "batches_submitted": self.batches_submitted,
+            "batches_failed": self.batches_failed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "mean_turnaround_seconds": round(self.turnaround / self.completed, 2) if self.completed else None
+        }
+
+    async def close(self):
+        """Stop polling; requests still queued or in flight get a retryable failure"""
+        if self.pending or self.in_flight:
+            logger.warning(f"Abandoning {len(self.pending) + self.in_flight} batched LLM requests at shutdown")
+        tasks = [t for t in (self._timer, *self._batches) if t is not None]
+        self._timer = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        queued, self.pending = self.pending, []
+        self.in_flight += len(queued)
+        await self._dispatch(queued, {}, time.monotonic(), LANE_CLOSED, retryable=True)
+        await self.endpoint.close()
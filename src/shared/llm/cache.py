@@ -1,48 +1,193 @@
-from typing import Dict, Any, Optional
-from datetime import datetime
+from typing import Any, Optional, Dict, Tuple
+from collections import OrderedDict
+import sys
+import time
 import logging
 
+from src.core.config import settings
+
 logger = logging.getLogger(__name__)
 
 class ResponseCache:
-    def __init__(self, ttl_seconds: int = 300):
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.ttl_seconds = ttl_seconds
-        self.last_cleanup = datetime.now()
-    
-    def get(self, key: str) -> Optional[str]:
-        """Get cache entry if exists and is valid"""
-        current_time = datetime.now()
-        
-        # Check if we need to clean cache (every 5 minutes)
-        if (current_time - self.last_cleanup).total_seconds() > 300:
-            self.cleanup()
-            self.last_cleanup = current_time
-        
+    """
+    Bounded LRU cache with per-entry TTL for LLM responses.
+
+    Every operation is O(1): entries live in an OrderedDict in recency order,
+    expiry is checked lazily when an entry is read, and the least recently
+    used entries are evicted whenever `max_entries` or `max_bytes` would be
+    exceeded. Times come from the monotonic clock so wall-clock jumps never
+    expire (or resurrect) entries.
+    """
+    # Approximate bookkeeping overhead per entry (tuple, dict slot, key object)
+    ENTRY_OVERHEAD = 120
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.ttl_seconds = ttl_seconds or settings.LLM_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.LLM_CACHE_MAX_BYTES
+        # key -> (value, expires_at, size)
+        self.cache: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self.bytes_used = 0
+
+        # Monitoring counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def _size_of(cls, key: str, value: Any) -> int:
+        return sys.getsizeof(key) + cls._deep_size(value) + cls.ENTRY_OVERHEAD
+
+    @classmethod
+    def _deep_size(cls, value: Any) -> int:
+        """Footprint of a value including the items of lists (e.g. recorded stream chunks) and dicts (parsed JSON)"""
+        size = sys.getsizeof(value)
+        if isinstance(value, (list, tuple)):
+            size += sum(cls._deep_size(item) for item in value)
+        elif isinstance(value, dict):
+            size += sum(cls._deep_size(k) + cls._deep_size(v) for k, v in value.items())
+        return size
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, response: Any, ttl: Optional[float] = None, size: Optional[int] = None):
+        """
+        Cache a response for `ttl` seconds (defaults to the cache TTL).
+
+        `size` overrides the estimated footprint in bytes, for values whose
+        sys.getsizeof doesn't reflect what they hold.
+        """
+        size = size if size is not None else self._size_of(key, response)
+        if size > self.max_bytes:
+            # Would evict everything else and still not fit
+            return
         if key in self.cache:
-            entry = self.cache[key]
-            # Check if entry is still valid
-            if (current_time - entry['timestamp']).total_seconds() < self.ttl_seconds:
-                return entry['response']
-        return None
-    
-    def set(self, key: str, response: str):
-        """Cache a response"""
-        self.cache[key] = {
-            'response': response,
-            'timestamp': datetime.now()
-        }
-    
+            self._remove(key)
+        self.cache[key] = (response, time.monotonic() + (ttl or self.ttl_seconds), size)
+        self.bytes_used += size
+        while len(self.cache) > self.max_entries or self.bytes_used > self.max_bytes:
+            _, (_, _, evicted_size) = self.cache.popitem(last=False)
+            self.bytes_used -= evicted_size
+            self.evictions += 1
+
+    def delete(self, key: str):
+        """Drop an entry if present"""
+        if key in self.cache:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        _, _, size = self.cache.pop(key)
+        self.bytes_used -= size
+
     def cleanup(self):
-        """Clean up expired cache entries"""
-        current_time = datetime.now()
-        keys_to_delete = []
-        
-        for key, entry in self.cache.items():
-            if (current_time - entry['timestamp']).total_seconds() > self.ttl_seconds:
-                keys_to_delete.append(key)
-                
-        for key in keys_to_delete:
-            del self.cache[key]
-        
-        logger.info(f"Cache cleanup: removed {len(keys_to_delete)} expired entries")
\ No newline at end of file
+        """Drop every expired entry (O(n); reads already expire entries lazily)"""
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at, _) in self.cache.items() if expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        logger.info(f"Cache cleanup: removed {len(expired)} expired entries")
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Occupancy and hit/miss/eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.cache),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class TieredResponseCache:
+    """
+    In-process ResponseCache (L1) in front of an optional shared Redis tier (L2).
+
+    Reads try L1 first; an L1 miss that hits L2 fills L1 for the entry's
+    remaining lifetime, so other workers' completions are reused without
+    another upstream call. Writes go to both tiers with a per-feature TTL
+    (LLM_CACHE_FEATURE_TTLS); a TTL of 0 disables caching for that feature.
+    """
+    def __init__(self, l1: Optional[ResponseCache] = None, l2=None):
+        self.l1 = l1 or ResponseCache()
+        self.l2 = l2
+
+    def ttl_for(self, feature: str) -> float:
+        """Cache lifetime in seconds for a feature's responses"""
+        return settings.LLM_CACHE_FEATURE_TTLS.get(feature, self.l1.ttl_seconds)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value from L1, falling back to L2"""
+        value = self.l1.get(key)
+        if value is not None or self.l2 is None:
+            return value
+        found = await self.l2.get(key)
+        if found is None:
+            return None
+        value, remaining_ttl = found
+        self.l1.set(key, value, ttl=remaining_ttl)
+        return value
+
+    async def set(self, key: str, response: Any, feature: str = "default"):
+        """Cache a response in both tiers for the feature's TTL"""
+        ttl = self.ttl_for(feature)
+        if ttl <= 0:
+            return
+        self.l1.set(key, response, ttl=ttl)
+        if self.l2 is not None:
+            await self.l2.set(key, response, ttl)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-tier occupancy and hit rates"""
+        return {
+            "l1": self.l1.get_stats(),
+            "l2": self.l2.get_stats() if self.l2 is not None else None
+        }
+
+
+def create_response_cache() -> TieredResponseCache:
+    """
+    Build the response cache selected by LLM_CACHE_BACKEND.
+
+    "local" keeps completions in this process only; "redis" adds the shared
+    L2 tier so every worker and instance reuses them.
+    """
+    backend = settings.LLM_CACHE_BACKEND.lower()
+    l2 = None
+    if backend == "redis":
+        try:
+            from .redis_cache import RedisResponseCache
+            l2 = RedisResponseCache()
+        except Exception as e:
+            logger.warning(f"Redis response cache unavailable ({e}); using in-process cache only")
+    elif backend != "local":
+        logger.warning(f"Unknown LLM_CACHE_BACKEND '{backend}'; using in-process cache only")
+    return TieredResponseCache(l2=l2)
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Set
+import asyncio
+import weakref
+
+# Why work was cancelled, as counted in the usage stats
+SUPERSEDED = "superseded"
+DISCONNECTED = "disconnected"
+
+class CancellationToken:
+    """
+    Cancels the work done for one client request, e.g. one WebSocket message.
+
+    Code that may be interrupted runs inside `guard()`; `cancel()` then
+    cancels the guarded task at once, so an LLM call in progress raises
+    CancelledError and drops its upstream request. Work outside a guard
+    (saving the user's message, say) is left to finish. LLM calls made
+    inside the guard see the token through get_cancellation_token() and
+    count the tokens the cancellation saved. Cancelling a token cancels the
+    tokens created with it as `parent`, so a connection's token covers
+    every message received on it.
+    """
+    def __init__(self, parent: Optional["CancellationToken"] = None):
+        self.reason: Optional[str] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._children: "weakref.WeakSet[CancellationToken]" = weakref.WeakSet()
+        if parent is not None:
+            parent._children.add(self)
+            self.reason = parent.reason
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        """Cancel the guarded work (False if already cancelled)"""
+        if self.reason is not None:
+            return False
+        self.reason = reason
+        for child in list(self._children):
+            child.cancel(reason)
+        for task in list(self._tasks):
+            task.cancel(reason)
+        return True
+
+    @contextmanager
+    def guard(self) -> Iterator["CancellationToken"]:
+        """Let cancel() interrupt the current task while it is inside the block"""
+        if self.reason is not None:
+            raise asyncio.CancelledError(self.reason)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        bound = _cancellation.set(self)
+        try:
+            yield self
+        finally:
+            _cancellation.reset(bound)
+            self._tasks.discard(task)
+
+_cancellation: ContextVar[Optional[CancellationToken]] = ContextVar("llm_cancellation", default=None)
+
+def get_cancellation_token() -> Optional[CancellationToken]:
+    """The token guarding the current context, if any"""
+    return _cancellation.get()
@@ -0,0 +1,196 @@
+from typing import Optional, Dict, Any
+from contextlib import asynccontextmanager
+import asyncio
+import random
+import time
+import logging
+
+from src.core.config import settings
+from .exceptions import APIError, CircuitOpenError
+from .concurrency import is_overload_status
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Full-jitter exponential backoff before retry number `attempt` + 1.
+
+    Never shorter than the provider's Retry-After, when it sent one.
+    """
+    ceiling = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker for one upstream endpoint.
+
+    `failure_threshold` consecutive timeouts, 429s or 5xx open the circuit,
+    and an overload response carrying Retry-After opens it for as long as
+    the provider asked. While open, calls fail at
+    once with CircuitOpenError. After the cool-down a few probe calls are let
+    through (half-open): a success closes the circuit, a failure re-opens it
+    with a doubled cool-down (plus jitter, capped at `max_recovery_timeout`,
+    and never shorter than the provider's Retry-After).
+    """
+    JITTER = 0.2
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        recovery_timeout: Optional[float] = None,
+        max_recovery_timeout: Optional[float] = None,
+        half_open_probes: Optional[int] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.LLM_CIRCUIT_FAILURE_THRESHOLD
+        self.recovery_timeout = recovery_timeout or settings.LLM_CIRCUIT_RECOVERY_TIMEOUT
+        self.max_recovery_timeout = max_recovery_timeout or settings.LLM_CIRCUIT_MAX_RECOVERY_TIMEOUT
+        self.half_open_probes = half_open_probes or settings.LLM_CIRCUIT_HALF_OPEN_PROBES
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._consecutive_failures = 0
+        # Consecutive trips without a success in between; doubles the cool-down
+        self._trips = 0
+        self._probes_in_flight = 0
+        # When the circuit last closed again after a trip (None if it never tripped)
+        self.recovered_at: Optional[float] = None
+
+        # Monitoring counters
+        self.opened = 0
+        self.rejected = 0
+        self.failures = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() >= self._open_until:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            logger.info(f"Circuit for {self.name} half-open; probing")
+        return self._state
+
+    def open_for(self) -> float:
+        """Seconds until an open circuit starts probing (0 unless open)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def admits(self) -> bool:
+        """Whether a call now would be let through"""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and self._probes_in_flight < self.half_open_probes)
+
+    def check(self):
+        """Raise CircuitOpenError if a call now would be refused (claims nothing)"""
+        if not self.admits():
+            self.rejected += 1
+            retry_after = self.open_for() if self._state == OPEN else None
+            raise CircuitOpenError(f"Circuit open for {self.name}; failing fast", retry_after=retry_after)
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError; returns True if the call is a half-open probe"""
+        self.check()
+        if self._state == HALF_OPEN:
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def _end_probe(self, probe: bool):
+        if probe:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_success(self, probe: bool = False):
+        self._end_probe(probe)
+        if self._state != CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+            self.recovered_at = time.monotonic()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._trips = 0
+
+    def record_failure(self, probe: bool = False, retry_after: Optional[float] = None):
+        self._end_probe(probe)
+        self.failures += 1
+        self._consecutive_failures += 1
+        if self._state == OPEN:
+            # A call admitted before the trip; only a longer Retry-After matters now
+            if retry_after is not None:
+                self._open_until = max(self._open_until, time.monotonic() + retry_after)
+            return
+        if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._trip(retry_after)
+        elif retry_after is not None:
+            # The provider told us when to come back; no need to guess
+            self._open_for(retry_after)
+
+    def release(self, probe: bool = False):
+        """End a call that told us nothing about the endpoint (e.g. cancelled)"""
+        self._end_probe(probe)
+
+    def _trip(self, retry_after: Optional[float]):
+        cooldown = min(self.max_recovery_timeout, self.recovery_timeout * (2 ** self._trips))
+        cooldown *= random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        if retry_after is not None:
+            cooldown = max(cooldown, retry_after)
+        self._trips += 1
+        self._open_for(cooldown)
+
+    def _open_for(self, seconds: float):
+        self._state = OPEN
+        self._open_until = time.monotonic() + seconds
+        self.opened += 1
+        logger.warning(
+            f"Circuit for {self.name} open for {seconds:.1f}s after "
+            f"{self._consecutive_failures} consecutive failure(s)"
+        )
+
+    @asynccontextmanager
+    async def guard(self):
+        """Admit one request and record its outcome"""
+        probe = self.before_call()
+        try:
+            yield
+        except asyncio.TimeoutError:
+            self.record_failure(probe)
+            raise
+        except APIError as e:
+            if e.status is None or is_overload_status(e.status):
+                self.record_failure(probe, retry_after=e.retry_after)
+            else:
+                # The endpoint answered; the request itself was at fault
+                self.record_success(probe)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        else:
+            self.record_success(probe)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Current state and trip counters"""
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self._consecutive_failures,
+            "open_for_seconds": round(self.open_for(), 2),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "failures": self.failures
+        }
+
+# One breaker per upstream endpoint, shared by every client in the process
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for `endpoint`"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
@@ -1,179 +1,205 @@
-from typing import Optional, Dict, Any, Union, AsyncIterator
-import aiohttp
+from typing import Optional, Dict, Any, List, Union, AsyncIterator, Awaitable, Callable
 import asyncio
 import json
 import logging
 import re
 import hashlib
+import time
+from dataclasses import replace
 from datetime import datetime
 
 from src.core.config import settings
-from .rate_limiter import RateLimiter, RateLimitError
-from .cache import ResponseCache
+from src.core.deadline import DeadlineExceededError, budget, current_deadline, deadline_stats
+from .exceptions import LLMError, APIError, BudgetExceededError, CircuitOpenError, ResponseParsingError, StreamError, StreamTimeoutError
+from .rate_limiter import RateLimitError
+from .cache import create_response_cache
+from .transport import LLMTransport
+from .scheduler import FairScheduler
+from .concurrency import is_overload_status
+from .singleflight import SingleFlight
+from .similarity_cache import SimilarityCache, SimilarityKey
+from .hedging import HEDGE_LOST, RequestHedger
+from .circuit_breaker import backoff_delay
+from .backends import BackendPool, LLMBackend, create_backend_pool
+from .routing import ModelRoute, ModelRouter
+from .profiles import GenerationProfile, GenerationProfiles
+from .context import LLMCallContext, attribution_only_context, get_llm_context
+from .cancellation import get_cancellation_token
+from .messages import Message, MessageList, parse_prompt, fragment_cache_stats
+from .sse import DONE, JSONDecodeError, SSEParser, delta_content, loads
+from .usage import TokenUsage, UsageTracker
+from .structured import JsonSchema, parse_json_object
+from .batch import BatchCallback, BatchLane, create_batch_endpoint
 
 logger = logging.getLogger(__name__)
 
-class LLMError(Exception):
-    """Base exception for LLM-related errors"""
-    pass
+# Bump when the request shape changes so stale shared cache entries are ignored
+CACHE_KEY_VERSION = "v3"
 
-class APIError(LLMError):
-    """Exception raised for API errors"""
-    pass
-
-class ResponseParsingError(LLMError):
-    """Exception raised when response parsing fails"""
-    pass
+# Messages as a plain list or pre-encoded in a MessageList
+Messages = Union[MessageList, List[Message]]
 
 class LLMClient:
-    def __init__(self):
-        self.api_key = settings.OPENAI_API_KEY
-        self.model_name = settings.MODEL_NAME
-        self.rate_limiter = RateLimiter()
-        self.session: Optional[aiohttp.ClientSession] = None
+    def __init__(self, transport: Optional[LLMTransport] = None, backends: Optional[BackendPool] = None):
+        # Which model serves each feature, with its timeout and fallback model
+        self.router = ModelRouter()
+        # Named max_tokens/stop/temperature/response format settings per kind of call
+        self.profiles = GenerationProfiles()
+        # Fair-share admission of calls across users and features
+        self.scheduler = FairScheduler()
+        # Endpoints/keys to spread calls over, each with its own quota and circuit breaker.
+        # All clients share the process-wide connection pools unless given their own transport
+        self.backends = backends or create_backend_pool(transport)
         self.retry_attempts = 3
-        self.retry_delay = 1
-        self.response_cache = ResponseCache()
+        self.response_cache = create_response_cache()
+        self.inflight = SingleFlight()
+        self.similarity_cache = SimilarityCache()
+        self.hedger = RequestHedger()
+        # Tokens and latency per feature/user/session, and session token budgets
+        self.usage = UsageTracker()
+        # Non-interactive work goes out in JSONL batches instead of real-time calls
+        self.batch = BatchLane(create_batch_endpoint(self.backends, self.scheduler), self.usage)
         
-    def _calculate_cache_key(self, prompt: str) -> str:
-        """Calculate a cache key for a prompt"""
-        return hashlib.md5(prompt.encode('utf-8')).hexdigest()
+    def _calculate_cache_key(
+        self,
+        messages: MessageList,
+        stream: bool = False,
+        model: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+        structured: bool = False
+    ) -> str:
+        """
+        Cache key covering the messages and every parameter that shapes the completion.
 
-    async def _ensure_session(self):
-        """Ensure session exists and is active"""
-        timeout = aiohttp.ClientTimeout(total=10)  # 10 seconds total timeout
-        
+        The messages contribute their running digest, so the conversation is
+        never re-serialized or re-hashed here. `structured` keys parsed
+        objects apart from raw text for the same request.
+        """
+        profile = profile or self.profiles.resolve(None, "default")
+        fields = {
+            "model": model or self.router.default.model,
+            **profile.request_params(),
+            "stream": stream
+        }
+        if structured:
+            fields["structured"] = True
+        header = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+        fingerprint = hashlib.sha256(header.encode("utf-8"))
+        fingerprint.update(messages.digest())
+        return f"{CACHE_KEY_VERSION}:{fingerprint.hexdigest()}"
+
+    def _estimate_tokens(self, prompt_size: int, max_tokens: Optional[int] = None) -> int:
+        """Estimate the tokens a request consumes: ~4 bytes of prompt per token plus max_tokens"""
+        return prompt_size // 4 + 1 + (settings.MAX_TOKENS if max_tokens is None else max_tokens)
+
+    def _request_body(self, messages: MessageList, route: ModelRoute, profile: GenerationProfile, stream: bool = False) -> bytes:
+        """Chat completion request body, with the pre-encoded messages spliced in"""
+        params: Dict[str, Any] = {"model": route.model, **profile.request_params()}
+        if stream:
+            params["stream"] = True
+            if settings.LLM_STREAM_INCLUDE_USAGE:
+                params["stream_options"] = {"include_usage": True}
+        head = json.dumps(params, separators=(",", ":")).encode("utf-8")
+        return head[:-1] + b',"messages":' + messages.encoded() + b"}"
+
+    async def generate(
+        self,
+        prompt: str,
+        expect_json: bool = False,
+        feature: str = "default",
+        similarity_key: Optional[SimilarityKey] = None,
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> Any:
+        """Generate a response for a prompt given as a JSON-encoded message list (see generate_messages)"""
         try:
-            current_loop = asyncio.get_running_loop()
-            
-            # Check if we need to create a new session
-            if self.session is None or self.session.closed:
-                # Create new session
-                if self.session is not None and self.session.closed:
-                    logger.info("Session exists but is closed - creating new session")
-                else:
-                    logger.info("No session exists - creating new session")
-                
-                self.session = aiohttp.ClientSession(timeout=timeout)
-                self.session_loop = current_loop
-                logger.info("Created new aiohttp session")
-            else:
-                # Check if session belongs to current event loop
-                if hasattr(self, 'session_loop') and self.session_loop is not current_loop:
-                    logger.warning("Session belongs to a different event loop - creating new session")
-                    old_session = self.session
-                    self.session = None
-                    # Close in background without awaiting to avoid cross-loop problems
-                    asyncio.create_task(self._close_session_safe(old_session))
-                    self.session = aiohttp.ClientSession(timeout=timeout)
-                    self.session_loop = current_loop
-        except RuntimeError as e:
-            logger.error(f"RuntimeError in _ensure_session: {e}")
-            # This can happen if we're not in an async context
-            self.session = None
-            self.session_loop = None
-            # Create a new session anyway
-            try:
-                self.session = aiohttp.ClientSession(timeout=timeout)
-                logger.info("Created new session after RuntimeError")
-            except Exception as session_error:
-                logger.error(f"Failed to create session after RuntimeError: {session_error}")
-                raise APIError(f"Cannot create API session: {session_error}")
-        except Exception as e:
-            logger.error(f"Unexpected error in _ensure_session: {e}")
-            self.session = None
-            self.session_loop = None
-            raise APIError(f"Failed to ensure API session: {e}")
-                
-        return self.session
+            messages = parse_prompt(prompt)
+        except ValueError as e:
+            logger.error(f"Failed to parse prompt string as JSON list: {e}. Prompt was: {prompt[:500]}...")
+            if expect_json:
+                return self._get_fallback_json_response(f"Invalid prompt format: {str(e)}")
+            return "I'm afraid there was an unexpected complication. Let us focus on the facts we've gathered so far."
+        return await self.generate_messages(
+            messages, expect_json=expect_json, feature=feature, similarity_key=similarity_key, profile=profile
+        )
 
-    async def _close_session_safe(self, session):
-        """Safely close a session without expecting it to work"""
-        if session and not session.closed:
-            try:
-                await session.close()
-                logger.info("Closed aiohttp session successfully")
-            except Exception as e:
-                logger.warning(f"Error closing session: {e}")
+    async def generate_messages(
+        self,
+        messages: Messages,
+        expect_json: bool = False,
+        feature: str = "default",
+        similarity_key: Optional[SimilarityKey] = None,
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> Any:
+        """
+        Generate LLM response with high-performance optimizations.
+
+        `messages` is a list of chat messages or a MessageList; each message
+        is encoded once and spliced into the request body.
+        `feature` tags the call site (e.g. "story", "hints", "moderation") for
+        fair scheduling between users and between interactive and background work,
+        and picks the model route from LLM_MODEL_ROUTES.
+        `similarity_key` lets features in LLM_SIMILARITY_CACHE_FEATURES reuse
+        the response to a near-duplicate text within the same scope.
+        `profile` (a GenerationProfile or its name) sets max_tokens, stop
+        sequences, temperature and response format; defaults to the feature's.
 
-    async def generate(self, prompt: str, expect_json: bool = False) -> Any:
-        """Generate LLM response with high-performance optimizations"""
+        Raises BudgetExceededError, instead of returning a fallback, when the
+        session is over its token budget for this feature (callers skip the
+        feature); every other failure returns a fallback response. Inside a
+        CancellationToken's guard, cancelling the token abandons the call
+        (CancelledError) and counts the tokens that saved. Under a request
+        deadline (src.core.deadline) a call, or a retry, that could not
+        finish in the time left is not started and the fallback is returned.
+        """
         try:
-            # Ensure we have a valid session
-            self.session = await self._ensure_session()
-            if not self.session:
-                logger.error("Failed to create a valid session")
-                if expect_json:
-                    return self._get_fallback_json_response("Failed to initialize API session")
-                else:
-                    return "I'm afraid I cannot provide a response at the moment due to technical difficulties."
-            
-            # Check cache
-            cache_key = self._calculate_cache_key(prompt)
-            cached_result = self.response_cache.get(cache_key)
-            if cached_result:
-                return cached_result
-            
-            # Execute with retries
-            for attempt in range(self.retry_attempts):
-                try:
-                    # Check rate limit
-                    await self.rate_limiter.acquire()
-                    
-                    # Make API request
-                    response = await self._make_api_request(prompt)
-                    
-                    # Cache the result
-                    self.response_cache.set(cache_key, response)
-                    
-                    # Parse response for JSON if needed
-                    if expect_json:
-                        try:
-                            return json.loads(response)
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON parsing error: {str(e)}")
-                            return self._get_fallback_json_response(f"Failed to parse JSON response: {str(e)}")
-                    return response
-                    
-                except RateLimitError:
-                    raise
-                
-                except asyncio.TimeoutError as e:
-                    logger.warning(f"Timeout error on attempt {attempt+1}: {str(e)}")
-                    if attempt == self.retry_attempts - 1:
-                        logger.error(f"Final timeout error after {self.retry_attempts} attempts")
-                        if expect_json:
-                            return self._get_fallback_json_response("Request timed out")
-                        else:
-                            return "I need a moment to gather my thoughts. The case presents some intriguing elements that require careful consideration."
-                    await asyncio.sleep(self.retry_delay * (attempt + 1))
-                    # Create a new session for the next attempt
-                    if self.session and not self.session.closed:
-                        await self._close_session_safe(self.session)
-                    self.session = None
-                    self.session = await self._ensure_session()
-                    
-                except Exception as e:
-                    logger.error(f"Error on attempt {attempt+1}: {str(e)}")
-                    if attempt == self.retry_attempts - 1:
-                        logger.error(f"Final error after {self.retry_attempts} attempts")
-                        if expect_json:
-                            return self._get_fallback_json_response(f"API error: {str(e)}")
-                        else:
-                            return "I'm afraid there was an unexpected complication. Let us focus on the facts we've gathered so far."
-                    await asyncio.sleep(self.retry_delay * (attempt + 1))
-                    
-                    # Try to recreate the session but handle errors
-                    if self.session and not self.session.closed:
-                        await self._close_session_safe(self.session)
-                    self.session = None
-                    try:
-                        self.session = await self._ensure_session()
-                    except Exception as session_error:
-                        logger.error(f"Failed to recreate session: {session_error}")
+            if expect_json:
+                return await self.generate_object(messages, feature=feature, similarity_key=similarity_key, profile=profile)
+            return await self._complete(MessageList.of(messages), feature, similarity_key, self.profiles.resolve(profile, feature))
+
+        except BudgetExceededError:
+            raise
+
+        except ResponseParsingError as e:
+            logger.error(f"JSON parsing error: {str(e)}")
+            return self._get_fallback_json_response(f"Failed to parse JSON response: {str(e)}")
+
+        except RateLimitError as e:
+            logger.error(f"Rate limited in generate: {e}")
+            if expect_json:
+                return self._get_fallback_json_response(f"Unexpected error: {str(e)}")
+            else:
+                return "I apologize, but I seem to be experiencing some technical difficulties. Let's focus on the evidence at hand."
+        
+        except CircuitOpenError as e:
+            logger.warning(f"Failing fast in generate: {e}")
+            if expect_json:
+                return self._get_fallback_json_response(f"API error: {str(e)}")
+            else:
+                return "I'm afraid there was an unexpected complication. Let us focus on the facts we've gathered so far."
+
+        except asyncio.TimeoutError:
+            logger.error(f"Final timeout error after {self.retry_attempts} attempts")
+            if expect_json:
+                return self._get_fallback_json_response("Request timed out")
+            else:
+                return "I need a moment to gather my thoughts. The case presents some intriguing elements that require careful consideration."
+
+        except DeadlineExceededError as e:
+            logger.warning(f"Out of time in generate: {e}")
+            if expect_json:
+                return self._get_fallback_json_response("Request timed out")
+            else:
+                return "I need a moment to gather my thoughts. The case presents some intriguing elements that require careful consideration."
+        
+        except APIError as e:
+            logger.error(f"Final error after {self.retry_attempts} attempts")
+            if expect_json:
+                return self._get_fallback_json_response(f"API error: {str(e)}")
+            else:
+                return "I'm afraid there was an unexpected complication. Let us focus on the facts we've gathered so far."
                     
         except Exception as outer_e:
-            logger.error(f"Outer exception in generate: {outer_e}")
+            logger.error(f"Outer exception in generate_messages: {outer_e}")
             import traceback
             logger.error(traceback.format_exc())
             
@@ -182,147 +208,354 @@ class LLMClient:
             else:
                 return "I apologize, but I seem to be experiencing some technical difficulties. Let's focus on the evidence at hand."
     
-    async def _make_api_request(self, prompt: str) -> str:
-        """Make API request to OpenAI using the provided prompt string which is expected to be a JSON list of messages."""
-        try:
-            # Check for closed session before getting session
-            if self.session is not None and self.session.closed:
-                logger.warning("Session is closed before making request - reinitializing")
-                self.session = None
-                
-            session = await self._ensure_session()
-            if not session:
-                raise APIError("Failed to create a valid API session")
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Parse the incoming prompt string (expected to be JSON) into a message list
-            try:
-                messages = json.loads(prompt)
-                if not isinstance(messages, list):
-                    raise ValueError("Parsed prompt is not a list")
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"Failed to parse prompt string as JSON list: {e}. Prompt was: {prompt[:500]}...")
-                raise APIError(f"Invalid prompt format: Expected JSON list, received: {type(prompt)}")
-
-            data = {
-                "model": self.model_name,
-                "messages": messages, # Use the parsed message list directly
-                "temperature": settings.TEMPERATURE,
-                "max_tokens": settings.MAX_TOKENS,
-                "top_p": 0.9
-            }
-            
+    async def generate_object(
+        self,
+        messages: Messages,
+        schema: Optional[JsonSchema] = None,
+        feature: str = "default",
+        similarity_key: Optional[SimilarityKey] = None,
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate a JSON object using the provider's structured output mode.
+
+        `schema` (by default the profile's json_schema) is sent as the
+        json_schema response format and the reply is validated against it in
+        one pass. Validated objects are what get cached, so a cache hit does
+        no parsing. A reply that isn't a conforming object is retried like a
+        failed call and finally raises ResponseParsingError; other failures
+        raise too (no fallback object). The result is a copy the caller may
+        modify.
+        """
+        profile = self.profiles.resolve(profile, feature)
+        if schema is not None:
+            profile = replace(profile, json_schema=schema)
+        value = await self._complete(
+            MessageList.of(messages),
+            feature,
+            similarity_key,
+            profile,
+            parse=lambda raw: parse_json_object(raw, profile.json_schema)
+        )
+        return dict(value)
+
+    async def submit_batch(
+        self,
+        messages: Messages,
+        callback: BatchCallback,
+        feature: str = "default",
+        profile: Union[str, GenerationProfile, None] = None,
+        context: Optional[LLMCallContext] = None
+    ):
+        """
+        Queue a completion on the batch lane, for work nobody is waiting on.
+
+        Returns once the request is queued; `callback` is called with its
+        BatchResult when its batch completes, possibly hours later with the
+        provider's Batch API (LLM_BATCH_ENDPOINT). A profile with a
+        json_schema is sent as the structured response format, but the
+        callback gets the raw text to parse. Batched calls skip the response
+        cache; with the provider's Batch API they stay off the real-time
+        quota too, while the local stand-in runs them in the background lane.
+        Usage is attributed to `context`, by default the bound LLM context.
+        """
+        messages = MessageList.of(messages)
+        data = self._request_body(messages, self.router.route(feature), self.profiles.resolve(profile, feature))
+        await self.batch.add(feature, data, callback, context or get_llm_context())
+
+    async def _complete(
+        self,
+        messages: MessageList,
+        feature: str,
+        similarity_key: Optional[SimilarityKey],
+        profile: GenerationProfile,
+        parse: Optional[Callable[[str], Any]] = None
+    ) -> Any:
+        """The completion from cache, a near-duplicate or a (shared) upstream call; `parse` turns the text into what is cached"""
+        route = self.router.route(feature)
+        cache_key = self._calculate_cache_key(messages, model=route.model, profile=profile, structured=parse is not None)
+        response = await self.response_cache.get(cache_key)
+        if not response and similarity_key is not None:
+            response = self.similarity_cache.get(feature, similarity_key)
+        if not response:
+            # Cached answers are free; only new upstream calls count against the budget
+            self.usage.check(feature, get_llm_context())
+            # The shared call below runs without this caller's deadline, so check and enforce it here
+            self._check_deadline(feature)
+            stage = f"llm:{feature}"
+            # Identical prompts already in flight share one upstream request
             try:
-                # Double check session is still valid before making request
-                if session.closed:
-                    raise APIError("Session closed before making request")
-                    
-                async with session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=10
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise APIError(f"API returned {response.status}: {error_text}")
-                    
-                    response_data = await response.json()
-                    if 'choices' not in response_data or not response_data['choices']:
-                        raise APIError("API response missing choices")
-                    
-                    return response_data['choices'][0]['message']['content']
+                async with asyncio.timeout(budget(stage)) as wait:
+                    response = await self.inflight.do(
+                        cache_key,
+                        lambda: self._generate_uncached(messages, cache_key, route, profile, parse),
+                        # Scheduled and accounted to this caller if it starts the call
+                        context=attribution_only_context()
+                    )
+            except TimeoutError:
+                if wait.expired():
+                    raise current_deadline().expired(stage) from None
+                raise
             except asyncio.CancelledError:
-                # Properly handle cancellation
-                logger.warning("API request cancelled")
+                # The upstream request is only dropped if no other caller still wants it
+                if not self.inflight.waiters(cache_key):
+                    self._record_cancelled(feature, profile)
                 raise
-            except asyncio.TimeoutError:
-                raise APIError("API request timed out after 10 seconds")
-            except aiohttp.ClientError as e:
-                raise APIError(f"API request failed: {str(e)}")
-        except asyncio.CancelledError:
-            # Make sure to propagate cancellations
-            logger.warning("API request outer context cancelled")
-            raise
-        except Exception as e:
-            raise APIError(f"Error making API request: {str(e)}")
-    
-    async def _make_api_request_from_string(self, prompt_string: str) -> str:
-        """Make API request to OpenAI using a plain prompt string."""
-        try:
-            session = await self._ensure_session()
-            if not session:
-                raise APIError("Failed to create a valid API session")
+            if similarity_key is not None:
+                self.similarity_cache.set(feature, similarity_key, response)
+        return response
 
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+    async def _generate_uncached(
+        self,
+        messages: MessageList,
+        cache_key: str,
+        route: ModelRoute,
+        profile: GenerationProfile,
+        parse: Optional[Callable[[str], Any]] = None
+    ) -> Any:
+        """
+        Fetch a completion with retries and cache it; raises once every attempt has failed.
 
-            # Format the plain string prompt into the basic user message structure
-            messages = [{"role": "user", "content": prompt_string}]
+        Attempts after a failure use the route's fallback model, if it has one.
+        With `parse`, a reply it rejects (ResponseParsingError) counts as a
+        failed attempt and the parsed value is what gets cached.
+        """
+        feature = route.feature
+        # Backends already used for this call; retries prefer the others
+        tried: List[LLMBackend] = []
+        for attempt in range(self.retry_attempts):
+            try:
+                # Don't queue for a slot while every backend is known to be down
+                self.backends.check()
+                # Nor start a call the request deadline leaves no time to finish
+                self._check_deadline(feature)
+
+                # Wait for this user's fair turn, then for a backend's request and token budget
+                async with self.scheduler.slot(feature, get_llm_context().user_id):
+                    response = await self._call_backend(
+                        feature,
+                        messages,
+                        profile,
+                        lambda backend: self._post_completion(messages, backend, route, profile),
+                        tried
+                    )
+                if parse is not None:
+                    response = parse(response)
+                
+                # Cache the result
+                await self.response_cache.set(cache_key, response, feature=feature)
+                return response
+                
+            except (RateLimitError, DeadlineExceededError):
+                raise
+
+            except ResponseParsingError as e:
+                # The provider answered, just not with a conforming object; ask again at once
+                logger.warning(f"Unusable structured reply on attempt {attempt+1}: {e}")
+                if attempt == self.retry_attempts - 1:
+                    raise
+
+            except CircuitOpenError as e:
+                # The chosen backend was ejected under us; move on at once if another can take it
+                if attempt == self.retry_attempts - 1 or not self.backends.has_available():
+                    raise
+                logger.warning(f"Attempt {attempt+1} skipped: {e}")
+            
+            except asyncio.TimeoutError as e:
+                logger.warning(f"Timeout error on attempt {attempt+1}: {str(e)}")
+                if attempt == self.retry_attempts - 1:
+                    raise
+                route = self._fall_back(route)
+                # Pooled connections are kept; a timed-out request only drops its own socket
+                delay = backoff_delay(attempt)
+                self._check_deadline(feature, wait=delay)
+                await asyncio.sleep(delay)
+                
+            except Exception as e:
+                logger.error(f"Error on attempt {attempt+1}: {str(e)}")
+                status = getattr(e, "status", None)
+                retry_after = getattr(e, "retry_after", None)
+                if attempt == self.retry_attempts - 1:
+                    raise
+                if status is not None and not is_overload_status(status):
+                    # A 4xx would fail the same way again; only a different model might help
+                    fallback = self._fall_back(route)
+                    if fallback is route:
+                        raise
+                    route = fallback
+                    continue
+                if retry_after is not None and retry_after > settings.LLM_RETRY_MAX_DELAY:
+                    # Waiting that long would hold the user hostage; fall back now
+                    raise
+                route = self._fall_back(route)
+                delay = backoff_delay(attempt, retry_after)
+                self._check_deadline(feature, wait=delay)
+                await asyncio.sleep(delay)
 
-            data = {
-                "model": self.model_name,
-                "messages": messages,
-                "temperature": settings.TEMPERATURE, # Use configured settings
-                "max_tokens": settings.MAX_TOKENS,   # Use configured settings
-                "top_p": 0.9 # Or other default if needed
-            }
+    def _check_deadline(self, feature: str, wait: float = 0.0, streamed: bool = False):
+        """
+        Raise DeadlineExceededError rather than start a call, after waiting
+        `wait` seconds, that the request deadline leaves too little time for.
 
+        Enough time is the feature's median latency, or its median time to
+        first token for streams, since a flowing stream is never cut off.
+        """
+        tracker = self.usage.ttft if streamed else self.usage.latency
+        budget(f"llm:{feature}", needed=wait + (tracker.percentile(feature, 50) or 0.0))
+
+    def _record_cancelled(self, feature: str, profile: GenerationProfile, completion_chars: int = 0):
+        """
+        Count a call given up because its client's CancellationToken was cancelled.
+
+        The tokens saved are estimated as the feature's mean completion
+        length less what had already streamed in.
+        """
+        token = get_cancellation_token()
+        if token is None or not token.cancelled:
+            return
+        expected = self.usage.expected_completion_tokens(
+            feature, settings.MAX_TOKENS if profile.max_tokens is None else profile.max_tokens
+        )
+        saved = max(0, expected - completion_chars // 4)
+        self.usage.record_cancelled(feature, saved, token.reason)
+        logger.info(f"Cancelled {feature} call ({token.reason}), ~{saved} completion tokens saved")
+
+    def _fall_back(self, route: ModelRoute) -> ModelRoute:
+        """Switch a failing route to its fallback model, if it has one"""
+        fallback = route.fallback()
+        if fallback is not route:
+            logger.warning(f"Falling back from {route.model} to {fallback.model} for {route.feature}")
+        return fallback
+    
+    async def _call_backend(
+        self,
+        feature: str,
+        messages: MessageList,
+        profile: GenerationProfile,
+        request: Callable[[LLMBackend], Awaitable[str]],
+        tried: List[LLMBackend]
+    ) -> str:
+        """
+        Pick a backend, wait for its quota and return `request(backend)`.
+
+        A call slower than usual is hedged, on another backend when one is
+        available. Backends used are appended to `tried`.
+        """
+        backend = self.backends.select(exclude=tried)
+        tried.append(backend)
+        tokens = self._estimate_tokens(messages.size, profile.max_tokens)
+        await backend.rate_limiter.acquire(tokens=tokens, timeout=budget(f"llm:{feature}", backend.rate_limiter.max_wait))
+        # The primary request goes to targets[0], the hedge to the backend reserved after it
+        targets = [backend]
+
+        async def reserve_hedge() -> bool:
             try:
-                if session.closed:
-                    raise APIError("Session closed before making request")
-
-                async with session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=10 # Standard timeout for non-streaming
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise APIError(f"API returned {response.status}: {error_text}")
-
-                    response_data = await response.json()
-                    if 'choices' not in response_data or not response_data['choices']:
-                        raise APIError("API response missing choices")
-
-                    return response_data['choices'][0]['message']['content']
-            except asyncio.CancelledError:
-                logger.warning("API request (from string) cancelled")
-                raise
-            except asyncio.TimeoutError:
-                raise APIError("API request (from string) timed out after 10 seconds")
-            except aiohttp.ClientError as e:
-                raise APIError(f"API request (from string) failed: {str(e)}")
-        except asyncio.CancelledError:
-            logger.warning("API request (from string) outer context cancelled")
+                hedge_backend = self.backends.select(exclude=targets)
+                # A hedge never queues for budget
+                await hedge_backend.rate_limiter.acquire(tokens=tokens, timeout=0.05)
+            except (RateLimitError, CircuitOpenError):
+                return False
+            targets.append(hedge_backend)
+            tried.append(hedge_backend)
+            return True
+
+        return await self.hedger.run(feature, lambda: request(targets[-1]), before_hedge=reserve_hedge)
+
+    async def _post_completion(
+        self,
+        messages: MessageList,
+        backend: LLMBackend,
+        route: ModelRoute,
+        profile: GenerationProfile
+    ) -> str:
+        """
+        Send a non-streaming chat completion request for `route` through the backend's transport.
+
+        The route's timeout is cut to what the request deadline leaves; if
+        that shorter timeout fires, DeadlineExceededError is raised and
+        neither the backend nor the route is blamed.
+        """
+        data = self._request_body(messages, route, profile)
+        stage = f"llm:{route.feature}"
+
+        try:
+            timeout = budget(stage, route.timeout)
+            async with backend.call(), backend.concurrency.slot():
+                started = time.monotonic()
+                try:
+                    response_data = await backend.transport.post_json(
+                        backend.api_url,
+                        backend.headers(),
+                        data,
+                        timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    if timeout < route.timeout:
+                        raise current_deadline().expired(stage) from None
+                    raise
+                latency = time.monotonic() - started
+            if 'choices' not in response_data or not response_data['choices']:
+                raise APIError("API response missing choices")
+
+            self.router.record(route, latency)
+            content = response_data['choices'][0]['message']['content']
+            usage = TokenUsage.from_response(response_data.get("usage"))
+            if usage is None:
+                usage = TokenUsage.estimate(messages.size, len(content or ""))
+            self.usage.record(route.feature, usage, latency, get_llm_context())
+            # The quota was reserved for max_tokens; give back what the completion didn't use
+            await backend.rate_limiter.refund(self._estimate_tokens(messages.size, profile.max_tokens) - usage.total_tokens)
+            return content
+        except asyncio.CancelledError as e:
+            # Make sure to propagate cancellations; a hedge loser is routine (counted by the hedger)
+            if e.args and e.args[0] == HEDGE_LOST:
+                logger.debug("API request cancelled: the other hedged request answered first")
+            else:
+                logger.warning("API request cancelled")
+            raise
+        except (CircuitOpenError, DeadlineExceededError):
+            # Never sent, or cut short by our own deadline: nothing to record against the route
+            raise
+        except asyncio.TimeoutError:
+            self.router.record(route, ok=False)
+            raise APIError(f"API request timed out after {route.timeout:g} seconds")
+        except APIError:
+            self.router.record(route, ok=False)
             raise
         except Exception as e:
-            # Ensure the original error type isn't lost if it's already APIError
-            if isinstance(e, APIError):
-                raise
-            raise APIError(f"Error making API request from string: {str(e)}")
-
-    async def generate_response_from_string(self, prompt_string: str) -> str:
-        """Public method to generate response from a plain string prompt with retries."""
-        # Similar retry logic as the main 'generate' method, but calling
-        # _make_api_request_from_string instead.
-        # For simplicity here, we'll just call it directly without full retry/cache.
-        # In a real scenario, you'd likely want to replicate the retry/timeout handling
-        # from the 'generate' method here, calling _make_api_request_from_string.
+            self.router.record(route, ok=False)
+            raise APIError(f"Error making API request: {str(e)}")
+
+    async def generate_response_from_string(
+        self,
+        prompt_string: str,
+        feature: str = "default",
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> str:
+        """
+        Generate a response to a plain string prompt in a single upstream attempt.
+
+        The call waits for its fair scheduler slot and backend quota, may be
+        hedged, and goes over the shared transport like any other; unlike
+        generate_messages it is neither cached nor retried, and never
+        skipped for budget reasons. Failures return an error string.
+        """
         try:
-             # Check rate limit
-            await self.rate_limiter.acquire()
-            # NOTE: No caching applied to this specific path for now.
-            return await self._make_api_request_from_string(prompt_string)
+            # Format the plain string prompt into the basic user message structure
+            messages = MessageList([{"role": "user", "content": prompt_string}])
+            route = self.router.route(feature)
+            profile = self.profiles.resolve(profile, feature)
+            self.backends.check()
+            async with self.scheduler.slot(feature, get_llm_context().user_id):
+                return await self._call_backend(
+                    feature,
+                    messages,
+                    profile,
+                    lambda backend: self._post_completion(messages, backend, route, profile),
+                    []
+                )
         except RateLimitError:
-            logger.error("Rate limit hit for generate_response_from_string")
+            logger.error("Rate limit wait exceeded for generate_response_from_string")
             # Provide a fallback or re-raise
             return "Processing is currently unavailable due to high load."
         except APIError as e:
@@ -349,153 +582,326 @@ class LLMClient:
             ]
         }
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Operational metrics for the LLM pipeline, exposed via /health/llm"""
+        return {
+            "backends": self.backends.get_stats(),
+            "routing": self.router.get_stats(),
+            "scheduler": self.scheduler.get_stats(),
+            "cache": self.response_cache.get_stats(),
+            "coalescing": self.inflight.get_stats(),
+            "similarity_cache": self.similarity_cache.get_stats(),
+            "hedging": self.hedger.get_stats(),
+            "usage": self.usage.get_stats(),
+            "batch": self.batch.get_stats(),
+            "message_fragments": fragment_cache_stats(),
+            # Every stage ended by a request deadline, database statements included
+            "deadlines": deadline_stats.get_stats()
+        }
+    
     async def close(self):
-        """Close the client session and release all resources"""
-        try:
-            # Store reference to session before nullifying it
-            session_to_close = self.session
-            
-            # Clear self references immediately to prevent duplicate closing
-            self.session = None
-            self.session_loop = None
-            
-            # Only try to close the session if it exists and isn't already closed
-            if session_to_close and not session_to_close.closed:
-                try:
-                    # Close the session (this will also close the connector if we're the last reference)
-                    await session_to_close.close()
-                    logger.info("Session closed successfully")
-                except Exception as e:
-                    logger.warning(f"Error during session close: {e}")
-            
-            logger.info("LLMClient successfully closed")
-        except Exception as e:
-            logger.error(f"Error during LLMClient close: {e}")
-            
-        # As a last resort, check for any remaining active tasks and wait for them
-        try:
-            current_task = asyncio.current_task()
-            all_tasks = asyncio.all_tasks()
-            
-            my_pending_tasks = [t for t in all_tasks 
-                               if t != current_task and not t.done() 
-                               and 'aiohttp' in str(t) and 'llm' in str(t).lower()]
-            
-            if my_pending_tasks:
-                logger.warning(f"Waiting for {len(my_pending_tasks)} pending LLM-related tasks to complete")
-                try:
-                    # Set a short timeout to avoid blocking indefinitely
-                    await asyncio.wait(my_pending_tasks, timeout=1.0)
-                except Exception as task_e:
-                    logger.warning(f"Error waiting for pending tasks: {task_e}")
-        except Exception as e:
-            logger.warning(f"Error checking pending tasks: {e}")
+        """
+        Release client resources.
+
+        The pooled transport is shared by every client in the process and is
+        closed by the application shutdown handler, not here.
+        """
+        await self.batch.close()
+        logger.info("LLMClient successfully closed")
     
-    async def generate_text(self, prompt: str) -> str:
+    async def generate_text(
+        self,
+        prompt: str,
+        feature: str = "default",
+        similarity_key: Optional[SimilarityKey] = None,
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> str:
         """Generate text response only (not JSON)"""
-        return await self.generate(prompt, expect_json=False)
+        return await self.generate(prompt, expect_json=False, feature=feature, similarity_key=similarity_key, profile=profile)
     
-    async def generate_json(self, prompt: str) -> Dict[str, Any]:
+    async def generate_json(
+        self,
+        prompt: str,
+        feature: str = "default",
+        similarity_key: Optional[SimilarityKey] = None,
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> Dict[str, Any]:
         """Generate JSON response"""
-        return await self.generate(prompt, expect_json=True)
+        return await self.generate(prompt, expect_json=True, feature=feature, similarity_key=similarity_key, profile=profile)
     
-    async def stream_generate(self, prompt: str) -> AsyncIterator[str]:
-        """Generate LLM response as a stream of chunks"""
-        # We use the main session for streaming to avoid creating/destroying connections
+    async def _replay_stream(self, recorded: List[List[Any]]) -> AsyncIterator[str]:
+        """Yield a recorded stream chunk by chunk, paced by LLM_STREAM_REPLAY_PACING"""
+        pacing = settings.LLM_STREAM_REPLAY_PACING
+        for chunk, gap in recorded:
+            if pacing > 0 and gap > 0:
+                await asyncio.sleep(gap * pacing)
+            yield chunk
+
+    async def stream_generate(
+        self,
+        prompt: str,
+        feature: str = "default",
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> AsyncIterator[str]:
+        """Stream a response for a prompt given as a JSON-encoded message list (see stream_messages)"""
         try:
-            # Ensure we have a valid session
-            self.session = await self._ensure_session()
-            if not self.session:
-                logger.error("Failed to create a valid session for streaming")
-                yield "I'm afraid I cannot provide a response at the moment due to technical difficulties."
-                return
-                
-            # Check rate limit
-            await self.rate_limiter.acquire()
-            
-            # Streaming doesn't use cache as we're sending partial responses
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Parse the incoming prompt string (expected to be JSON) into a message list
-            try:
-                messages = json.loads(prompt)
-                if not isinstance(messages, list):
-                    raise ValueError("Parsed prompt is not a list")
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"Failed to parse prompt string as JSON list for streaming: {e}. Prompt was: {prompt[:500]}...")
-                yield f"Error: Invalid prompt format: Expected JSON list, received: {type(prompt)}"
-                return
-
-            data = {
-                "model": self.model_name,
-                "messages": messages, # Use the parsed message list directly
-                "temperature": settings.TEMPERATURE,
-                "max_tokens": settings.MAX_TOKENS,
-                "top_p": 0.9,
-                "stream": True  # Enable streaming
-            }
-            
-            try:
-                async with self.session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=30  # Longer timeout for streaming
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        error_msg = f"API returned {response.status}: {error_text}"
-                        logger.error(error_msg)
-                        yield f"Error: {error_msg}"
-                        return
-                    
-                    # Process the streaming response
-                    buffer = ""
-                    async for line in response.content:
-                        line = line.decode('utf-8').strip()
-                        if line:
-                            # Skip empty lines and "data: [DONE]" messages
-                            if line == "data: [DONE]":
-                                break
-                                
-                            if line.startswith("data: "):
-                                try:
-                                    # Parse the JSON data
-                                    data = json.loads(line[6:])  # Remove "data: " prefix
-                                    if 'choices' in data and data['choices']:
-                                        delta = data['choices'][0].get('delta', {})
-                                        content = delta.get('content', '')
-                                        if content:
-                                            # Only yield actual content
-                                            buffer += content
-                                            yield content
-                                except json.JSONDecodeError:
-                                    logger.warning(f"Failed to parse streaming data: {line}")
-                                    continue
-                                    
-            except asyncio.CancelledError:
-                logger.warning("Streaming API request cancelled")
-                # We're not closing the session - just propagate the cancellation
-                raise
-                
-            except asyncio.TimeoutError:
-                error_msg = "API request timed out after 30 seconds"
-                logger.error(error_msg)
-                yield f"Error: {error_msg}"
-                
-            except Exception as e:
-                error_msg = f"Streaming API error: {str(e)}"
-                logger.error(error_msg)
-                yield f"Error: {error_msg}"
-                
-        except Exception as outer_e:
-            error_msg = f"Outer exception in stream_generate: {str(outer_e)}"
-            logger.error(error_msg)
-            import traceback
-            logger.error(traceback.format_exc())
-            yield f"Error: {error_msg}"
+            messages = parse_prompt(prompt)
+        except ValueError as e:
+            logger.error(f"Failed to parse prompt string as JSON list for streaming: {e}. Prompt was: {prompt[:500]}...")
+            raise StreamError(f"Invalid prompt format: Expected JSON list, received: {type(prompt)}")
+        async for chunk in self.stream_messages(messages, feature=feature, profile=profile):
+            yield chunk
+
+    async def stream_messages(
+        self,
+        messages: Messages,
+        feature: str = "default",
+        profile: Union[str, GenerationProfile, None] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generate LLM response as a stream of chunks.
+
+        `messages` is a list of chat messages or a MessageList.
+
+        Completed streams are recorded with their chunk boundaries and gaps in
+        the response cache; a repeat of the same prompt is replayed from there.
+
+        Failures raise StreamError (StreamTimeoutError for missed deadlines),
+        RateLimitError or BudgetExceededError instead of being mixed into the content; so does an
+        attempt the request deadline leaves no time to reach its first token. Until the first
+        content chunk has been yielded, a stalled or failed attempt is retried
+        transparently (up to LLM_STREAM_RETRY_ATTEMPTS times), on the route's
+        fallback model if it has one.
+
+        Called inside a CancellationToken's guard, cancelling the token drops
+        the upstream request at once and counts the tokens that saved.
+        """
+        messages = MessageList.of(messages)
+        route = self.router.route(feature)
+        profile = self.profiles.resolve(profile, feature)
+        cache_key = self._calculate_cache_key(messages, stream=True, model=route.model, profile=profile)
+        recorded = await self.response_cache.get(cache_key)
+        if recorded:
+            async for chunk in self._replay_stream(recorded):
+                yield chunk
+            return
+
+        self.usage.check(feature, get_llm_context())
+        data = self._request_body(messages, route, profile, stream=True)
+
+        # [chunk, seconds since the previous chunk] for every content chunk
+        recording: List[List[Any]] = []
+        attempts = settings.LLM_STREAM_RETRY_ATTEMPTS + 1
+
+        try:
+            self.backends.check()
+        except CircuitOpenError as e:
+            raise StreamError(str(e), retry_after=e.retry_after)
+        tried: List[LLMBackend] = []
         
-        # Explicitly avoiding any session closing here to prevent premature resource cleanup
\ No newline at end of file
+        try:
+            # The scheduler slot is held until the stream finishes or the consumer stops reading
+            async with self.scheduler.slot(feature, get_llm_context().user_id):
+                for attempt in range(attempts):
+                    # Each attempt is a new upstream request, preferably on a backend not tried yet
+                    try:
+                        backend = self.backends.select(exclude=tried)
+                    except CircuitOpenError as e:
+                        raise StreamError(str(e), retry_after=e.retry_after)
+                    tried.append(backend)
+                    self._check_deadline(feature, streamed=True)
+                    # Wait for the backend's request and token budget
+                    reserved = self._estimate_tokens(messages.size, profile.max_tokens)
+                    await backend.rate_limiter.acquire(
+                        tokens=reserved,
+                        timeout=budget(f"llm:{feature}", backend.rate_limiter.max_wait)
+                    )
+
+                    try:
+                        async for content in self._stream_attempt(data, recording, backend, route, messages.size, reserved):
+                            yield content
+                        break
+                    except StreamError as e:
+                        # Once content has reached the caller a retry would repeat it
+                        if recording or not e.retryable or attempt == attempts - 1:
+                            logger.error(f"Streaming failed on attempt {attempt+1}: {e}")
+                            raise
+                        if e.retry_after is not None and e.retry_after > settings.LLM_RETRY_MAX_DELAY:
+                            logger.error(f"Streaming failed on attempt {attempt+1}: {e} (retry after {e.retry_after:.0f}s)")
+                            raise
+                        logger.warning(f"Stream attempt {attempt+1} failed before the first token ({e}); retrying")
+                        fallback = self._fall_back(route)
+                        if fallback is not route:
+                            route = fallback
+                            data = self._request_body(messages, route, profile, stream=True)
+                        if is_overload_status(e.status):
+                            delay = backoff_delay(attempt, e.retry_after)
+                            self._check_deadline(feature, wait=delay, streamed=True)
+                            await asyncio.sleep(delay)
+        except DeadlineExceededError as e:
+            raise StreamError(str(e)) from e
+        except (asyncio.CancelledError, GeneratorExit):
+            # Cancelled mid-stream, or the consumer stopped reading; either way the upstream request is closed
+            self._record_cancelled(feature, profile, sum(len(chunk) for chunk, _ in recording))
+            raise
+
+        # Only streams read to the end are replayable
+        if recording:
+            await self.response_cache.set(cache_key, recording, feature=feature)
+
+    async def _stream_attempt(
+        self,
+        data: bytes,
+        recording: List[List[Any]],
+        backend: LLMBackend,
+        route: ModelRoute,
+        prompt_size: int,
+        reserved: int
+    ) -> AsyncIterator[str]:
+        """
+        Run one upstream streaming request, yielding content chunks.
+
+        Waits LLM_STREAM_FIRST_TOKEN_TIMEOUT for the first line and then at
+        most LLM_STREAM_IDLE_TIMEOUT between lines; the first wait is cut to
+        what the request deadline leaves, and if that runs out
+        DeadlineExceededError is raised without blaming the backend. Transport failures are
+        raised as StreamError, except the transport's own total timeout
+        (LLM_STREAM_TOTAL_TIMEOUT), which surfaces as asyncio.TimeoutError
+        and is not retried. Token usage comes from the stream's final
+        usage chunk, or is estimated from `prompt_size` (bytes) and the
+        content received when the stream has none or is cut short; of the
+        `reserved` rate limit tokens, what it didn't use is refunded.
+        """
+        stage = f"llm:{route.feature}"
+        first_token_timeout = budget(stage, settings.LLM_STREAM_FIRST_TOKEN_TIMEOUT)
+        breaker = backend.breaker
+        try:
+            probe = breaker.before_call()
+        except CircuitOpenError as e:
+            raise StreamError(str(e), retry_after=e.retry_after)
+        # The breaker's verdict is in once the first byte arrives or the attempt fails
+        judged = False
+
+        # The window slot is held for the whole stream; time to first byte is the latency sample
+        try:
+            started = await backend.concurrency.acquire()
+        except BaseException:
+            breaker.release(probe)
+            raise
+        backend.started()
+        first_byte_latency = None
+        overloaded = False
+        last_chunk_at = started
+        # Network chunks go through an incremental SSE parser; events may be split anywhere
+        parser = SSEParser()
+        done = False
+        usage: Optional[TokenUsage] = None
+        first_token_at: Optional[float] = None
+        completion_chars = 0
+        # We use the pooled transport for streaming to avoid creating/destroying connections
+        chunks = backend.transport.stream_chunks(
+            backend.api_url,
+            backend.headers(),
+            data,
+            timeout=settings.LLM_STREAM_TOTAL_TIMEOUT
+        )
+        try:
+            while not done:
+                waiting_for_first_byte = first_byte_latency is None
+                deadline = first_token_timeout if waiting_for_first_byte else settings.LLM_STREAM_IDLE_TIMEOUT
+                try:
+                    async with asyncio.timeout(deadline) as wait:
+                        chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+                except asyncio.TimeoutError:
+                    if not wait.expired():
+                        # The transport's LLM_STREAM_TOTAL_TIMEOUT: the stream ran too long rather
+                        # than stalled, and a retry would run as long
+                        raise
+                    if waiting_for_first_byte and first_token_timeout < settings.LLM_STREAM_FIRST_TOKEN_TIMEOUT:
+                        raise current_deadline().expired(stage) from None
+                    overloaded = True
+                    if waiting_for_first_byte:
+                        breaker.record_failure(probe)
+                        judged = True
+                        self.router.record(route, ok=False)
+                        raise StreamTimeoutError(f"No first token within {deadline:.1f}s", phase="first_token")
+                    raise StreamTimeoutError(f"Stream stalled for more than {deadline:.1f}s", phase="idle")
+                except APIError as e:
+                    overloaded = is_overload_status(e.status)
+                    if not judged:
+                        self.router.record(route, ok=False)
+                        if e.status is None or overloaded:
+                            breaker.record_failure(probe, retry_after=e.retry_after)
+                        else:
+                            breaker.record_success(probe)
+                        judged = True
+                    raise StreamError(
+                        f"Streaming API error: {str(e)}",
+                        status=e.status,
+                        retryable=e.status is None or is_overload_status(e.status),
+                        retry_after=e.retry_after
+                    )
+
+                if chunk is None:
+                    done = True
+                    payloads = parser.close()
+                else:
+                    if waiting_for_first_byte:
+                        first_byte_latency = time.monotonic() - started
+                        breaker.record_success(probe)
+                        judged = True
+                        # Streams are measured by time to first byte
+                        self.router.record(route, first_byte_latency)
+                    try:
+                        payloads = parser.feed(chunk)
+                    except ValueError as e:
+                        raise StreamError(f"Malformed event stream: {e}")
+
+                for payload in payloads:
+                    # Stop at the end-of-stream marker
+                    if payload == DONE:
+                        done = True
+                        break
+                    try:
+                        event = loads(payload)
+                    except JSONDecodeError:
+                        logger.warning(f"Failed to parse streaming data: {payload[:200]!r}")
+                        continue
+                    content = delta_content(event)
+                    if isinstance(event, dict) and event.get("usage"):
+                        # The final chunk (choices: []) when stream_options.include_usage is set
+                        usage = TokenUsage.from_response(event["usage"])
+                    if content:
+                        # Only yield actual content
+                        now = time.monotonic()
+                        if first_token_at is None:
+                            first_token_at = now
+                        completion_chars += len(content)
+                        recording.append([content, now - last_chunk_at if recording else 0.0])
+                        last_chunk_at = now
+                        yield content
+        except asyncio.CancelledError:
+            logger.warning("Streaming API request cancelled")
+            raise
+        finally:
+            # Release the pooled connection even when we stop reading early
+            await chunks.aclose()
+            backend.concurrency.release(started, latency=first_byte_latency, overloaded=overloaded)
+            backend.finished(first_byte_latency)
+            if not judged:
+                breaker.release(probe)
+            if first_byte_latency is not None:
+                # Anything that reached us was billed, even if the stream broke off
+                if usage is None:
+                    usage = TokenUsage.estimate(prompt_size, completion_chars)
+                self.usage.record(
+                    route.feature,
+                    usage,
+                    time.monotonic() - started,
+                    get_llm_context(),
+                    ttft=first_token_at - started if first_token_at is not None else None,
+                    finished=done
+                )
+                await backend.rate_limiter.refund(reserved - usage.total_tokens)
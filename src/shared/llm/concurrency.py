@@ -0,0 +1,195 @@
+from typing import Optional, Dict, Any
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import time
+import logging
+
+from src.core.config import settings
+from .exceptions import APIError
+from .rate_limiter import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+class ConcurrencyLimitError(RateLimitError):
+    """Raised when no upstream slot frees up within the wait deadline"""
+    pass
+
+def is_overload_status(status: Optional[int]) -> bool:
+    """Whether an upstream HTTP status means the provider is overloaded"""
+    return status is not None and (status == 429 or status >= 500)
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the number of LLM requests in flight.
+
+    The window grows by one request per window's worth of healthy responses
+    and is cut in half on 429s, 5xx and timeouts. It is also trimmed when the
+    smoothed latency drifts above `latency_tolerance` times the baseline
+    (a slowly decaying minimum), which catches a provider that is slowing
+    down before it starts failing. Only requests started after the last cut
+    can trigger another one, so a burst of failures shrinks the window once.
+
+    Callers that find the window full wait in FIFO order and are rejected
+    with ConcurrencyLimitError after `max_wait`, so a slow provider sheds load
+    instead of piling up coroutines (and the DB sessions they hold).
+    """
+    DECREASE_ON_OVERLOAD = 0.5
+    DECREASE_ON_LATENCY = 0.9
+    SMOOTHING = 0.2
+    BASELINE_DRIFT = 0.01
+
+    def __init__(
+        self,
+        initial_limit: Optional[int] = None,
+        min_limit: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        latency_tolerance: Optional[float] = None
+    ):
+        self.min_limit = min_limit or settings.LLM_CONCURRENCY_MIN_LIMIT
+        self.max_limit = max_limit or settings.LLM_CONCURRENCY_MAX_LIMIT
+        self.limit = float(initial_limit or settings.LLM_CONCURRENCY_INITIAL_LIMIT)
+        self.max_wait = settings.LLM_CONCURRENCY_MAX_WAIT if max_wait is None else max_wait
+        self.latency_tolerance = latency_tolerance or settings.LLM_CONCURRENCY_LATENCY_TOLERANCE
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._last_decrease = 0.0
+
+        # Latency estimates in seconds
+        self.baseline_latency: Optional[float] = None
+        self.smoothed_latency: Optional[float] = None
+
+        # Monitoring counters
+        self.acquired = 0
+        self.rejected = 0
+        self.overloads = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _wake(self):
+        """Grant slots to queued callers while the window allows"""
+        while self._waiters and self._has_capacity():
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Wait for a slot in the window and return the request start time.
+
+        Raises ConcurrencyLimitError if no slot frees up within `timeout`
+        seconds (defaults to LLM_CONCURRENCY_MAX_WAIT).
+        """
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                if not self._granted(future):
+                    future.cancel()
+                    self.rejected += 1
+                    logger.warning(f"No LLM concurrency slot within deadline (limit {int(self.limit)}, in flight {self.in_flight})")
+                    raise ConcurrencyLimitError("Too many LLM requests in flight. Please try again shortly.")
+                # Granted just as the deadline passed - keep the slot
+            except asyncio.CancelledError:
+                if self._granted(future):
+                    # Granted just as we were cancelled - hand the slot on
+                    self.in_flight -= 1
+                    self._wake()
+                else:
+                    future.cancel()
+                raise
+        self.acquired += 1
+        return time.monotonic()
+
+    @staticmethod
+    def _granted(future: asyncio.Future) -> bool:
+        return future.done() and not future.cancelled()
+
+    def release(self, started: float, latency: Optional[float] = None, overloaded: bool = False):
+        """
+        Return a slot and feed the outcome back into the window.
+
+        `latency` is the healthy response time to learn from (None if the
+        request ended without a usable sample); `overloaded` marks a 429,
+        5xx or timeout.
+        """
+        self.in_flight -= 1
+        if overloaded:
+            self.overloads += 1
+            self._decrease(started, self.DECREASE_ON_OVERLOAD, "upstream overload")
+        elif latency is not None:
+            self._on_latency(started, latency)
+        self._wake()
+
+    def _on_latency(self, started: float, latency: float):
+        if self.baseline_latency is None:
+            self.baseline_latency = self.smoothed_latency = latency
+            return
+        # The baseline follows new minimums at once and creeps up slowly otherwise
+        self.baseline_latency = min(latency, self.baseline_latency + (latency - self.baseline_latency) * self.BASELINE_DRIFT)
+        self.smoothed_latency += (latency - self.smoothed_latency) * self.SMOOTHING
+
+        if self.smoothed_latency > self.baseline_latency * self.latency_tolerance:
+            self._decrease(started, self.DECREASE_ON_LATENCY, "rising latency")
+        elif self.in_flight + 1 >= int(self.limit) // 2:
+            # Only grow a window we are actually using
+            previous = int(self.limit)
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            if int(self.limit) > previous:
+                self.increases += 1
+
+    def _decrease(self, started: float, factor: float, reason: str):
+        if started < self._last_decrease:
+            # Sent before the last cut took effect
+            return
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = time.monotonic()
+        if int(self.limit) < previous:
+            self.decreases += 1
+            logger.warning(f"LLM concurrency limit {previous} -> {int(self.limit)} ({reason})")
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for one non-streaming request and learn from its outcome"""
+        started = await self.acquire()
+        try:
+            yield
+        except asyncio.TimeoutError:
+            self.release(started, overloaded=True)
+            raise
+        except APIError as e:
+            self.release(started, overloaded=is_overload_status(e.status))
+            raise
+        except BaseException:
+            self.release(started)
+            raise
+        else:
+            self.release(started, latency=time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Current window, occupancy and adjustment counters"""
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": sum(1 for f in self._waiters if not f.done()),
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "overloads": self.overloads,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "baseline_latency_seconds": round(self.baseline_latency, 4) if self.baseline_latency is not None else None,
+            "smoothed_latency_seconds": round(self.smoothed_latency, 4) if self.smoothed_latency is not None else None
+        }
@@ -0,0 +1,43 @@
+from contextvars import Context, ContextVar, Token
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(frozen=True)
+class LLMCallContext:
+    """Who an LLM call is made on behalf of, for scheduling and attribution"""
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+_llm_context: ContextVar[LLMCallContext] = ContextVar("llm_context", default=LLMCallContext())
+
+def bind_llm_context(user_id: Optional[str] = None, session_id: Optional[str] = None) -> Token:
+    """
+    Attach the current user/session to every LLM call made from this context.
+
+    Tasks created afterwards (asyncio.create_task) inherit the binding, so
+    WebSocket endpoints bind once after authentication.
+    """
+    return _llm_context.set(LLMCallContext(
+        user_id=str(user_id) if user_id is not None else None,
+        session_id=str(session_id) if session_id is not None else None
+    ))
+
+def reset_llm_context(token: Token):
+    """Undo a previous bind_llm_context"""
+    _llm_context.reset(token)
+
+def get_llm_context() -> LLMCallContext:
+    """Return the user/session bound to the current context"""
+    return _llm_context.get()
+
+def attribution_only_context() -> Context:
+    """
+    A fresh context carrying only the current user/session binding.
+
+    For work started on behalf of several callers (coalesced calls): it is
+    scheduled and accounted to the caller that started it, without that
+    caller's deadline or cancellation token.
+    """
+    context = Context()
+    context.run(_llm_context.set, _llm_context.get())
+    return context
@@ -0,0 +1,51 @@
+from typing import Optional
+
+class LLMError(Exception):
+    """Base exception for LLM-related errors"""
+    pass
+
+class APIError(LLMError):
+    """Exception raised for API errors"""
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        # Seconds the provider asked us to wait (Retry-After), if it said
+        self.retry_after = retry_after
+
+class CircuitOpenError(APIError):
+    """Exception raised without calling upstream while the endpoint's circuit breaker is open"""
+    pass
+
+class BudgetExceededError(LLMError):
+    """Exception raised without calling upstream when a session has used up its token budget"""
+    def __init__(self, message: str, feature: str, session_id: Optional[str] = None):
+        super().__init__(message)
+        self.feature = feature
+        self.session_id = session_id
+
+class ResponseParsingError(LLMError):
+    """Exception raised when response parsing fails"""
+    def __init__(self, message: str, raw: Optional[str] = None):
+        super().__init__(message)
+        # The completion text that failed to parse, for logging
+        self.raw = raw
+
+class StreamError(LLMError):
+    """Exception raised when a streamed completion fails"""
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class StreamTimeoutError(StreamError):
+    """Exception raised when a stream misses its first-token or idle-gap deadline"""
+    def __init__(self, message: str, phase: str):
+        super().__init__(message, retryable=True)
+        self.phase = phase
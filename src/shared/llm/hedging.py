@@ -0,0 +1,150 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+from collections import deque
+import asyncio
+import time
+import logging
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Reason given when the slower of a hedged pair is cancelled
+HEDGE_LOST = "hedge lost"
+
+class LatencyTracker:
+    """Sliding window of recent successful latencies per feature"""
+    WINDOW = 256
+
+    def __init__(self):
+        self.samples: Dict[str, deque] = {}
+
+    def record(self, feature: str, latency: float):
+        window = self.samples.get(feature)
+        if window is None:
+            window = self.samples[feature] = deque(maxlen=self.WINDOW)
+        window.append(latency)
+
+    def percentile(self, feature: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        """The `pct` percentile of recent latencies, or None with too few samples"""
+        window = self.samples.get(feature)
+        if not window or len(window) < min_samples:
+            return None
+        ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+class RequestHedger:
+    """
+    Hedged requests for non-streaming LLM calls.
+
+    If a call hasn't answered by the feature's LLM_HEDGE_PERCENTILE latency,
+    an identical second request is sent; whichever succeeds first wins and
+    the other is cancelled. Every call earns LLM_HEDGE_BUDGET_RATIO of a
+    hedge credit (the ratio is capped at 1.0) and every hedge spends one,
+    so hedging can never more than double upstream traffic.
+    """
+    MAX_CREDIT = 10.0
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        percentile: Optional[float] = None,
+        budget_ratio: Optional[float] = None,
+        min_samples: Optional[int] = None
+    ):
+        self.enabled = settings.LLM_HEDGING_ENABLED if enabled is None else enabled
+        self.percentile = percentile or settings.LLM_HEDGE_PERCENTILE
+        self.budget_ratio = min(1.0, settings.LLM_HEDGE_BUDGET_RATIO if budget_ratio is None else budget_ratio)
+        self.min_samples = min_samples or settings.LLM_HEDGE_MIN_SAMPLES
+        self.latencies = LatencyTracker()
+        self.credit = 0.0
+
+        # Monitoring counters
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.cancelled_losers = 0
+
+    def hedge_delay(self, feature: str) -> Optional[float]:
+        """Seconds to wait before hedging a call for `feature` (None: don't hedge)"""
+        if not self.enabled:
+            return None
+        return self.latencies.percentile(feature, self.percentile, self.min_samples)
+
+    async def _may_hedge(self, before_hedge: Optional[Callable[[], Awaitable[bool]]]) -> bool:
+        if self.credit < 1.0:
+            self.budget_denied += 1
+            return False
+        if before_hedge is not None and not await before_hedge():
+            self.budget_denied += 1
+            return False
+        self.credit -= 1.0
+        return True
+
+    async def run(
+        self,
+        feature: str,
+        fn: Callable[[], Awaitable[Any]],
+        before_hedge: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> Any:
+        """
+        Await `fn()`, hedging with a second `fn()` if it is slower than usual.
+
+        `before_hedge` is awaited right before the hedge is sent and may veto
+        it (e.g. when the rate limiter has no spare budget).
+        """
+        self.calls += 1
+        self.credit = min(self.MAX_CREDIT, self.credit + self.budget_ratio)
+        delay = self.hedge_delay(feature)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        tasks = {primary: started}
+        # Why the requests still running at the end are cancelled
+        reason: Optional[str] = None
+        try:
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done() and await self._may_hedge(before_hedge):
+                    self.hedged += 1
+                    tasks[asyncio.ensure_future(fn())] = time.monotonic()
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        # Keep waiting on the other request, if any
+                        error = task.exception()
+                        continue
+                    self.latencies.record(feature, time.monotonic() - tasks[task])
+                    if task is not primary:
+                        self.hedge_wins += 1
+                    reason = HEDGE_LOST
+                    return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel(reason)
+                    if reason == HEDGE_LOST:
+                        self.cancelled_losers += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hedge counts and the current per-feature hedge delays"""
+        delays = {}
+        for feature in self.latencies.samples:
+            delay = self.latencies.percentile(feature, self.percentile, self.min_samples)
+            if delay is not None:
+                delays[feature] = round(delay, 4)
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied,
+            "cancelled_losers": self.cancelled_losers,
+            "hedge_delay_seconds": delays
+        }
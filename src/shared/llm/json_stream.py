@@ -0,0 +1,244 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Union
+import json
+import re
+
+from .exceptions import ResponseParsingError
+
+@dataclass(frozen=True)
+class FieldDone:
+    """A top-level field of the streamed object, complete and decoded"""
+    key: str
+    value: Any
+
+@dataclass(frozen=True)
+class TextDelta:
+    """Decoded text just received for a top-level string field being streamed"""
+    key: str
+    text: str
+
+JsonStreamEvent = Union[FieldDone, TextDelta]
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Runs of string characters that need no decoding
+_PLAIN = re.compile(r'[^"\\]+')
+_WHITESPACE = " \t\r\n"
+_HEX = frozenset("0123456789abcdefABCDEF")
+
+# Parser states
+_BEFORE_OBJECT, _BEFORE_KEY, _KEY, _AFTER_KEY, _BEFORE_VALUE, _STRING, _RAW, _AFTER_VALUE, _DONE = range(9)
+
+class JsonObjectStream:
+    """
+    Incremental tokenizer for one JSON object arriving in LLM stream chunks.
+
+    `feed()` returns FieldDone as soon as each top-level field's value is
+    complete (a number as soon as the character after it arrives), and
+    TextDelta with the decoded text of the string fields named in
+    `stream_fields` while they are still arriving. Escapes split across
+    chunks are handled. Nested values are collected and decoded when they
+    close. Each character is looked at once; runs of plain string
+    characters are consumed as slices. Malformed input raises
+    ResponseParsingError.
+    """
+    def __init__(self, stream_fields: Iterable[str] = ()):
+        self.stream_fields = frozenset(stream_fields)
+        self.value: Dict[str, Any] = {}
+        self._state = _BEFORE_OBJECT
+        self._key: Optional[str] = None
+        # Decoded pieces of the key or string value being read
+        self._parts: List[str] = []
+        # An escape sequence cut off at the end of a chunk, and a high
+        # surrogate waiting for its low half
+        self._escape = ""
+        self._high = ""
+        # Raw text of a non-string value, and its nesting while inside one
+        self._raw: List[str] = []
+        self._depth = 0
+        self._raw_in_string = False
+        self._raw_escaped = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, text: str) -> List[JsonStreamEvent]:
+        events: List[JsonStreamEvent] = []
+        i, n = 0, len(text)
+        while i < n:
+            state = self._state
+            if state == _STRING or state == _KEY:
+                i = self._read_string(text, i, events)
+                continue
+            if state == _RAW:
+                i = self._read_raw(text, i, events)
+                continue
+            char = text[i]
+            i += 1
+            if char in _WHITESPACE:
+                continue
+            if state == _BEFORE_OBJECT:
+                if char != "{":
+                    self._fail(f"expected '{{', got {char!r}")
+                self._state = _BEFORE_KEY
+            elif state == _BEFORE_KEY:
+                if char == '"':
+                    self._state = _KEY
+                elif char == "}" and not self.value:
+                    self._state = _DONE
+                else:
+                    self._fail(f"expected a key, got {char!r}")
+            elif state == _AFTER_KEY:
+                if char != ":":
+                    self._fail(f"expected ':', got {char!r}")
+                self._state = _BEFORE_VALUE
+            elif state == _BEFORE_VALUE:
+                if char == '"':
+                    self._state = _STRING
+                else:
+                    self._state = _RAW
+                    self._raw = []
+                    self._depth = 0
+                    i -= 1
+            elif state == _AFTER_VALUE:
+                if char == ",":
+                    self._state = _BEFORE_KEY
+                elif char == "}":
+                    self._state = _DONE
+                else:
+                    self._fail(f"expected ',' or '}}', got {char!r}")
+            elif state == _DONE:
+                self._fail(f"unexpected {char!r} after the object")
+        return events
+
+    def close(self) -> Dict[str, Any]:
+        """End of stream: the complete object (ResponseParsingError if it was cut short)"""
+        if self._state != _DONE:
+            self._fail("stream ended before the object was complete")
+        return self.value
+
+    def _read_string(self, text: str, i: int, events: List[JsonStreamEvent]) -> int:
+        """Consume string characters from `i`; returns where it stopped"""
+        n = len(text)
+        decoded: List[str] = []
+        while i < n:
+            if self._escape:
+                i = self._read_escape(text, i, decoded)
+                continue
+            match = _PLAIN.match(text, i)
+            if match:
+                self._append(decoded, match.group())
+                i = match.end()
+                continue
+            char = text[i]
+            i += 1
+            if char == "\\":
+                self._escape = "\\"
+                continue
+            # Closing quote
+            self._append(decoded, "")
+            self._parts.extend(decoded)
+            self._emit_text(decoded, events)
+            value = "".join(self._parts)
+            self._parts = []
+            if self._state == _KEY:
+                self._key = value
+                self._state = _AFTER_KEY
+            else:
+                self._set(value, events)
+            return i
+        self._parts.extend(decoded)
+        self._emit_text(decoded, events)
+        return i
+
+    def _read_escape(self, text: str, i: int, decoded: List[str]) -> int:
+        escape = self._escape + text[i]
+        i += 1
+        if escape[1] != "u":
+            if escape[1] not in _ESCAPES:
+                self._fail(f"invalid escape {escape!r}")
+            self._append(decoded, _ESCAPES[escape[1]])
+            self._escape = ""
+            return i
+        if len(escape) < 6:
+            self._escape = escape
+            return i
+        self._escape = ""
+        if not _HEX.issuperset(escape[2:]):
+            self._fail(f"invalid escape {escape!r}")
+        code = int(escape[2:], 16)
+        if 0xDC00 <= code < 0xE000 and self._high:
+            high, self._high = ord(self._high), ""
+            decoded.append(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)))
+        elif 0xD800 <= code < 0xDC00:
+            # Half of a surrogate pair: hold it until the other half arrives
+            self._append(decoded, "")
+            self._high = chr(code)
+        else:
+            self._append(decoded, chr(code))
+        return i
+
+    def _append(self, decoded: List[str], piece: str):
+        if self._high:
+            # A high surrogate not followed by its low half stands alone, as json.loads keeps it
+            decoded.append(self._high)
+            self._high = ""
+        if piece:
+            decoded.append(piece)
+
+    def _emit_text(self, decoded: List[str], events: List[JsonStreamEvent]):
+        if decoded and self._state == _STRING and self._key in self.stream_fields:
+            events.append(TextDelta(self._key, "".join(decoded)))
+
+    def _read_raw(self, text: str, i: int, events: List[JsonStreamEvent]) -> int:
+        """Collect a number, literal, object or array until the delimiter after it"""
+        n = len(text)
+        start = i
+        while i < n:
+            char = text[i]
+            if self._raw_in_string:
+                if self._raw_escaped:
+                    self._raw_escaped = False
+                elif char == "\\":
+                    self._raw_escaped = True
+                elif char == '"':
+                    self._raw_in_string = False
+            elif char == '"':
+                self._raw_in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # The enclosing object's closing brace ends a bare value
+                    self._raw.append(text[start:i])
+                    self._finish_raw(events)
+                    return i
+                self._depth -= 1
+                if self._depth == 0:
+                    self._raw.append(text[start:i + 1])
+                    self._finish_raw(events)
+                    return i + 1
+            elif self._depth == 0 and (char == "," or char in _WHITESPACE):
+                self._raw.append(text[start:i])
+                self._finish_raw(events)
+                return i
+            i += 1
+        self._raw.append(text[start:i])
+        return i
+
+    def _finish_raw(self, events: List[JsonStreamEvent]):
+        raw = "".join(self._raw)
+        self._raw = []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self._fail(f"invalid value {raw[:40]!r} for '{self._key}'")
+        self._set(value, events)
+
+    def _set(self, value: Any, events: List[JsonStreamEvent]):
+        self.value[self._key] = value
+        events.append(FieldDone(self._key, value))
+        self._state = _AFTER_VALUE
+
+    def _fail(self, reason: str):
+        raise ResponseParsingError(f"Malformed JSON stream: {reason}")
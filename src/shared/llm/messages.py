@@ -0,0 +1,123 @@
+from typing import Any, Dict, Iterable, List, Optional, Union
+from collections import OrderedDict
+import hashlib
+import json
+
+Message = Dict[str, Any]
+
+class _FragmentCache:
+    """
+    LRU of encoded {"role", "content"} messages.
+
+    Conversations are rebuilt from the database every turn, so the system
+    prompt and all earlier turns come back as equal (role, content) pairs;
+    only the newest messages need encoding.
+    """
+    MAX_ENTRIES = 4096
+    # Larger messages are rare and encoded directly
+    MAX_CONTENT_CHARS = 64 * 1024
+
+    def __init__(self):
+        self.entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, message: Message) -> bytes:
+        if not isinstance(message, dict):
+            return _encode(message)
+        content = message.get("content")
+        if len(message) != 2 or not isinstance(content, str) or len(content) > self.MAX_CONTENT_CHARS:
+            return _encode(message)
+        key = (message.get("role"), content)
+        fragment = self.entries.get(key)
+        if fragment is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+        self.misses += 1
+        fragment = _encode(message)
+        self.entries[key] = fragment
+        if len(self.entries) > self.MAX_ENTRIES:
+            self.entries.popitem(last=False)
+        return fragment
+
+def _encode(message: Message) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+_fragments = _FragmentCache()
+
+class MessageList:
+    """
+    Chat messages together with their JSON encoding.
+
+    Each message is encoded once, as it is added, into a fragment; the
+    request body splices the fragments together and the fingerprint is a
+    running hash updated per fragment, so neither ever re-serializes the
+    conversation. `copy()` shares the encoded prefix, so a fixed system
+    prompt can be prepared once and extended per call.
+    """
+    __slots__ = ("messages", "fragments", "size", "_hasher", "_encoded")
+
+    def __init__(self, messages: Iterable[Message] = ()):
+        self.messages: List[Message] = []
+        self.fragments: List[bytes] = []
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._encoded: Optional[bytes] = None
+        self.extend(messages)
+
+    @classmethod
+    def of(cls, messages: Union["MessageList", Iterable[Message]]) -> "MessageList":
+        """Wrap a plain message list (a MessageList is returned as is)"""
+        return messages if isinstance(messages, MessageList) else cls(messages)
+
+    def append(self, message: Message, fragment: Optional[bytes] = None):
+        """Add a message; `fragment` is its pre-serialized JSON, if the caller already has it"""
+        fragment = fragment if fragment is not None else _fragments.encode(message)
+        self.messages.append(message)
+        self.fragments.append(fragment)
+        self.size += len(fragment)
+        # Fragments never contain a raw newline, so this separator keeps the hash unambiguous
+        self._hasher.update(fragment)
+        self._hasher.update(b"\n")
+        self._encoded = None
+
+    def extend(self, messages: Iterable[Message]):
+        for message in messages:
+            self.append(message)
+
+    def copy(self) -> "MessageList":
+        clone = MessageList()
+        clone.messages = list(self.messages)
+        clone.fragments = list(self.fragments)
+        clone.size = self.size
+        clone._hasher = self._hasher.copy()
+        clone._encoded = self._encoded
+        return clone
+
+    def encoded(self) -> bytes:
+        """The messages as a JSON array"""
+        if self._encoded is None:
+            self._encoded = b"[" + b",".join(self.fragments) + b"]"
+        return self._encoded
+
+    def digest(self) -> bytes:
+        """Fingerprint of the messages, kept up to date incrementally"""
+        return self._hasher.copy().digest()
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+def parse_prompt(prompt: str) -> List[Message]:
+    """Decode a legacy JSON-string prompt into its message list (ValueError if it isn't one)"""
+    messages = json.loads(prompt)
+    if not isinstance(messages, list):
+        raise ValueError("Parsed prompt is not a list")
+    return messages
+
+def fragment_cache_stats() -> Dict[str, Any]:
+    lookups = _fragments.hits + _fragments.misses
+    return {
+        "entries": len(_fragments.entries),
+        "hit_rate": round(_fragments.hits / lookups, 4) if lookups else 0.0
+    }
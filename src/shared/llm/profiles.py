@@ -0,0 +1,88 @@
+from dataclasses import dataclass, fields, replace
+from typing import Optional, Dict, Any, Tuple, Union
+import logging
+
+from src.core.config import settings
+from .structured import JOURNEY_EVALUATION, MODERATION, JsonSchema
+
+logger = logging.getLogger(__name__)
+
+JSON_OBJECT = "json_object"
+TOP_P = 0.9
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Sampling and length settings for one kind of completion"""
+    name: str
+    max_tokens: int
+    temperature: float
+    top_p: float = TOP_P
+    stop: Tuple[str, ...] = ()
+    # "json_object" asks the API for a single JSON object (the prompt must mention JSON)
+    response_format: Optional[str] = None
+    # Constrains the reply to this schema instead (takes precedence over response_format)
+    json_schema: Optional[JsonSchema] = None
+
+    def request_params(self) -> Dict[str, Any]:
+        """The chat completion request fields this profile sets"""
+        params: Dict[str, Any] = {
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p
+        }
+        if self.stop:
+            params["stop"] = list(self.stop)
+        if self.json_schema is not None:
+            params["response_format"] = self.json_schema.response_format()
+        elif self.response_format:
+            params["response_format"] = {"type": self.response_format}
+        return params
+
+def _builtin_profiles() -> Dict[str, GenerationProfile]:
+    return {
+        "default": GenerationProfile("default", settings.MAX_TOKENS, settings.TEMPERATURE),
+        # Character dialogue keeps the full budget
+        "story": GenerationProfile("story", settings.MAX_TOKENS, settings.TEMPERATURE),
+        "sandbox": GenerationProfile("sandbox", settings.MAX_TOKENS, settings.TEMPERATURE),
+        # Two or three one-line suggestions
+        "hints": GenerationProfile("hints", 120, 0.7),
+        # Callers that only ever use the first hint line
+        "single_hint": GenerationProfile("single_hint", 60, 0.7, stop=("\n",)),
+        "journey_evaluation": GenerationProfile("journey_evaluation", 250, 0.2, json_schema=JOURNEY_EVALUATION),
+        "moderation": GenerationProfile("moderation", 300, 0.0, json_schema=MODERATION),
+        "penpal": GenerationProfile("penpal", settings.MAX_TOKENS, 0.7)
+    }
+
+class GenerationProfiles:
+    """
+    Named generation profiles.
+
+    Built-in profiles cover each feature; LLM_GENERATION_PROFILES can
+    override their fields (other than json_schema) or add new ones, e.g.
+    {"hints": {"max_tokens": 90}, "terse": {"max_tokens": 40, "temperature": 0}}.
+    """
+    def __init__(self, overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.profiles = _builtin_profiles()
+        allowed = {f.name for f in fields(GenerationProfile)} - {"name", "json_schema"}
+        table = settings.LLM_GENERATION_PROFILES if overrides is None else overrides
+        for name, config in table.items():
+            unknown = set(config) - allowed
+            if unknown:
+                logger.warning(f"Ignoring unknown fields {sorted(unknown)} in generation profile '{name}'")
+            values = {k: v for k, v in config.items() if k in allowed}
+            if "stop" in values:
+                values["stop"] = tuple(values["stop"] or ())
+            base = self.profiles.get(name, self.profiles["default"])
+            self.profiles[name] = replace(base, name=name, **values)
+
+    def resolve(self, profile: Union[str, GenerationProfile, None], feature: str) -> GenerationProfile:
+        """The profile to use: as given, by name, or the feature's own (falling back to "default")"""
+        if isinstance(profile, GenerationProfile):
+            return profile
+        name = profile or feature
+        resolved = self.profiles.get(name)
+        if resolved is None:
+            if profile:
+                logger.warning(f"Unknown generation profile '{profile}'; using default")
+            return self.profiles["default"]
+        return resolved
@@ -1,26 +1,181 @@
-from typing import Optional
+from typing import Optional, Dict, Any
 import asyncio
-from datetime import datetime, timedelta
+import time
+import logging
 
-class RateLimitError(Exception):
+from src.core.config import settings
+from .exceptions import LLMError
+
+logger = logging.getLogger(__name__)
+
+class RateLimitError(LLMError):
     """Exception raised when rate limit is exceeded"""
     pass
 
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously on the monotonic clock.
+
+    `capacity` is the burst size and `rate` the refill speed in units per
+    second. All operations are O(1).
+    """
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def consume(self, amount: float):
+        """Take `amount` units; callers must check wait_time first"""
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """Return units that were reserved but not used"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
 class RateLimiter:
-    def __init__(self, requests_per_minute: int = 50):
-        self.requests_per_minute = requests_per_minute
-        self.requests = []
+    """
+    Waiting rate limiter with requests-per-minute and tokens-per-minute budgets.
+
+    Mirrors how the upstream API meters us: each call consumes one request
+    and its estimated token count. Callers that don't fit queue in FIFO
+    order until both budgets allow them through, and only fail with
+    RateLimitError when their deadline would pass first.
+    """
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_wait: Optional[float] = None
+    ):
+        self.requests_per_minute = requests_per_minute or settings.LLM_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or settings.LLM_TOKENS_PER_MINUTE
+        self.max_wait = settings.LLM_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        self.request_bucket = TokenBucket(self.requests_per_minute, self.requests_per_minute / 60.0)
+        self.token_bucket = TokenBucket(self.tokens_per_minute, self.tokens_per_minute / 60.0)
         self.lock = asyncio.Lock()
-    
-    async def acquire(self):
-        """Acquire rate limit permission"""
-        async with self.lock:
-            now = datetime.now()
-            # Remove requests older than 1 minute
-            self.requests = [req_time for req_time in self.requests 
-                           if now - req_time < timedelta(minutes=1)]
-            
-            if len(self.requests) >= self.requests_per_minute:
-                raise RateLimitError("Rate limit exceeded. Please wait before making more requests.")
-            
-            self.requests.append(now)
\ No newline at end of file
+
+        # Monitoring counters
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    async def acquire(self, tokens: int = 0, timeout: Optional[float] = None):
+        """
+        Wait until one request and `tokens` estimated tokens are available.
+
+        Raises RateLimitError if the budget cannot be granted within `timeout`
+        seconds (defaults to LLM_RATE_LIMIT_MAX_WAIT).
+        """
+        started = time.monotonic()
+        deadline = started + (self.max_wait if timeout is None else timeout)
+
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            # The lock is FIFO, so queued callers are served in arrival order
+            if self.lock.locked():
+                try:
+                    await asyncio.wait_for(self.lock.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    self._reject(started)
+            else:
+                # Free: taken at once, even by a caller with no time left to wait
+                await self.lock.acquire()
+
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = max(
+                        self.request_bucket.wait_time(1, now),
+                        self.token_bucket.wait_time(tokens, now)
+                    )
+                    if delay <= 0:
+                        self.request_bucket.consume(1)
+                        self.token_bucket.consume(tokens)
+                        break
+                    if now + delay > deadline:
+                        self._reject(started)
+                    await asyncio.sleep(delay)
+            finally:
+                self.lock.release()
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+
+    def _reject(self, started: float):
+        self.rejected += 1
+        waited = time.monotonic() - started
+        logger.warning(f"Rate limit wait exceeded deadline after {waited:.2f}s (queue depth {self.queue_depth})")
+        raise RateLimitError("Rate limit exceeded. Please wait before making more requests.")
+
+    async def refund(self, tokens: int):
+        """Return tokens that were estimated but not consumed upstream"""
+        if tokens > 0:
+            self.token_bucket.refund(tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, wait times and remaining budgets"""
+        now = time.monotonic()
+        self.request_bucket._refill(now)
+        self.token_bucket._refill(now)
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_requests": round(self.request_bucket.tokens, 2),
+            "available_tokens": round(self.token_bucket.tokens, 2),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait / self.acquired, 4) if self.acquired else 0.0,
+            "max_wait_seconds": round(self.max_wait_seen, 4)
+        }
+
+
+def create_rate_limiter(
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    key_prefix: Optional[str] = None
+):
+    """
+    Build the limiter selected by LLM_RATE_LIMITER_BACKEND.
+
+    "local" keeps the budget per process; "redis" shares one budget across
+    every worker and instance (and degrades to "local" if Redis is down).
+    Quotas default to LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE;
+    `key_prefix` keeps separate quotas apart in Redis.
+    """
+    backend = settings.LLM_RATE_LIMITER_BACKEND.lower()
+    if backend == "redis":
+        try:
+            from .redis_rate_limiter import RedisRateLimiter
+            return RedisRateLimiter(
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                key_prefix=key_prefix
+            )
+        except Exception as e:
+            logger.warning(f"Redis rate limiter unavailable ({e}); using local rate limiter")
+    elif backend != "local":
+        logger.warning(f"Unknown LLM_RATE_LIMITER_BACKEND '{backend}'; using local rate limiter")
+    return RateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
@@ -0,0 +1,116 @@
+from typing import Optional, Dict, Any, Tuple
+import json
+import time
+import zlib
+import logging
+
+from redis.exceptions import RedisError
+
+from src.core.config import settings
+from src.shared.redis import RedisService, get_redis_service
+
+logger = logging.getLogger(__name__)
+
+class RedisResponseCache:
+    """
+    Shared L2 tier for LLM responses, stored in Redis.
+
+    Values are JSON-encoded and zlib-compressed once they are large enough
+    for it to pay off; a one-byte marker records which. Redis expires
+    entries itself, and reads return the remaining TTL so the L1 copy never
+    outlives the shared one. Any Redis failure is treated as a miss and the
+    tier is skipped for a short cooldown, so a Redis outage only costs hit rate.
+    """
+    RETRY_REDIS_AFTER = 30.0
+    COMPRESS_MIN_BYTES = 512
+    RAW = b"j"
+    COMPRESSED = b"z"
+
+    def __init__(self, redis_service: Optional[RedisService] = None, key_prefix: Optional[str] = None):
+        self.redis_service = redis_service or get_redis_service()
+        self.key_prefix = key_prefix or settings.LLM_CACHE_KEY_PREFIX
+        self._redis_down_until = 0.0
+
+        # Monitoring counters
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}:{key}"
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error: Exception):
+        self.errors += 1
+        self._redis_down_until = time.monotonic() + self.RETRY_REDIS_AFTER
+        logger.warning(f"Redis response cache unavailable ({error}); skipping L2 for {self.RETRY_REDIS_AFTER:.0f}s")
+
+    @classmethod
+    def encode(cls, payload: bytes) -> bytes:
+        if len(payload) >= cls.COMPRESS_MIN_BYTES:
+            return cls.COMPRESSED + zlib.compress(payload, 6)
+        return cls.RAW + payload
+
+    @classmethod
+    def decode(cls, raw: bytes) -> Any:
+        marker, payload = raw[:1], raw[1:]
+        if marker == cls.COMPRESSED:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, remaining TTL in seconds), or None on a miss"""
+        if not self._redis_available():
+            return None
+        try:
+            async with self.redis_service.client.pipeline(transaction=False) as pipe:
+                raw, ttl_ms = await pipe.get(self._key(key)).pttl(self._key(key)).execute()
+        except (RedisError, OSError) as e:
+            self._mark_redis_down(e)
+            return None
+
+        if raw is None or ttl_ms is None or ttl_ms <= 0:
+            self.misses += 1
+            return None
+        try:
+            value = self.decode(raw)
+        except (ValueError, zlib.error) as e:
+            logger.warning(f"Dropping undecodable L2 cache entry {key}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value, ttl_ms / 1000.0
+
+    async def set(self, key: str, value: Any, ttl: float):
+        """Store a value for `ttl` seconds"""
+        if not self._redis_available():
+            return
+        try:
+            payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Response not cacheable in L2: {e}")
+            return
+        raw = self.encode(payload)
+        try:
+            await self.redis_service.client.set(self._key(key), raw, px=max(1, int(ttl * 1000)))
+        except (RedisError, OSError) as e:
+            self._mark_redis_down(e)
+            return
+        self.bytes_in += len(payload) + 1
+        self.bytes_stored += len(raw)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate, compression ratio and backend health"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis" if self._redis_available() else "unavailable",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+            "compression_ratio": round(self.bytes_stored / self.bytes_in, 4) if self.bytes_in else 1.0
+        }
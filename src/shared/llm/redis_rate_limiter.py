@@ -0,0 +1,198 @@
+from typing import Optional, Dict, Any
+import asyncio
+import random
+import time
+import logging
+
+from redis.exceptions import RedisError
+
+from src.core.config import settings
+from src.shared.redis import RedisService, get_redis_service
+from .rate_limiter import RateLimiter, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# GCRA over any number of quotas, evaluated atomically on the Redis server.
+#
+# KEYS[i]          theoretical arrival time (TAT, ms) for quota i
+# ARGV[2i-1]       emission interval for quota i (ms per unit)
+# ARGV[2i]         cost in units for quota i
+# ARGV[2n+1]       burst tolerance (ms) - one full period, i.e. capacity = limit
+#
+# Returns 0 when every quota admits the call (and records it), otherwise the
+# number of milliseconds until the most constrained quota would admit it.
+GCRA_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tau = tonumber(ARGV[#KEYS * 2 + 1])
+local retry = 0
+local new_tats = {}
+for i = 1, #KEYS do
+  local interval = tonumber(ARGV[i * 2 - 1])
+  local cost = tonumber(ARGV[i * 2])
+  local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+  if tat < now then tat = now end
+  local new_tat = tat + interval * cost
+  local allow_at = new_tat - tau
+  if allow_at > now then
+    retry = math.max(retry, math.ceil(allow_at - now))
+  end
+  new_tats[i] = new_tat
+end
+if retry > 0 then
+  return retry
+end
+for i = 1, #KEYS do
+  redis.call('SET', KEYS[i], tostring(new_tats[i]), 'PX', math.ceil(new_tats[i] - now) + 1000)
+end
+return 0
+"""
+
+# Give back units that were reserved but not used (never moves TAT before now)
+GCRA_REFUND_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+local new_tat = math.max(now, tat - tonumber(ARGV[1]) * tonumber(ARGV[2]))
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil(new_tat - now) + 1000)
+return 0
+"""
+
+class RedisRateLimiter:
+    """
+    Cluster-wide rate limiter sharing one request/token quota across every
+    worker and instance through Redis.
+
+    Same interface as RateLimiter. When Redis is unreachable the limiter
+    degrades to an in-process RateLimiter holding LLM_RATE_LIMIT_FALLBACK_SHARE
+    of the cluster budget (by default 1 / WEB_CONCURRENCY, so the workers
+    together stay within it), and retries Redis after a short cooldown.
+    """
+    PERIOD_MS = 60_000
+    RETRY_REDIS_AFTER = 30.0
+
+    def __init__(
+        self,
+        redis_service: Optional[RedisService] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        key_prefix: Optional[str] = None
+    ):
+        self.redis_service = redis_service or get_redis_service()
+        self.requests_per_minute = requests_per_minute or settings.LLM_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or settings.LLM_TOKENS_PER_MINUTE
+        self.max_wait = settings.LLM_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        prefix = key_prefix or settings.LLM_RATE_LIMIT_KEY_PREFIX
+        self.request_key = f"{prefix}:requests"
+        self.token_key = f"{prefix}:tokens"
+        self.request_interval = self.PERIOD_MS / self.requests_per_minute
+        self.token_interval = self.PERIOD_MS / self.tokens_per_minute
+
+        client = self.redis_service.client
+        self._acquire_script = client.register_script(GCRA_ACQUIRE_SCRIPT)
+        self._refund_script = client.register_script(GCRA_REFUND_SCRIPT)
+
+        share = settings.LLM_RATE_LIMIT_FALLBACK_SHARE
+        if share is None:
+            share = 1.0 / max(1, settings.WEB_CONCURRENCY)
+        self.fallback = RateLimiter(
+            requests_per_minute=max(1, int(self.requests_per_minute * share)),
+            tokens_per_minute=max(1, int(self.tokens_per_minute * share)),
+            max_wait=self.max_wait
+        )
+        self._redis_down_until = 0.0
+
+        # Monitoring counters
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.fallback_acquired = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error: Exception):
+        self._redis_down_until = time.monotonic() + self.RETRY_REDIS_AFTER
+        logger.warning(f"Redis rate limiter unavailable ({error}); using local fallback for {self.RETRY_REDIS_AFTER:.0f}s")
+
+    async def acquire(self, tokens: int = 0, timeout: Optional[float] = None):
+        """
+        Wait until the cluster-wide quota admits one request and `tokens`
+        estimated tokens. Raises RateLimitError if that can't happen within
+        `timeout` seconds (defaults to LLM_RATE_LIMIT_MAX_WAIT).
+        """
+        started = time.monotonic()
+        wait_budget = self.max_wait if timeout is None else timeout
+        deadline = started + wait_budget
+        # A single call can never need more than one full minute of budget
+        tokens = min(tokens, self.tokens_per_minute)
+
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            while True:
+                if not self._redis_available():
+                    await self.fallback.acquire(tokens=tokens, timeout=max(0.0, deadline - time.monotonic()))
+                    self.fallback_acquired += 1
+                    break
+
+                try:
+                    retry_ms = await self._acquire_script(
+                        keys=[self.request_key, self.token_key],
+                        args=[self.request_interval, 1, self.token_interval, tokens, self.PERIOD_MS]
+                    )
+                except (RedisError, OSError) as e:
+                    self._mark_redis_down(e)
+                    continue
+
+                retry_ms = int(retry_ms)
+                if retry_ms <= 0:
+                    break
+
+                now = time.monotonic()
+                delay = retry_ms / 1000.0
+                if now + delay > deadline:
+                    self.rejected += 1
+                    logger.warning(f"Cluster rate limit wait would exceed deadline ({delay:.2f}s needed)")
+                    raise RateLimitError("Rate limit exceeded. Please wait before making more requests.")
+                # Jitter spreads out workers that were told the same retry time
+                await asyncio.sleep(delay + random.uniform(0, min(0.05, delay)))
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+
+    async def refund(self, tokens: int):
+        """Return tokens that were estimated but not consumed upstream"""
+        if tokens <= 0:
+            return
+        if not self._redis_available():
+            await self.fallback.refund(tokens)
+            return
+        try:
+            await self._refund_script(keys=[self.token_key], args=[self.token_interval, tokens])
+        except (RedisError, OSError) as e:
+            self._mark_redis_down(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, wait times and backend health"""
+        return {
+            "backend": "redis" if self._redis_available() else "local-fallback",
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "fallback_acquired": self.fallback_acquired,
+            "rejected": self.rejected + self.fallback.rejected,
+            "avg_wait_seconds": round(self.total_wait / self.acquired, 4) if self.acquired else 0.0,
+            "max_wait_seconds": round(self.max_wait_seen, 4),
+            "fallback": self.fallback.get_stats()
+        }
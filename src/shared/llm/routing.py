@@ -0,0 +1,86 @@
+from dataclasses import dataclass, replace
+from typing import Optional, Dict, Any, Tuple
+import logging
+
+from src.core.config import settings
+from .hedging import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """Which model serves a feature, how long a call may take and what to fall back to"""
+    feature: str
+    model: str
+    timeout: float
+    fallback_model: Optional[str] = None
+
+    def fallback(self) -> "ModelRoute":
+        """The route to use once the primary model has failed (itself if there is no fallback)"""
+        if not self.fallback_model or self.fallback_model == self.model:
+            return self
+        return replace(self, model=self.fallback_model, fallback_model=None)
+
+class ModelRouter:
+    """
+    Feature -> model routing table with per-route latency tracking.
+
+    Routes come from LLM_MODEL_ROUTES, e.g.
+    {"hints": {"model": "gpt-4o-mini", "timeout": 4, "fallback_model": "gpt-3.5-turbo"}};
+    features without an entry (and missing fields) use MODEL_NAME and
+    LLM_REQUEST_TIMEOUT. Latency and errors are recorded per
+    (feature, model), so a fallback's numbers don't mix with the primary's.
+    """
+    def __init__(self, routes: Optional[Dict[str, Dict[str, Any]]] = None):
+        table = settings.LLM_MODEL_ROUTES if routes is None else routes
+        self.default = ModelRoute("default", settings.MODEL_NAME, settings.LLM_REQUEST_TIMEOUT)
+        self.routes: Dict[str, ModelRoute] = {}
+        for feature, config in table.items():
+            self.routes[feature] = ModelRoute(
+                feature=feature,
+                model=config.get("model") or self.default.model,
+                timeout=float(config.get("timeout") or self.default.timeout),
+                fallback_model=config.get("fallback_model")
+            )
+        self.latencies = LatencyTracker()
+
+        # Monitoring counters per (feature, model)
+        self.calls: Dict[Tuple[str, str], int] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+
+    def route(self, feature: str) -> ModelRoute:
+        route = self.routes.get(feature)
+        if route is None:
+            return replace(self.default, feature=feature)
+        return route
+
+    def record(self, route: ModelRoute, latency: Optional[float] = None, ok: bool = True):
+        """Record one upstream call on `route`; `latency` is its response (or first-token) time"""
+        key = (route.feature, route.model)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if not ok:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        elif latency is not None:
+            self.latencies.record(f"{route.feature}:{route.model}", latency)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Route table and latency percentiles per (feature, model)"""
+        stats = {}
+        for (feature, model), calls in sorted(self.calls.items()):
+            name = f"{feature}:{model}"
+            p50 = self.latencies.percentile(name, 50)
+            p95 = self.latencies.percentile(name, 95)
+            stats[name] = {
+                "calls": calls,
+                "errors": self.errors.get((feature, model), 0),
+                "latency_p50_seconds": round(p50, 4) if p50 is not None else None,
+                "latency_p95_seconds": round(p95, 4) if p95 is not None else None
+            }
+        return {
+            "routes": {
+                feature: {"model": r.model, "timeout": r.timeout, "fallback_model": r.fallback_model}
+                for feature, r in sorted(self.routes.items())
+            },
+            "default_model": self.default.model,
+            "calls": stats
+        }
@@ -0,0 +1,172 @@
+from typing import Optional, Dict, Any, Tuple, List
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import time
+import logging
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lanes: interactive work a child is actively waiting on vs. background work
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Share of dispatch capacity per lane when both have queued work
+LANE_WEIGHTS = {
+    INTERACTIVE: 8.0,
+    BACKGROUND: 1.0
+}
+
+# Feature tag -> lane. Unknown features are treated as interactive.
+FEATURE_LANES = {
+    "story": INTERACTIVE,
+    "sandbox": INTERACTIVE,
+    "journey_evaluation": INTERACTIVE,
+    "hints": BACKGROUND,
+    "moderation": BACKGROUND,
+    "penpal": BACKGROUND,
+    # Lines of batches run by the local batch endpoint
+    "batch": BACKGROUND
+}
+
+def lane_for(feature: str) -> str:
+    """Return the scheduling lane for a feature tag"""
+    return FEATURE_LANES.get(feature, INTERACTIVE)
+
+class LaneStats:
+    """Queue latency tracking for one lane"""
+    WINDOW = 512
+
+    def __init__(self):
+        self.queued = 0
+        self.dispatched = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=self.WINDOW)
+
+    def record(self, wait: float):
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_waits)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "queued": self.queued,
+            "dispatched": self.dispatched,
+            "cancelled": self.cancelled,
+            "avg_wait_seconds": round(self.total_wait / self.dispatched, 4) if self.dispatched else 0.0,
+            "p95_wait_seconds": round(p95, 4),
+            "max_wait_seconds": round(self.max_wait, 4)
+        }
+
+class FairScheduler:
+    """
+    Weighted fair queuing of LLM calls across (user, feature) flows.
+
+    At most `capacity` calls run upstream at once. When that is reached,
+    callers queue and are released in order of their virtual finish tag
+    (start-time fair queuing): each flow's tags advance by 1/weight per
+    request, so a student spamming messages only delays their own flow, and
+    the interactive lane's higher weight lets it overtake background work
+    without ever starving it.
+    """
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity or settings.LLM_SCHEDULER_CONCURRENCY
+        self.in_flight = 0
+        self.waiting = 0
+        self.virtual_time = 0.0
+        self._heap: List[Tuple[float, int, asyncio.Future, str, float]] = []
+        self._flow_finish: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+        self.lanes: Dict[str, LaneStats] = {INTERACTIVE: LaneStats(), BACKGROUND: LaneStats()}
+
+    def _finish_tag(self, flow: Tuple[str, str], lane: str) -> float:
+        start = max(self.virtual_time, self._flow_finish.get(flow, 0.0))
+        finish = start + 1.0 / LANE_WEIGHTS[lane]
+        self._flow_finish[flow] = finish
+        return finish
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < self.capacity
+
+    def _dispatch(self):
+        """Release queued callers while there is capacity"""
+        while self.waiting and self._has_capacity():
+            finish, _, future, lane, enqueued_at = heapq.heappop(self._heap)
+            if future.done():
+                # Caller gave up while queued
+                continue
+            self.virtual_time = max(self.virtual_time, finish)
+            self.in_flight += 1
+            self.waiting -= 1
+            self.lanes[lane].queued -= 1
+            self.lanes[lane].record(time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+        if not self.waiting:
+            # Idle: drop entries of callers that gave up and forget finish
+            # tags that can no longer affect ordering
+            self._heap.clear()
+            self._flow_finish = {
+                flow: tag for flow, tag in self._flow_finish.items() if tag > self.virtual_time
+            }
+
+    async def acquire(self, feature: str, user_id: Optional[str] = None):
+        """Wait for this (user, feature) flow's fair turn at an upstream slot"""
+        lane = lane_for(feature)
+        flow = (user_id or "anonymous", feature)
+        finish = self._finish_tag(flow, lane)
+
+        if self._has_capacity() and not self.waiting:
+            self.virtual_time = max(self.virtual_time, finish)
+            self.in_flight += 1
+            self.lanes[lane].record(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (finish, next(self._seq), future, lane, time.monotonic()))
+        self.waiting += 1
+        self.lanes[lane].queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled - hand it on
+                self.release()
+            else:
+                future.cancel()
+                self.waiting -= 1
+                self.lanes[lane].queued -= 1
+                self.lanes[lane].cancelled += 1
+            raise
+
+    def release(self):
+        """Return a slot and wake the next fair-share caller"""
+        self.in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, feature: str, user_id: Optional[str] = None):
+        """Hold an upstream slot for the duration of the block"""
+        await self.acquire(feature, user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-lane queue latency and current occupancy"""
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": self.waiting,
+            "lanes": {lane: stats.snapshot() for lane, stats in self.lanes.items()}
+        }
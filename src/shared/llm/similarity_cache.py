@@ -0,0 +1,203 @@
+from typing import Any, Optional, Dict, List, NamedTuple, Set, Tuple
+from collections import Counter, OrderedDict
+import hashlib
+import random
+import re
+import time
+import zlib
+import logging
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SimilarityKey(NamedTuple):
+    """
+    What makes two LLM calls interchangeable for the similarity cache.
+
+    `scope` must pin down everything except the free text (character, level,
+    question, prompt template...); `text` is the student or character line
+    that near-duplicates are matched on.
+    """
+    scope: str
+    text: str
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _WHITESPACE.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+
+class MinHasher:
+    """
+    MinHash signatures over character shingles.
+
+    Uses universal hashing (a*x + b mod a Mersenne prime) on CRC32 shingle
+    hashes, so signatures are deterministic across processes.
+    """
+    def __init__(self, num_perm: int = 64, shingle_size: int = 4, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def shingles(self, text: str) -> Set[int]:
+        size = self.shingle_size
+        if len(text) <= size:
+            return {zlib.crc32(text.encode("utf-8"))}
+        return {zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        shingles = self.shingles(text)
+        return tuple(
+            min((a * x + b) % _MERSENNE_PRIME for x in shingles)
+            for a, b in self.params
+        )
+
+class _Entry:
+    __slots__ = ("signature", "value", "expires_at", "band_keys")
+
+    def __init__(self, signature: Tuple[int, ...], value: Any, expires_at: float, band_keys: List[Tuple]):
+        self.signature = signature
+        self.value = value
+        self.expires_at = expires_at
+        self.band_keys = band_keys
+
+class SimilarityCache:
+    """
+    Near-duplicate response cache using MinHash with LSH banding.
+
+    A lookup returns the response cached for a text whose estimated Jaccard
+    similarity (over character 4-grams of the normalized text) reaches
+    `threshold` within the same scope. Signatures are split into `bands`
+    bands; only entries sharing at least one whole band are compared, so
+    lookups stay cheap however many entries are cached. Bounded by
+    `max_entries` (LRU) and a TTL, and limited to the features in
+    LLM_SIMILARITY_CACHE_FEATURES.
+    """
+    # Candidates verified per lookup, in order of shared bands
+    MAX_CANDIDATES = 32
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        features: Optional[List[str]] = None,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        num_perm: int = 64,
+        bands: int = 16
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold or settings.LLM_SIMILARITY_THRESHOLD
+        self.features = set(settings.LLM_SIMILARITY_CACHE_FEATURES if features is None else features)
+        self.max_entries = max_entries or settings.LLM_SIMILARITY_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.LLM_SIMILARITY_CACHE_TTL_SECONDS
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Entries keyed by (scope, exact normalized text digest)
+        self.entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        # (scope, band index, band values) -> entry keys
+        self.buckets: Dict[Tuple, Set[Tuple[str, str]]] = {}
+
+        # Monitoring counters per feature
+        self.lookups: Dict[str, int] = {}
+        self.hits: Dict[str, int] = {}
+
+    def enabled_for(self, feature: str) -> bool:
+        return feature in self.features
+
+    @staticmethod
+    def _scope_digest(scope: str) -> str:
+        return hashlib.blake2b(scope.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]) -> List[Tuple]:
+        rows = self.rows
+        return [(scope, band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def _similarity(self, a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+    def get(self, feature: str, key: SimilarityKey) -> Optional[Any]:
+        """Return the response cached for a near-duplicate of `key.text`, or None"""
+        if not self.enabled_for(feature):
+            return None
+        self.lookups[feature] = self.lookups.get(feature, 0) + 1
+        text = normalize_text(key.text)
+        if not text:
+            return None
+        scope = self._scope_digest(key.scope)
+        signature = self.hasher.signature(text)
+        now = time.monotonic()
+
+        # Entries sharing more bands are more similar, so verify those first
+        shared_bands: Counter = Counter()
+        for band_key in self._band_keys(scope, signature):
+            shared_bands.update(self.buckets.get(band_key, ()))
+
+        best_key, best_similarity = None, 0.0
+        for entry_key, _ in shared_bands.most_common(self.MAX_CANDIDATES):
+            entry = self.entries[entry_key]
+            if entry.expires_at <= now:
+                self._remove(entry_key)
+                continue
+            similarity = self._similarity(signature, entry.signature)
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_key, best_similarity = entry_key, similarity
+                if similarity == 1.0:
+                    break
+
+        if best_key is None:
+            return None
+        self.entries.move_to_end(best_key)
+        self.hits[feature] = self.hits.get(feature, 0) + 1
+        logger.debug(f"Similarity cache hit for {feature} (estimated Jaccard {best_similarity:.2f})")
+        return self.entries[best_key].value
+
+    def set(self, feature: str, key: SimilarityKey, value: Any):
+        """Cache a response for `key.text` so near-duplicates can reuse it"""
+        if not self.enabled_for(feature):
+            return
+        text = normalize_text(key.text)
+        if not text:
+            return
+        scope = self._scope_digest(key.scope)
+        entry_key = (scope, hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest())
+        if entry_key in self.entries:
+            self._remove(entry_key)
+
+        signature = self.hasher.signature(text)
+        band_keys = self._band_keys(scope, signature)
+        self.entries[entry_key] = _Entry(signature, value, time.monotonic() + self.ttl_seconds, band_keys)
+        for band_key in band_keys:
+            self.buckets.setdefault(band_key, set()).add(entry_key)
+
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, entry_key: Tuple[str, str]):
+        entry = self.entries.pop(entry_key)
+        for band_key in entry.band_keys:
+            bucket = self.buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Entries and per-feature hit rates"""
+        return {
+            "entries": len(self.entries),
+            "threshold": self.threshold,
+            "features": {
+                feature: {
+                    "lookups": self.lookups.get(feature, 0),
+                    "hits": self.hits.get(feature, 0),
+                    "hit_rate": round(self.hits.get(feature, 0) / self.lookups[feature], 4) if self.lookups.get(feature) else 0.0
+                }
+                for feature in sorted(self.features)
+            }
+        }
@@ -0,0 +1,83 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import contextvars
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    """One upstream call and the callers waiting on it"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs await the same task. Every waiter gets the result or the
+    exception. The task runs in the context given by the caller that starts
+    it, by default an empty one, so nothing scoped to that caller's request
+    (its deadline or cancellation token) applies to work the others share;
+    each waiter bounds its own wait instead. Cancelling one waiter only detaches that waiter,
+    and the work is cancelled once no waiter is left. The key is forgotten when the task
+    finishes, so later calls start fresh (the response cache covers those).
+    """
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+        # Monitoring counters
+        self.executed = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        context: Optional[contextvars.Context] = None
+    ) -> Any:
+        """Run `fn()` in `context` unless a call with the same key is already in flight, and return its result"""
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.get_running_loop().create_task(fn(), context=context or contextvars.Context())
+            flight = _Flight(task)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded so a cancelled waiter doesn't cancel the shared work
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody wants the result any more - stop paying for it
+                self.abandoned += 1
+                flight.task.cancel()
+
+    def waiters(self, key: str) -> int:
+        """Callers still waiting on the call in flight for `key`"""
+        flight = self._flights.get(key)
+        return flight.waiters if flight is not None and not flight.task.done() else 0
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Executed vs coalesced call counts"""
+        total = self.executed + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0
+        }
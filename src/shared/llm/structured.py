@@ -0,0 +1,114 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from .exceptions import ResponseParsingError
+from .sse import JSONDecodeError, loads
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+    "null": type(None)
+}
+
+@dataclass(frozen=True)
+class JsonSchema:
+    """
+    A JSON schema for structured output.
+
+    Sent as the provider's `json_schema` response format and checked again on
+    the reply. `strict` asks the provider to guarantee the shape; that needs
+    every property listed in `required` and additionalProperties false.
+    Local validation covers the subset used here: type, properties,
+    required, additionalProperties, items and enum.
+    """
+    name: str
+    schema: Dict[str, Any] = field(hash=False, compare=False)
+    strict: bool = True
+
+    def response_format(self) -> Dict[str, Any]:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": self.name, "schema": self.schema, "strict": self.strict}
+        }
+
+    def validate(self, value: Any) -> Optional[str]:
+        """The first way `value` violates the schema, or None if it conforms"""
+        return _check(value, self.schema, "$")
+
+def _check(value: Any, schema: Dict[str, Any], path: str) -> Optional[str]:
+    expected = schema.get("type")
+    if expected is not None:
+        names = expected if isinstance(expected, list) else [expected]
+        # bool is an int subclass, but not a JSON number
+        if isinstance(value, bool) and "boolean" not in names:
+            return f"{path}: expected {' or '.join(names)}, got boolean"
+        if not any(isinstance(value, _TYPES[name]) for name in names if name in _TYPES):
+            return f"{path}: expected {' or '.join(names)}, got {type(value).__name__}"
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{path}: {value!r} is not one of {schema['enum']}"
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", ()):
+            if name not in value:
+                return f"{path}: missing required property '{name}'"
+        for name, item in value.items():
+            if name in properties:
+                error = _check(item, properties[name], f"{path}.{name}")
+                if error:
+                    return error
+            elif schema.get("additionalProperties") is False:
+                return f"{path}: unexpected property '{name}'"
+    elif isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            error = _check(item, schema["items"], f"{path}[{index}]")
+            if error:
+                return error
+    return None
+
+def parse_json_object(raw: str, schema: Optional[JsonSchema] = None) -> Dict[str, Any]:
+    """
+    Decode a completion that must be one JSON object, validating it against `schema`.
+
+    A single decode and one pass over the result; anything else raises
+    ResponseParsingError carrying the raw text.
+    """
+    if not isinstance(raw, (str, bytes)):
+        raise ResponseParsingError(f"Completion is {type(raw).__name__}, not JSON text")
+    try:
+        value = loads(raw)
+    except JSONDecodeError as e:
+        raise ResponseParsingError(f"Completion is not valid JSON: {e}", raw=raw)
+    if not isinstance(value, dict):
+        raise ResponseParsingError(f"Completion is JSON {type(value).__name__}, not an object", raw=raw)
+    if schema is not None:
+        error = schema.validate(value)
+        if error:
+            raise ResponseParsingError(f"Completion does not match schema '{schema.name}': {error}", raw=raw)
+    return value
+
+MODERATION = JsonSchema("moderation", {
+    "type": "object",
+    "properties": {
+        "is_appropriate": {"type": "boolean"},
+        "inappropriate_reason": {"type": ["string", "null"]},
+        "corrected_text": {"type": "string"},
+        "grammar_feedback": {"type": "string"}
+    },
+    "required": ["is_appropriate", "inappropriate_reason", "corrected_text", "grammar_feedback"],
+    "additionalProperties": False
+})
+
+# Evaluation prompts live in per-character template files and may ask for
+# more fields, so only the two the service reads are pinned down
+JOURNEY_EVALUATION = JsonSchema("journey_evaluation", {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number"},
+        "feedback": {"type": "string"}
+    },
+    "required": ["score", "feedback"]
+}, strict=False)
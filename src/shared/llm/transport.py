@@ -0,0 +1,396 @@
+from typing import Optional, Dict, Any, AsyncIterator, Union
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import aiohttp
+import asyncio
+import logging
+
+from src.core.config import settings
+from .exceptions import APIError
+
+logger = logging.getLogger(__name__)
+
+# A request body: a dict to encode, or JSON bytes the caller has already encoded
+Payload = Union[Dict[str, Any], bytes]
+
+def _body(payload: Payload, raw_field: str) -> Dict[str, Any]:
+    """Request keyword for `payload`: `json=` for a dict, `raw_field` for pre-encoded bytes"""
+    if isinstance(payload, bytes):
+        return {raw_field: payload}
+    return {"json": payload}
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class LLMTransport(ABC):
+    """
+    Interface for the HTTP layer underneath LLMClient.
+
+    Implementations raise asyncio.TimeoutError when a request exceeds its
+    timeout and APIError (carrying the HTTP status, if any) for every other
+    failure, so the client's retry logic is independent of the backend.
+    """
+    base_url: str
+
+    @abstractmethod
+    async def start(self, prewarm_connections: Optional[int] = None):
+        """Open the connection pool ahead of the first request"""
+
+    @abstractmethod
+    async def post_json(self, url: str, headers: Dict[str, str], payload: Payload, timeout: float) -> Dict[str, Any]:
+        """POST a JSON payload (dict or encoded bytes) and return the decoded JSON response"""
+
+    @abstractmethod
+    def stream_chunks(self, url: str, headers: Dict[str, str], payload: Payload, timeout: float) -> AsyncIterator[bytes]:
+        """POST a JSON payload (dict or encoded bytes) and yield the response body as it arrives"""
+
+    def connection_count(self) -> int:
+        """Number of open upstream connections, for monitoring and benchmarks"""
+        return 0
+
+    @abstractmethod
+    async def close(self):
+        """Close all pooled connections"""
+
+
+class AiohttpTransport(LLMTransport):
+    """
+    Pooled HTTP transport for outbound LLM calls.
+
+    Owns a single aiohttp.ClientSession backed by a tuned TCPConnector so that
+    every LLMClient in the process reuses the same keep-alive connections
+    instead of paying a fresh TLS handshake per request.
+    """
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+        dns_cache_ttl: Optional[int] = None
+    ):
+        self.base_url = (base_url or settings.LLM_API_BASE_URL).rstrip("/")
+        self.limit = limit or settings.LLM_POOL_LIMIT
+        self.limit_per_host = limit_per_host or settings.LLM_POOL_LIMIT_PER_HOST
+        self.keepalive_timeout = keepalive_timeout or settings.LLM_KEEPALIVE_TIMEOUT
+        self.dns_cache_ttl = dns_cache_ttl or settings.LLM_DNS_CACHE_TTL
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Create a session with a connector tuned for a single busy upstream host"""
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+            enable_cleanup_closed=True
+        )
+        # Per-request timeouts are set by the caller; the session itself never times out
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None)
+        )
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Return the pooled session, creating it only when it is missing, closed
+        or bound to another event loop. Healthy pooled sockets are never
+        discarded because a single request failed.
+        """
+        current_loop = asyncio.get_running_loop()
+
+        if self._lock is None or self.session_loop is not current_loop:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self.session is not None and not self.session.closed:
+                if self.session_loop is current_loop:
+                    return self.session
+
+                logger.warning("Pooled session belongs to a different event loop - creating new session")
+                old_session = self.session
+                # Close in background without awaiting to avoid cross-loop problems
+                asyncio.create_task(self._close_session_safe(old_session))
+
+            self.session = self._create_session()
+            self.session_loop = current_loop
+            logger.info(
+                f"Created pooled aiohttp session (limit={self.limit}, "
+                f"limit_per_host={self.limit_per_host}, keepalive={self.keepalive_timeout}s)"
+            )
+            return self.session
+
+    async def start(self, prewarm_connections: Optional[int] = None):
+        """Create the pooled session and open connections ahead of the first request"""
+        await self.get_session()
+        count = settings.LLM_PREWARM_CONNECTIONS if prewarm_connections is None else prewarm_connections
+        if count > 0:
+            await self.prewarm(count)
+
+    async def prewarm(self, count: int):
+        """
+        Open `count` keep-alive connections to the upstream host.
+
+        Each HEAD request completes DNS resolution and the TLS handshake; the
+        socket is then returned to the pool for later requests to reuse.
+        Failures are logged and ignored - prewarming is an optimisation only.
+        """
+        session = await self.get_session()
+
+        async def _open_one():
+            async with session.head(self.base_url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                await response.read()
+
+        results = await asyncio.gather(*(_open_one() for _ in range(count)), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"Prewarmed {count - len(failures)}/{count} LLM connections; first error: {failures[0]}")
+        else:
+            logger.info(f"Prewarmed {count} LLM connections to {self.base_url}")
+
+    async def post_json(self, url: str, headers: Dict[str, str], payload: Payload, timeout: float) -> Dict[str, Any]:
+        """POST a JSON payload over HTTP/1.1 and return the decoded JSON response"""
+        session = await self.get_session()
+        try:
+            async with session.post(url, headers=headers, timeout=timeout, **_body(payload, "data")) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise APIError(
+                        f"API returned {response.status}: {error_text}",
+                        status=response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                return await response.json()
+        except aiohttp.ClientError as e:
+            raise APIError(f"API request failed: {str(e)}")
+
+    async def stream_chunks(self, url: str, headers: Dict[str, str], payload: Payload, timeout: float) -> AsyncIterator[bytes]:
+        """POST a JSON payload over HTTP/1.1 and yield the response body as it arrives (split anywhere)"""
+        session = await self.get_session()
+        try:
+            async with session.post(url, headers=headers, timeout=timeout, **_body(payload, "data")) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise APIError(
+                        f"API returned {response.status}: {error_text}",
+                        status=response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                async for chunk in response.content.iter_any():
+                    yield chunk
+        except aiohttp.ClientError as e:
+            raise APIError(f"Streaming API request failed: {str(e)}")
+
+    def connection_count(self) -> int:
+        """Number of open upstream connections (idle and in use)"""
+        if self.session is None or self.session.closed or self.session.connector is None:
+            return 0
+        connector = self.session.connector
+        idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        return idle + len(getattr(connector, "_acquired", ()))
+
+    async def _close_session_safe(self, session: Optional[aiohttp.ClientSession]):
+        """Safely close a session without expecting it to work"""
+        if session and not session.closed:
+            try:
+                await session.close()
+                logger.info("Closed pooled aiohttp session")
+            except Exception as e:
+                logger.warning(f"Error closing pooled session: {e}")
+
+    async def close(self):
+        """Close the pooled session and all of its connections"""
+        session_to_close = self.session
+        self.session = None
+        self.session_loop = None
+        await self._close_session_safe(session_to_close)
+
+
+class Http2Transport(LLMTransport):
+    """
+    HTTP/2 transport for outbound LLM calls, backed by httpx.
+
+    Concurrent requests - in particular long-lived token streams - are
+    multiplexed as separate streams over a handful of connections instead of
+    each holding an HTTP/1.1 socket for its whole duration.
+    """
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+        prior_knowledge: bool = False
+    ):
+        import httpx  # Optional dependency; only needed when LLM_TRANSPORT=http2
+
+        self._httpx = httpx
+        self.base_url = (base_url or settings.LLM_API_BASE_URL).rstrip("/")
+        self.max_connections = max_connections or settings.LLM_HTTP2_MAX_CONNECTIONS
+        self.keepalive_timeout = keepalive_timeout or settings.LLM_KEEPALIVE_TIMEOUT
+        # Prior knowledge speaks HTTP/2 over cleartext (h2c), used for local stand-ins
+        self.prior_knowledge = prior_knowledge
+        self.client = None
+        self.client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_client(self):
+        httpx = self._httpx
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_timeout
+        )
+        return httpx.AsyncClient(
+            http1=not self.prior_knowledge,
+            http2=True,
+            limits=limits,
+            timeout=None
+        )
+
+    async def get_client(self):
+        """Return the pooled httpx client, recreating it only if it is closed or on another loop"""
+        current_loop = asyncio.get_running_loop()
+        if self.client is not None and not self.client.is_closed and self.client_loop is current_loop:
+            return self.client
+        if self.client is not None and not self.client.is_closed:
+            logger.warning("HTTP/2 client belongs to a different event loop - creating new client")
+            asyncio.create_task(self._close_client_safe(self.client))
+        self.client = self._create_client()
+        self.client_loop = current_loop
+        logger.info(f"Created pooled HTTP/2 client (max_connections={self.max_connections})")
+        return self.client
+
+    async def start(self, prewarm_connections: Optional[int] = None):
+        """Create the client and open one multiplexed connection ahead of the first request"""
+        client = await self.get_client()
+        count = settings.LLM_PREWARM_CONNECTIONS if prewarm_connections is None else prewarm_connections
+        if count <= 0:
+            return
+        # A single HTTP/2 connection carries many streams, so one handshake is enough
+        try:
+            await client.head(self.base_url, timeout=5)
+            logger.info(f"Prewarmed HTTP/2 connection to {self.base_url}")
+        except Exception as e:
+            logger.warning(f"Failed to prewarm HTTP/2 connection: {e}")
+
+    async def post_json(self, url: str, headers: Dict[str, str], payload: Payload, timeout: float) -> Dict[str, Any]:
+        """POST a JSON payload over HTTP/2 and return the decoded JSON response"""
+        httpx = self._httpx
+        client = await self.get_client()
+        try:
+            response = await client.post(url, headers=headers, timeout=timeout, **_body(payload, "content"))
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e))
+        except httpx.HTTPError as e:
+            raise APIError(f"API request failed: {str(e)}")
+        if response.status_code != 200:
+            raise APIError(
+                f"API returned {response.status_code}: {response.text}",
+                status=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After"))
+            )
+        return response.json()
+
+    async def stream_chunks(self, url: str, headers: Dict[str, str], payload: Payload, timeout: float) -> AsyncIterator[bytes]:
+        """POST a JSON payload over HTTP/2 and yield the response body as it arrives (split anywhere)"""
+        httpx = self._httpx
+        client = await self.get_client()
+        try:
+            async with client.stream("POST", url, headers=headers, timeout=timeout, **_body(payload, "content")) as response:
+                if response.status_code != 200:
+                    error_text = (await response.aread()).decode("utf-8", errors="replace")
+                    raise APIError(
+                        f"API returned {response.status_code}: {error_text}",
+                        status=response.status_code,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e))
+        except httpx.HTTPError as e:
+            raise APIError(f"Streaming API request failed: {str(e)}")
+
+    def connection_count(self) -> int:
+        """Number of open upstream connections"""
+        if self.client is None or self.client.is_closed:
+            return 0
+        pool = getattr(self.client, "_transport", None)
+        connections = getattr(getattr(pool, "_pool", None), "connections", None)
+        return len(connections) if connections is not None else 0
+
+    async def _close_client_safe(self, client):
+        """Safely close a client without expecting it to work"""
+        try:
+            await client.aclose()
+            logger.info("Closed pooled HTTP/2 client")
+        except Exception as e:
+            logger.warning(f"Error closing HTTP/2 client: {e}")
+
+    async def close(self):
+        """Close the pooled client and all of its connections"""
+        client_to_close = self.client
+        self.client = None
+        self.client_loop = None
+        if client_to_close is not None and not client_to_close.is_closed:
+            await self._close_client_safe(client_to_close)
+
+
+def create_transport(kind: Optional[str] = None, base_url: Optional[str] = None) -> LLMTransport:
+    """
+    Build the transport selected by LLM_TRANSPORT ("aiohttp" or "http2").
+
+    Falls back to the aiohttp transport when the HTTP/2 extras (httpx and h2)
+    are not installed.
+    """
+    kind = (kind or settings.LLM_TRANSPORT).lower()
+    if kind == "http2":
+        try:
+            import h2  # noqa: F401 - httpx only negotiates HTTP/2 when h2 is present
+            return Http2Transport(base_url=base_url)
+        except ImportError as e:
+            logger.warning(f"HTTP/2 transport unavailable ({e}); falling back to aiohttp")
+    elif kind != "aiohttp":
+        logger.warning(f"Unknown LLM_TRANSPORT '{kind}'; falling back to aiohttp")
+    return AiohttpTransport(base_url=base_url)
+
+
+# Process-wide transports, one per upstream base URL, shared by every LLMClient
+_shared_transports: Dict[str, LLMTransport] = {}
+
+def get_shared_transport(base_url: Optional[str] = None) -> LLMTransport:
+    """Return the process-wide transport for `base_url` (default LLM_API_BASE_URL), creating it on first use"""
+    key = (base_url or settings.LLM_API_BASE_URL).rstrip("/")
+    transport = _shared_transports.get(key)
+    if transport is None:
+        transport = _shared_transports[key] = create_transport(base_url=key)
+    return transport
+
+async def start_shared_transports():
+    """Open and prewarm every process-wide transport created so far"""
+    for transport in list(_shared_transports.values()):
+        await transport.start()
+
+async def close_shared_transport():
+    """Close the process-wide transports (called from the app shutdown handler)"""
+    transports = list(_shared_transports.values())
+    _shared_transports.clear()
+    for transport in transports:
+        await transport.close()
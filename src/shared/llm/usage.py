@@ -0,0 +1,230 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+import logging
+
+from src.core.config import settings
+from .context import LLMCallContext
+from .exceptions import BudgetExceededError
+from .hedging import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+ALL_FEATURES = "*"
+
+@dataclass(frozen=True)
+class TokenUsage:
+    """Tokens billed for one completion"""
+    prompt_tokens: int
+    completion_tokens: int
+    # True when the API reported no usage and the counts are ~4 bytes per token guesses
+    estimated: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @classmethod
+    def from_response(cls, usage: Any) -> Optional["TokenUsage"]:
+        """Read the `usage` block of a completion (or of a stream's final chunk)"""
+        if not isinstance(usage, dict):
+            return None
+        try:
+            return cls(int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0))
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def estimate(cls, prompt_size: int, completion_chars: int) -> "TokenUsage":
+        return cls(prompt_size // 4 + 1, completion_chars // 4, estimated=True)
+
+class _Totals:
+    """Running token and latency totals for one feature, user or session"""
+    __slots__ = ("calls", "prompt_tokens", "completion_tokens", "estimated_calls", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_calls = 0
+        self.latency = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, usage: TokenUsage, latency: float):
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.estimated_calls += usage.estimated
+        self.latency += latency
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "estimated_calls": self.estimated_calls,
+            "mean_latency_seconds": round(self.latency / self.calls, 4) if self.calls else None
+        }
+
+class UsageTracker:
+    """
+    Token usage and latency per feature, user and session, with session budgets.
+
+    Budgets come from LLM_SESSION_TOKEN_BUDGETS: a feature's own entry caps
+    that feature's tokens per session, and "*" caps the session as a whole.
+    Features in LLM_BUDGET_OPTIONAL_FEATURES (hints) are skipped from
+    LLM_BUDGET_DEGRADE_AT of the "*" budget, so the conversation itself keeps
+    going for longer. Moderation is never refused. Counts are per process;
+    users and sessions not seen for a while are dropped after MAX_TRACKED,
+    taking their totals with them.
+    """
+    MAX_TRACKED = 10000
+    # Safety checks run whatever the session has spent
+    EXEMPT_FEATURES = frozenset({"moderation"})
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = settings.LLM_SESSION_TOKEN_BUDGETS if budgets is None else budgets
+        self.features: Dict[str, _Totals] = {}
+        # The same, for calls that ran to the end: what a cancelled call would have cost
+        self.finished: Dict[str, _Totals] = {}
+        self.users: "OrderedDict[str, _Totals]" = OrderedDict()
+        # Per session, the session total under "*" and each feature's share
+        self.sessions: "OrderedDict[str, Dict[str, _Totals]]" = OrderedDict()
+        self.ttft = LatencyTracker()
+        self.latency = LatencyTracker()
+
+        # Monitoring counters
+        self.rejected: Dict[str, int] = {}
+        # Calls cut short by a client cancellation, the completion tokens
+        # that spared (estimated), and why they were cancelled
+        self.cancelled: Dict[str, int] = {}
+        self.tokens_saved: Dict[str, int] = {}
+        self.cancel_reasons: Dict[str, int] = {}
+
+    def record(
+        self,
+        feature: str,
+        usage: TokenUsage,
+        latency: float,
+        context: LLMCallContext,
+        ttft: Optional[float] = None,
+        finished: bool = True
+    ):
+        """
+        Account one upstream completion.
+
+        `latency` is the whole call, `ttft` the time to the first token
+        (the same as `latency` for non-streamed calls). `finished` is False
+        for a stream that broke off or was cancelled.
+        """
+        self.features.setdefault(feature, _Totals()).add(usage, latency)
+        if finished:
+            self.finished.setdefault(feature, _Totals()).add(usage, latency)
+        self.latency.record(feature, latency)
+        self.ttft.record(feature, latency if ttft is None else ttft)
+        if context.user_id is not None:
+            self._entry(self.users, context.user_id, _Totals).add(usage, latency)
+        if context.session_id is not None:
+            session = self._entry(self.sessions, context.session_id, dict)
+            session.setdefault(ALL_FEATURES, _Totals()).add(usage, latency)
+            session.setdefault(feature, _Totals()).add(usage, latency)
+
+    def record_cancelled(self, feature: str, tokens_saved: int, reason: Optional[str]):
+        """Account a call abandoned because its client cancelled, and what it would have cost"""
+        self.cancelled[feature] = self.cancelled.get(feature, 0) + 1
+        self.tokens_saved[feature] = self.tokens_saved.get(feature, 0) + tokens_saved
+        reason = reason or "cancelled"
+        self.cancel_reasons[reason] = self.cancel_reasons.get(reason, 0) + 1
+
+    def expected_completion_tokens(self, feature: str, default: int) -> int:
+        """Mean completion length of the feature's finished calls, or `default` before the first"""
+        totals = self.finished.get(feature)
+        if totals is None or not totals.calls:
+            return default
+        return totals.completion_tokens // totals.calls
+
+    def _entry(self, table: OrderedDict, key: str, factory):
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = factory()
+            if len(table) > self.MAX_TRACKED:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return entry
+
+    def check(self, feature: str, context: LLMCallContext):
+        """Raise BudgetExceededError if the session may not spend more tokens on `feature`"""
+        if not self.budgets or context.session_id is None or feature in self.EXEMPT_FEATURES:
+            return
+        session = self.sessions.get(context.session_id)
+        if not session:
+            return
+        reason = None
+        feature_budget = self.budgets.get(feature)
+        if feature_budget is not None and feature in session and session[feature].total_tokens >= feature_budget:
+            reason = f"its {feature_budget}-token budget for {feature}"
+        total_budget = self.budgets.get(ALL_FEATURES)
+        if reason is None and total_budget is not None and ALL_FEATURES in session:
+            used = session[ALL_FEATURES].total_tokens
+            limit = total_budget
+            if feature in settings.LLM_BUDGET_OPTIONAL_FEATURES:
+                limit = total_budget * settings.LLM_BUDGET_DEGRADE_AT
+            if used >= limit:
+                reason = f"{used} of its {total_budget}-token budget"
+        if reason is not None:
+            self.rejected[feature] = self.rejected.get(feature, 0) + 1
+            raise BudgetExceededError(
+                f"Session {context.session_id} has used {reason}; skipping {feature}",
+                feature=feature,
+                session_id=context.session_id
+            )
+
+    def session_usage(self, session_id: str) -> Dict[str, Any]:
+        """Token totals of one session, overall ("*") and per feature"""
+        return {name: totals.get_stats() for name, totals in self.sessions.get(session_id, {}).items()}
+
+    def user_usage(self, user_id: str) -> Optional[Dict[str, Any]]:
+        totals = self.users.get(user_id)
+        return totals.get_stats() if totals is not None else None
+
+    def _top(self, totals: Dict[str, _Totals], count: int) -> List[Dict[str, Any]]:
+        ranked = sorted(totals.items(), key=lambda item: item[1].total_tokens, reverse=True)[:count]
+        return [{"id": key, **value.get_stats()} for key, value in ranked]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-feature totals and latency percentiles; aggregates only, no user or session ids"""
+        features = {}
+        for feature, totals in sorted(self.features.items()):
+            stats = totals.get_stats()
+            for name, tracker in (("ttft", self.ttft), ("latency", self.latency)):
+                for pct in (50, 95):
+                    value = tracker.percentile(feature, pct)
+                    stats[f"{name}_p{pct}_seconds"] = round(value, 4) if value is not None else None
+            stats["rejected_over_budget"] = self.rejected.get(feature, 0)
+            stats["cancelled"] = self.cancelled.get(feature, 0)
+            stats["tokens_saved_by_cancelling"] = self.tokens_saved.get(feature, 0)
+            features[feature] = stats
+        return {
+            "features": features,
+            "budgets": self.budgets,
+            "cancellations": {
+                "calls": sum(self.cancelled.values()),
+                "tokens_saved": sum(self.tokens_saved.values()),
+                "by_reason": dict(self.cancel_reasons)
+            },
+            "tracked_users": len(self.users),
+            "tracked_sessions": len(self.sessions)
+        }
+
+    def top_consumers(self, count: int = 10) -> Dict[str, Any]:
+        """The heaviest users and sessions by id; for authenticated admin views only"""
+        sessions = {key: value[ALL_FEATURES] for key, value in self.sessions.items() if ALL_FEATURES in value}
+        return {
+            "top_users": self._top(self.users, count),
+            "top_sessions": self._top(sessions, count)
+        }
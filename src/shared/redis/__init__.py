@@ -0,0 +1,12 @@
+"""
+Redis connection service module.
+Provides the shared async Redis client used for cluster-wide coordination.
+"""
+
+from .service import RedisService, get_redis_service, close_redis_service
+
+__all__ = [
+    'RedisService',
+    'get_redis_service',
+    'close_redis_service'
+]
@@ -0,0 +1,64 @@
+"""Shared async Redis client for cluster-wide state (rate limits, caches)."""
+
+import logging
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class RedisService:
+    """Owns a single pooled async Redis client for the process."""
+    
+    def __init__(self, url: Optional[str] = None):
+        """Initialize the Redis service.
+        
+        Args:
+            url: Optional Redis URL. If not provided, uses REDIS_URL from settings.
+        """
+        self.url = url or settings.REDIS_URL
+        self.client = aioredis.from_url(
+            self.url,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30
+        )
+        logger.info("RedisService initialized")
+    
+    async def ping(self) -> bool:
+        """Return True if Redis answers, False otherwise"""
+        try:
+            return bool(await self.client.ping())
+        except Exception as e:
+            logger.warning(f"Redis ping failed: {e}")
+            return False
+    
+    async def close(self):
+        """Close the client and its connection pool"""
+        try:
+            # redis-py 5 renamed close() to aclose()
+            close = getattr(self.client, "aclose", None) or self.client.close
+            await close()
+            logger.info("RedisService closed")
+        except Exception as e:
+            logger.warning(f"Error closing Redis client: {e}")
+
+
+# Process-wide service shared by every component that needs Redis
+_redis_service: Optional[RedisService] = None
+
+def get_redis_service() -> RedisService:
+    """Return the process-wide Redis service, creating it on first use"""
+    global _redis_service
+    if _redis_service is None:
+        _redis_service = RedisService()
+    return _redis_service
+
+async def close_redis_service():
+    """Close the process-wide Redis service (called from the app shutdown handler)"""
+    global _redis_service
+    if _redis_service is not None:
+        await _redis_service.close()
+        _redis_service = None
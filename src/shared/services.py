@@ -4,7 +4,6 @@ from typing import List, Dict, Any, Optional, Type, TypeVar
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import logging
-import json
 from uuid import uuid4
 
 from src.core.db import Base
@@ -24,6 +23,9 @@ class BaseChatService:
     LLM interaction, and conversation formatting to be reused by feature-specific
     services.
     """
+    # Feature tag used to schedule this service's LLM calls
+    llm_feature = "default"
+
     def __init__(
         self,
         llm_client: LLMClient,
@@ -89,7 +91,7 @@ class BaseChatService:
     async def _generate_character_response(self, conversation: List[Dict[str, str]]) -> str:
         """Generate a response from the character LLM."""
         try:
-            response = await self.llm_client.generate_text(json.dumps(conversation))
+            response = await self.llm_client.generate_messages(conversation, feature=self.llm_feature)
             return response
         except Exception as e:
             logger.error(f"Error generating character response: {str(e)}")